@@ -0,0 +1,57 @@
+"""
+Measure pose inference throughput on CPU for different batch sizes.
+
+Run from the backend directory (requires the pose weights under models/):
+    python -m benchmarks.bench_batch_inference --video uploads/alice/20250101_120000/squat.mp4
+    python -m benchmarks.bench_batch_inference --batch-sizes 1 4 8 16 --imgsz 480
+Without --video, random 1280x720 frames are used.
+"""
+import argparse
+import time
+import cv2
+import numpy as np
+from src.model_registry import get_pose_model
+from src.pose_inference import FrameBatcher, infer_keypoints, DEFAULT_IMGSZ
+
+
+def load_frames(video_path, frame_count):
+    if video_path is None:
+        rng = np.random.default_rng(0)
+        return rng.integers(0, 255, (frame_count, 720, 1280, 3), dtype=np.uint8)
+
+    cap = cv2.VideoCapture(video_path)
+    frames = []
+    for batch in FrameBatcher(cap, batch_size=frame_count):
+        frames = batch.copy()
+        break
+    cap.release()
+    return frames
+
+
+def bench_batch_size(model, frames, batch_size, imgsz):
+    start = time.perf_counter()
+    for i in range(0, len(frames), batch_size):
+        infer_keypoints(model, frames[i:i + batch_size], imgsz)
+    return len(frames) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--video", help="Video to read frames from")
+    parser.add_argument("--frames", type=int, default=64, help="Number of frames to run per batch size")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--imgsz", type=int, default=DEFAULT_IMGSZ)
+    parser.add_argument("--model-size", default="n", help="Pose model size (n/s/m/l)")
+    args = parser.parse_args()
+
+    model = get_pose_model(args.model_size)
+    frames = load_frames(args.video, args.frames)
+
+    print(f"{len(frames)} frames of {frames.shape[2]}x{frames.shape[1]}, imgsz={args.imgsz}, model={args.model_size}")
+    for batch_size in args.batch_sizes:
+        fps = bench_batch_size(model, frames, batch_size, args.imgsz)
+        print(f"batch {batch_size:3d}: {fps:8.2f} frames/s")
+
+
+if __name__ == "__main__":
+    main()
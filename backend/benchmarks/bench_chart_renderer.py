@@ -0,0 +1,59 @@
+"""
+Compare chart rendering throughput of plot_dynamic_chart against ChartOverlay.
+
+Run from the backend directory:
+    python -m benchmarks.bench_chart_renderer --frames 120 --height 1080
+"""
+import argparse
+import time
+import cv2
+import numpy as np
+import matplotlib
+matplotlib.use("Agg")
+from src.chart_renderer import ChartOverlay, CHART_WIDTH
+from src.utils import plot_dynamic_chart
+
+
+def synthetic_series(frames, fps):
+    t = np.arange(frames) / fps
+    knee = 120 + 50 * np.cos(2 * np.pi * t / (frames / fps))
+    hip = 110 + 60 * np.cos(2 * np.pi * t / (frames / fps))
+    speed = np.gradient(-knee) * fps * 3
+    return t, speed, knee, hip
+
+
+def bench_matplotlib(frames, fps, height):
+    t, speed, knee, hip = synthetic_series(frames, fps)
+    video_length_seconds = frames / fps
+    start = time.perf_counter()
+    for i in range(frames):
+        image = plot_dynamic_chart(list(t[:i + 1]), list(speed[:i + 1]), list(knee[:i + 1]), list(hip[:i + 1]), video_length_seconds)
+        cv2.resize(image, (CHART_WIDTH, height))
+    return frames / (time.perf_counter() - start)
+
+
+def bench_overlay(frames, fps, height):
+    t, speed, knee, hip = synthetic_series(frames, fps)
+    start = time.perf_counter()
+    chart = ChartOverlay(frames / fps, height)
+    for i in range(frames):
+        chart.append(t[i], speed[i], knee[i], hip[i])
+    return frames / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--frames", type=int, default=120, help="Frames per segment")
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--height", type=int, default=1080, help="Height of the chart panel")
+    args = parser.parse_args()
+
+    baseline = bench_matplotlib(args.frames, args.fps, args.height)
+    overlay = bench_overlay(args.frames, args.fps, args.height)
+    print(f"plot_dynamic_chart: {baseline:10.1f} frames/s")
+    print(f"ChartOverlay:       {overlay:10.1f} frames/s")
+    print(f"speedup:            {overlay / baseline:10.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Time the vectorized kinematics module against the scalar helpers in src/utils.py.
+Their results are compared by tests/test_kinematics.py.
+
+Run from the backend directory:
+    python -m benchmarks.bench_kinematics --frames 3000 --persons 4
+"""
+import argparse
+import time
+import numpy as np
+from src.kinematics import select_largest_person, compute_kinematics
+from src import utils
+
+
+def synthetic_keypoints(frames, persons, seed=0):
+    rng = np.random.default_rng(seed)
+    keypoints = rng.uniform(0, 1080, (frames, persons, 17, 3)).astype(np.float32)
+    # Some frames without detections and some zero-padded persons, as produced by batched inference
+    keypoints[rng.random(frames) < 0.05] = 0
+    keypoints[:, persons - 1][rng.random(frames) < 0.5] = 0
+    return keypoints
+
+
+def scalar_metrics(keypoints, fps):
+    """Reference implementation built from the per-frame helpers"""
+    valid, knee_angles, hip_angles, speeds = [], [], [], []
+    previous_shoulder = None
+    for frame in keypoints:
+        person = utils.select_largest_person(frame)
+        valid.append(person is not None)
+        if person is None:
+            continue
+        side, shoulder, hip, knee, ankle = utils.select_joints(None, person)
+        knee_angles.append(utils.calculate_angle(hip, knee, ankle))
+        hip_angles.append(utils.calculate_angle(shoulder, hip, knee))
+        speeds.append(0.0 if previous_shoulder is None else float(previous_shoulder[1] - shoulder[1]) * fps)
+        previous_shoulder = shoulder
+    return np.array(valid), np.array(knee_angles), np.array(hip_angles), np.array(speeds)
+
+
+def vectorized_metrics(keypoints, fps):
+    persons, valid = select_largest_person(keypoints)
+    metrics = compute_kinematics(persons[valid], fps)
+    return valid, metrics["knee_angle"], metrics["hip_angle"], metrics["shoulder_velocity"]
+
+
+def timed(fn, *args, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--frames", type=int, default=3000)
+    parser.add_argument("--persons", type=int, default=3)
+    parser.add_argument("--fps", type=int, default=30)
+    args = parser.parse_args()
+
+    keypoints = synthetic_keypoints(args.frames, args.persons)
+    scalar_seconds = timed(scalar_metrics, keypoints, args.fps)
+    vectorized_seconds = timed(vectorized_metrics, keypoints, args.fps)
+    print(f"scalar helpers: {args.frames / scalar_seconds:12.0f} frames/s")
+    print(f"vectorized:     {args.frames / vectorized_seconds:12.0f} frames/s")
+    print(f"speedup:        {scalar_seconds / vectorized_seconds:12.1f}x")
+
+
+if __name__ == "__main__":
+    main()
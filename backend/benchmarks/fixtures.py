@@ -0,0 +1,188 @@
+"""
+Synthetic squat videos, keypoint sequences and a stubbed pose model for the benchmarks.
+
+Every frame of a synthetic video carries its own index as a row of black and white blocks in the
+top-left corner, so StubPoseModel can return the keypoints of exactly that frame without weights,
+also when the pipeline has letterboxed the frame to the inference size first (see src/preprocess.py).
+"""
+import time
+import types
+import cv2
+import numpy as np
+from src.pose_inference import NUM_KEYPOINTS, DEFAULT_IMGSZ
+from src.preprocess import letterbox_params
+
+# Frame index code: CODE_BITS blocks of CODE_BLOCK pixels, survives lossy encoding
+CODE_BITS = 16
+CODE_BLOCK = 16
+
+# Standing pose as fractions of the frame height, COCO keypoint order (x offset, y)
+STANDING_POSE = np.array([
+    (0.00, 0.18), (0.01, 0.17), (-0.01, 0.17), (0.02, 0.18), (-0.02, 0.18),  # face
+    (0.05, 0.28), (-0.05, 0.28),  # shoulders
+    (0.07, 0.40), (-0.07, 0.40),  # elbows
+    (0.07, 0.50), (-0.07, 0.50),  # wrists
+    (0.04, 0.52), (-0.04, 0.52),  # hips
+    (0.05, 0.70), (-0.05, 0.70),  # knees
+    (0.05, 0.88), (-0.05, 0.88),  # ankles
+], dtype=np.float32)
+
+UPPER_BODY = np.arange(0, 13)  # Face, arms, shoulders and hips drop with the squat
+KNEES = [13, 14]
+
+# Bones drawn into the synthetic frames
+SKELETON = [(5, 6), (5, 7), (7, 9), (6, 8), (8, 10), (5, 11), (6, 12), (11, 12), (11, 13), (13, 15), (12, 14), (14, 16)]
+
+
+def squat_depth(frames, fps, rep_seconds=2.0, rest_seconds=1.0):
+    """
+    Fraction of the full squat depth per frame: rest, a smooth descent and ascent, rest, and so on.
+    :return: Array of shape (frames,) with values in [0, 1]
+    """
+    t = np.arange(frames) / fps
+    phase = np.mod(t, rep_seconds + rest_seconds) - rest_seconds
+    return np.where(phase > 0, np.sin(np.pi * np.clip(phase / rep_seconds, 0, 1)) ** 2, 0.0)
+
+
+def squat_keypoints(frames, fps, width, height, bystanders=1, seed=0):
+    """
+    Keypoint sequence of a lifter squatting in the middle of the frame next to smaller standing bystanders.
+    :param frames: Number of frames
+    :param fps: Frame rate, sets the rep timing
+    :param width: Frame width in pixels
+    :param height: Frame height in pixels
+    :param bystanders: Number of additional, smaller people
+    :param seed: Seed of the keypoint jitter
+    :return: Keypoints of shape (frames, 1 + bystanders, 17, 3) as (x, y, confidence), as infer_keypoints
+    """
+    rng = np.random.default_rng(seed)
+    keypoints = np.zeros((frames, 1 + bystanders, NUM_KEYPOINTS, 3), dtype=np.float32)
+
+    lifter = keypoints[:, 0]
+    lifter[..., 0] = width / 2 + STANDING_POSE[:, 0] * height
+    lifter[..., 1] = STANDING_POSE[:, 1] * height
+    depth = squat_depth(frames, fps)[:, None]
+    lifter[:, UPPER_BODY, 1] += depth * 0.2 * height
+    lifter[:, KNEES, 0] += depth * 0.06 * height
+    lifter[..., :2] += rng.normal(0, 0.5, lifter[..., :2].shape)
+
+    for person in range(1, 1 + bystanders):
+        scale = 0.5
+        keypoints[:, person, :, 0] = width * (person / (bystanders + 1)) * 0.5 + STANDING_POSE[:, 0] * height * scale
+        keypoints[:, person, :, 1] = height * 0.4 + STANDING_POSE[:, 1] * height * scale
+
+    keypoints[..., 2] = 0.9
+    return keypoints
+
+
+def encode_frame_index(frame, index):
+    for bit in range(CODE_BITS):
+        value = 255 if (index >> bit) & 1 else 0
+        frame[:CODE_BLOCK, bit * CODE_BLOCK:(bit + 1) * CODE_BLOCK] = value
+
+
+def decode_frame_index(frame, scale=1.0, offset=(0, 0)):
+    """
+    :param scale: Size of the frame relative to the one the index was encoded in
+    :param offset: (left, top) padding added around the resized frame
+    """
+    # Only the centre of each block is read, away from compression and resize artefacts at the edges
+    block_size = CODE_BLOCK * scale
+    half = max(int(block_size / 4), 1)
+    left, top = offset
+    centre_y = int(top + block_size / 2)
+    index = 0
+    for bit in range(CODE_BITS):
+        centre_x = int(left + (bit + 0.5) * block_size)
+        block = frame[centre_y - half:centre_y + half, centre_x - half:centre_x + half]
+        if block.mean() > 128:
+            index |= 1 << bit
+    return index
+
+
+def write_synthetic_video(path, keypoints, fps, width, height, fourcc="mp4v"):
+    """
+    Render a keypoint sequence as stick figures over a textured background.
+    :param path: Output video file
+    :param keypoints: Output of squat_keypoints
+    :param fps: Frame rate
+    :param width: Frame width in pixels
+    :param height: Frame height in pixels
+    :param fourcc: Codec of the output video
+    :return: path
+    """
+    # A static gradient gives the encoder something to compress besides the moving figures
+    background = np.zeros((height, width, 3), dtype=np.uint8)
+    background[..., 0] = np.linspace(40, 200, width, dtype=np.uint8)[None, :]
+    background[..., 1] = np.linspace(60, 160, height, dtype=np.uint8)[:, None]
+    background[..., 2] = 90
+
+    out = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*fourcc), fps, (width, height))
+    for index, people in enumerate(keypoints):
+        frame = background.copy()
+        for person in people:
+            points = person[:, :2].astype(np.int32)
+            for a, b in SKELETON:
+                cv2.line(frame, tuple(points[a]), tuple(points[b]), (255, 255, 255), 6)
+            cv2.circle(frame, tuple(points[0]), max(height // 40, 4), (255, 255, 255), -1)
+        encode_frame_index(frame, index)
+        out.write(frame)
+    out.release()
+    return path
+
+
+class StubTensor(np.ndarray):
+    """ndarray with the few torch.Tensor methods infer_keypoints uses"""
+
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return np.asarray(self)
+
+    def new_zeros(self, shape):
+        return np.zeros(shape, dtype=self.dtype).view(StubTensor)
+
+
+class StubPoseModel:
+    """
+    Stands in for the YOLO pose model: returns the fixture keypoints of the frame index encoded in each frame.
+    Frames of another size than frame_size are taken to be letterboxed copies, and the keypoints are mapped
+    into them the way a real model would see the person.
+    """
+
+    def __init__(self, keypoints, latency_ms=0.0, frame_size=None):
+        """
+        :param keypoints: Output of squat_keypoints for the video the model is run on
+        :param latency_ms: Sleep per frame, to emulate the cost of a real model in pipeline timings
+        :param frame_size: (width, height) of the video
+        """
+        self.keypoints = keypoints
+        self.latency_ms = latency_ms
+        self.frame_size = frame_size
+
+    def _frame_keypoints(self, frame, imgsz):
+        height, width = frame.shape[:2]
+        if self.frame_size is None or (width, height) == tuple(self.frame_size):
+            return self.keypoints[min(decode_frame_index(frame), len(self.keypoints) - 1)]
+
+        source_width, source_height = self.frame_size
+        new_width, new_height, left, top, _, _ = letterbox_params(source_height, source_width, imgsz)
+        scale = (new_width / source_width, new_height / source_height)
+        index = min(decode_frame_index(frame, scale[0], (left, top)), len(self.keypoints) - 1)
+        keypoints = self.keypoints[index].copy()
+        present = keypoints[..., 2:] > 0
+        keypoints[..., 0] = keypoints[..., 0] * scale[0] + left
+        keypoints[..., 1] = keypoints[..., 1] * scale[1] + top
+        # Missing people stay all-zero rows, as infer_keypoints pads them
+        return np.where(present, keypoints, 0)
+
+    def __call__(self, source, imgsz=None, verbose=False, **kwargs):
+        frames = source if isinstance(source, list) else [source]
+        if self.latency_ms:
+            time.sleep(self.latency_ms * len(frames) / 1000)
+        results = []
+        for frame in frames:
+            data = self._frame_keypoints(frame, imgsz or DEFAULT_IMGSZ).view(StubTensor)
+            results.append(types.SimpleNamespace(keypoints=types.SimpleNamespace(data=data)))
+        return results
@@ -0,0 +1,148 @@
+"""
+Load test of the login and history endpoints, alone and while analysis jobs are running.
+
+Start the API first (uvicorn main:app --port 8000), then from the backend directory:
+    python -m benchmarks.load_test_api
+    python -m benchmarks.load_test_api --video uploads/alice/20250101_120000/squat.mp4 --jobs 2
+    python -m benchmarks.load_test_api --url http://staging:8000 --concurrency 64 --duration 30
+Test users are registered on first use. Each phase keeps --concurrency clients sending requests back to back,
+half POST /login and half POST /history, and reports throughput and latency percentiles per endpoint.
+With --video a second phase runs the same load while --jobs analyses are kept queued; every job analyzes a
+fresh copy of the video, so the analysis cache does not turn them into instant hits.
+"""
+import argparse
+import asyncio
+import os
+import struct
+import time
+import httpx
+import numpy as np
+
+USER_PREFIX = "loadtest"
+PASSWORD = "loadtest-password"
+
+
+async def register_users(client, count):
+    for i in range(count):
+        r = await client.post("/register", json={"username": f"{USER_PREFIX}{i}", "password": PASSWORD})
+        # 400 means the user exists from an earlier run
+        if r.status_code not in (200, 400):
+            r.raise_for_status()
+
+
+def unique_copy(video_bytes, index):
+    # An appended MP4 "free" box changes the content hash without changing the video
+    payload = f"{USER_PREFIX}-{os.getpid()}-{index}-{time.time_ns()}".encode()
+    return video_bytes + struct.pack(">I", 8 + len(payload)) + b"free" + payload
+
+
+async def keep_jobs_running(client, video_path, jobs, stop, finished):
+    """Keep `jobs` analyses queued or running until stop is set; appends the wall time of each finished job"""
+    with open(video_path, "rb") as f:
+        video_bytes = f.read()
+    filename = os.path.basename(video_path)
+    counter = 0
+
+    async def one_job_slot():
+        nonlocal counter
+        while not stop.is_set():
+            counter += 1
+            upload = await client.post("/upload", data={"username": f"{USER_PREFIX}0"},
+                                       files={"file": (filename, unique_copy(video_bytes, counter), "video/mp4")})
+            upload.raise_for_status()
+            start = time.perf_counter()
+            r = await client.post("/jobs", data={"username": f"{USER_PREFIX}0", "filename": filename,
+                                                 "timestamp": upload.json()["timestamp"]})
+            if r.status_code == 429:
+                await asyncio.sleep(1)
+                continue
+            r.raise_for_status()
+            job_id = r.json()["job_id"]
+            while True:
+                await asyncio.sleep(0.5)
+                status = (await client.get(f"/jobs/{job_id}")).json()["status"]
+                if status not in ("queued", "running"):
+                    finished.append((status, time.perf_counter() - start))
+                    break
+
+    await asyncio.gather(*(one_job_slot() for _ in range(jobs)))
+
+
+async def client_loop(client, index, users, deadline, latencies, errors):
+    username = f"{USER_PREFIX}{index % users}"
+    endpoint = "login" if index % 2 == 0 else "history"
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            if endpoint == "login":
+                r = await client.post("/login", json={"username": username, "password": PASSWORD})
+            else:
+                r = await client.post("/history", data={"username": username})
+            ok = r.status_code == 200
+        except httpx.HTTPError:
+            ok = False
+        if ok:
+            latencies[endpoint].append(time.perf_counter() - start)
+        else:
+            errors[endpoint] += 1
+
+
+async def run_phase(args, with_jobs):
+    limits = httpx.Limits(max_connections=args.concurrency + args.jobs + 1)
+    async with httpx.AsyncClient(base_url=args.url, timeout=120, limits=limits) as client:
+        await register_users(client, args.users)
+
+        stop = asyncio.Event()
+        finished = []
+        job_task = None
+        if with_jobs:
+            job_task = asyncio.create_task(keep_jobs_running(client, args.video, args.jobs, stop, finished))
+            # Let the workers pick up the first jobs before measuring
+            await asyncio.sleep(args.warmup)
+
+        latencies = {"login": [], "history": []}
+        errors = {"login": 0, "history": 0}
+        deadline = time.perf_counter() + args.duration
+        await asyncio.gather(*(client_loop(client, i, args.users, deadline, latencies, errors) for i in range(args.concurrency)))
+
+        if job_task is not None:
+            stop.set()
+            # Jobs in progress finish on their own; the test does not wait for them
+            job_task.cancel()
+            await asyncio.gather(job_task, return_exceptions=True)
+    return latencies, errors, finished
+
+
+def print_phase(name, latencies, errors, duration, finished=None):
+    print(f"\n{name}")
+    print(f"{'endpoint':10} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for endpoint, values in latencies.items():
+        if values:
+            p50, p95, p99 = np.percentile(np.array(values) * 1000, (50, 95, 99))
+        else:
+            p50 = p95 = p99 = float("nan")
+        print(f"{endpoint:10} {len(values) / duration:8.1f} {p50:8.1f} {p95:8.1f} {p99:8.1f} {errors[endpoint]:7d}")
+    if finished is not None:
+        print(f"analysis jobs finished during the phase: {len(finished)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=32, help="Clients sending login/history requests")
+    parser.add_argument("--duration", type=float, default=20, help="Seconds per phase")
+    parser.add_argument("--video", help="Video analyzed by the background jobs of the second phase")
+    parser.add_argument("--jobs", type=int, default=2, help="Analysis jobs kept queued during the second phase")
+    parser.add_argument("--warmup", type=float, default=3, help="Seconds between starting the jobs and measuring")
+    args = parser.parse_args()
+
+    latencies, errors, _ = asyncio.run(run_phase(args, with_jobs=False))
+    print_phase("idle server", latencies, errors, args.duration)
+    if args.video:
+        latencies, errors, finished = asyncio.run(run_phase(args, with_jobs=True))
+        print_phase(f"with {args.jobs} analysis jobs", latencies, errors, args.duration, finished)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Compare squat boundaries detected with adaptive frame sampling against the full-rate baseline.
+
+Run from the backend directory (requires the pose weights under models/):
+    python -m benchmarks.report_adaptive_sampling --videos uploads/alice/*/squat.mp4 --sample-every 2 4 8
+For every video and sampling rate the report lists the detected reps, the largest start/end
+boundary shift in frames, the mean keypoint error of the interpolated frames, the fraction of
+frames that went through inference and the speedup of the detection pass.
+"""
+import argparse
+import glob
+import json
+import time
+import cv2
+import numpy as np
+from src.model_registry import get_pose_model
+from src.pose_inference import FrameBatcher, DEFAULT_BATCH_SIZE, DEFAULT_IMGSZ
+from src.sampling import AdaptiveSampler
+from src.segmentation import SquatSegmenter
+from src.kinematics import select_sides, side_joints
+
+
+def detect(video_path, model, sample_every, batch_size, imgsz):
+    """Detection pass only: segments and selected keypoints, without writing any video"""
+    cap = cv2.VideoCapture(video_path)
+    segmenter = SquatSegmenter(verbose=False)
+    sampler = AdaptiveSampler(sample_every, threshold_down=segmenter.threshold_down, settle_frames=2 * segmenter.extra_frames)
+    persons_batches, valid_batches = [], []
+
+    start = time.perf_counter()
+    first_index = 0
+    for frames in FrameBatcher(cap, batch_size):
+        persons, valid = sampler.infer(model, frames, first_index, imgsz)
+        shoulders = side_joints(persons, select_sides(persons))[:, 0]
+        for offset in np.flatnonzero(valid):
+            segmenter.update(first_index + int(offset), shoulders[offset])
+        persons_batches.append(persons)
+        valid_batches.append(valid)
+        first_index += len(frames)
+    segments = segmenter.finish(first_index)
+    seconds = time.perf_counter() - start
+    cap.release()
+
+    persons = np.concatenate(persons_batches) if persons_batches else np.zeros((0, 17, 3), dtype=np.float32)
+    valid = np.concatenate(valid_batches) if valid_batches else np.zeros(0, dtype=bool)
+    return {"segments": segments, "persons": persons, "valid": valid, "seconds": seconds, **sampler.stats()}
+
+
+def compare(baseline, candidate):
+    """Boundary shifts of the reps matched in order and keypoint error on frames detected by both"""
+    pairs = list(zip(baseline["segments"], candidate["segments"]))
+    both = baseline["valid"] & candidate["valid"]
+    keypoint_error = np.abs(baseline["persons"][both, :, :2] - candidate["persons"][both, :, :2]).mean() if both.any() else 0.0
+    return {
+        "reps": len(candidate["segments"]),
+        "baseline_reps": len(baseline["segments"]),
+        "max_start_shift": max((abs(b["start_frame"] - c["start_frame"]) for b, c in pairs), default=0),
+        "max_end_shift": max((abs(b["end_frame"] - c["end_frame"]) for b, c in pairs), default=0),
+        "keypoint_error_px": float(keypoint_error),
+        "inferred_fraction": candidate["inferred_frames"] / max(candidate["total_frames"], 1),
+        "speedup": baseline["seconds"] / candidate["seconds"] if candidate["seconds"] else float("inf"),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--videos", nargs="+", help="Videos to analyze (default: every upload under uploads/)")
+    parser.add_argument("--sample-every", type=int, nargs="+", default=[2, 4, 8])
+    parser.add_argument("--model-size", default="n", help="Pose model size (n/s/m/l)")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--imgsz", type=int, default=DEFAULT_IMGSZ)
+    parser.add_argument("--json", help="Also write the report to this file")
+    args = parser.parse_args()
+
+    videos = args.videos or sorted(glob.glob("uploads/*/*/*.mp4"))
+    model = get_pose_model(args.model_size)
+
+    report = []
+    print(f"{'video':40s} {'K':>3s} {'reps':>9s} {'start':>6s} {'end':>6s} {'kp err':>7s} {'inferred':>9s} {'speedup':>8s}")
+    for video in videos:
+        baseline = detect(video, model, 1, args.batch_size, args.imgsz)
+        for sample_every in args.sample_every:
+            row = {"video": video, "sample_every": sample_every,
+                   **compare(baseline, detect(video, model, sample_every, args.batch_size, args.imgsz))}
+            report.append(row)
+            print(f"{video[-40:]:40s} {sample_every:3d} {row['reps']:4d}/{row['baseline_reps']:<4d} "
+                  f"{row['max_start_shift']:6d} {row['max_end_shift']:6d} {row['keypoint_error_px']:7.2f} "
+                  f"{row['inferred_fraction']:9.1%} {row['speedup']:7.2f}x")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
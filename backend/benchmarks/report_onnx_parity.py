@@ -0,0 +1,100 @@
+"""
+Compare the ONNX Runtime backend (fp32 and quantized) with the PyTorch pose model.
+
+Run from the backend directory (requires the pose weights under models/, plus ultralytics, onnx and onnxruntime):
+    python -m benchmarks.report_onnx_parity --videos uploads/alice/*/squat.mp4 --model-size l
+    python -m benchmarks.report_onnx_parity --quantizations none int8 --threads 4 --json onnx_parity.json
+Exported models are cached next to the weights, so only the first run pays for the export. For every video
+and exported model the report lists the detected reps against the PyTorch run, the largest start/end
+boundary shift in frames, the mean keypoint error and the share of keypoints within 2 px on frames where
+both found the lifter, the frames where only one of them did, the inference time per frame on one batch,
+and the speedup of the whole detection pass.
+"""
+import argparse
+import glob
+import json
+import os
+import time
+import cv2
+import numpy as np
+from src.model_registry import get_pose_model, resolve_model_path
+from src.onnx_backend import OnnxPoseModel, export_onnx, exported_model_path, QUANTIZATIONS, ONNX_THREADS
+from src.pose_inference import FrameBatcher, infer_keypoints, DEFAULT_BATCH_SIZE, DEFAULT_IMGSZ
+from benchmarks.report_adaptive_sampling import detect, compare
+
+# Keypoints closer than this to the PyTorch result count as matching
+MATCH_PX = 2.0
+INFER_REPEATS = 5
+
+
+def infer_ms_per_frame(video_path, model, batch_size, imgsz):
+    """Median inference time per frame over repeated calls on the first batch of the video"""
+    cap = cv2.VideoCapture(video_path)
+    frames = next(iter(FrameBatcher(cap, batch_size))).copy()
+    cap.release()
+    timings = []
+    for _ in range(INFER_REPEATS):
+        start = time.perf_counter()
+        infer_keypoints(model, frames, imgsz)
+        timings.append(time.perf_counter() - start)
+    return 1000 * float(np.median(timings)) / len(frames)
+
+
+def keypoint_agreement(baseline, candidate):
+    both = baseline["valid"] & candidate["valid"]
+    if not both.any():
+        return 0.0
+    distance = np.linalg.norm(baseline["persons"][both, :, :2] - candidate["persons"][both, :, :2], axis=-1)
+    return float((distance <= MATCH_PX).mean())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--videos", nargs="+", help="Videos to analyze (default: every upload under uploads/)")
+    parser.add_argument("--model-size", default="n", help="Pose model size (n/s/m/l)")
+    parser.add_argument("--quantizations", nargs="+", default=list(QUANTIZATIONS), choices=QUANTIZATIONS)
+    parser.add_argument("--threads", type=int, default=ONNX_THREADS, help="ONNX Runtime threads, 0 for all cores")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--imgsz", type=int, default=DEFAULT_IMGSZ)
+    parser.add_argument("--json", help="Also write the report to this file")
+    args = parser.parse_args()
+
+    videos = args.videos or sorted(glob.glob("uploads/*/*/*.mp4"))
+    weights_path = resolve_model_path(args.model_size)
+    torch_model = get_pose_model(args.model_size, backend="torch")
+    onnx_models = {q: OnnxPoseModel(export_onnx(weights_path, q, args.imgsz), threads=args.threads) for q in args.quantizations}
+
+    report = []
+    print(f"{'video':40s} {'model':28s} {'MB':>6s} {'reps':>9s} {'start':>6s} {'end':>6s} {'kp err':>7s} "
+          f"{'<2px':>6s} {'valid≠':>7s} {'ms/frame':>9s} {'speedup':>8s}")
+    for video in videos:
+        baseline = detect(video, torch_model, 1, args.batch_size, args.imgsz)
+        rows = [("torch", weights_path, torch_model, baseline)]
+        rows += [(q, exported_model_path(weights_path, q), model, detect(video, model, 1, args.batch_size, args.imgsz))
+                 for q, model in onnx_models.items()]
+        for backend, path, model, run in rows:
+            row = {
+                "video": video,
+                "model": os.path.basename(path),
+                "backend": "torch" if backend == "torch" else "onnx",
+                "quantization": None if backend == "torch" else backend,
+                "size_mb": os.path.getsize(path) / 2 ** 20,
+                **compare(baseline, run),
+                "keypoints_within_2px": keypoint_agreement(baseline, run),
+                "valid_mismatch": int((baseline["valid"] != run["valid"]).sum()),
+                "infer_ms_per_frame": infer_ms_per_frame(video, model, args.batch_size, args.imgsz),
+            }
+            row.pop("inferred_fraction")
+            report.append(row)
+            print(f"{video[-40:]:40s} {row['model'][-28:]:28s} {row['size_mb']:6.1f} {row['reps']:4d}/{row['baseline_reps']:<4d} "
+                  f"{row['max_start_shift']:6d} {row['max_end_shift']:6d} {row['keypoint_error_px']:7.2f} "
+                  f"{row['keypoints_within_2px']:6.1%} {row['valid_mismatch']:7d} {row['infer_ms_per_frame']:9.1f} "
+                  f"{row['speedup']:7.2f}x")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,339 @@
+"""
+Benchmark suite for the squat analysis hot paths on synthetic fixtures.
+
+Run from the backend directory; no pose weights or uploads are needed:
+    python -m benchmarks.run_suite
+    python -m benchmarks.run_suite --frames 600 --width 1920 --height 1080 --stages decode infer pipeline
+    python -m benchmarks.run_suite --save-baseline
+A synthetic squat video and its keypoints are generated once, and pose inference is served by a
+stub model that returns the keypoints of each frame (pass --model-size to time real weights instead).
+Each stage runs in a fresh process so its peak RSS is measured on its own:
+    decode    FrameBatcher over the video
+    infer     infer_keypoints + select_largest_person
+    segment   side selection and the SquatSegmenter state machine
+    kinematics compute_kinematics and segment_metrics of every rep
+    chart     annotated_frames (chart panel next to each frame)
+    encode    VideoWriter on the annotated frames
+    pipeline  analyze_video end to end
+Every run is written to benchmarks/results/latest.json and compared with the baseline
+(benchmarks/results/baseline.json by default); the exit code is 1 when a stage got slower or
+used more memory than the tolerance allows.
+"""
+import argparse
+import concurrent.futures
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import cv2
+import numpy as np
+from src.pose_inference import FrameBatcher, infer_keypoints, DEFAULT_BATCH_SIZE, DEFAULT_IMGSZ
+from src.segmentation import SquatSegmenter
+from src.kinematics import select_largest_person, select_sides, side_joints, compute_kinematics, segment_metrics
+from src.chart_renderer import CHART_WIDTH
+from benchmarks.fixtures import squat_keypoints, write_synthetic_video, StubPoseModel
+
+STAGES = ("decode", "infer", "segment", "kinematics", "chart", "encode", "pipeline")
+
+RESULTS_DIR = os.path.join("benchmarks", "results")
+STUB_MODEL_PATH = "stub-pose.pt"
+
+# Fast stages are repeated until they have run this long, so timer noise does not look like a regression
+MIN_SECONDS = 0.5
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def fixture_keypoints(params):
+    return squat_keypoints(params["frames"], params["fps"], params["width"], params["height"], params["bystanders"])
+
+
+def pose_model(params):
+    if params["model_size"]:
+        from src.model_registry import get_pose_model
+        return get_pose_model(params["model_size"])
+    return StubPoseModel(fixture_keypoints(params), params["stub_latency_ms"], (params["width"], params["height"]))
+
+
+def lifter_track(params):
+    """Selected keypoints of every frame and the detected segments, as the segment stage produces them"""
+    persons, valid = select_largest_person(fixture_keypoints(params))
+    shoulders = side_joints(persons, select_sides(persons))[:, 0]
+    segmenter = SquatSegmenter(verbose=False)
+    for index in np.flatnonzero(valid):
+        segmenter.update(int(index), shoulders[index])
+    return persons, valid, segmenter.finish(len(valid))
+
+
+def bench_decode(params):
+    cap = cv2.VideoCapture(params["video"])
+    frames = 0
+    start = time.perf_counter()
+    for batch in FrameBatcher(cap, params["batch_size"]):
+        frames += len(batch)
+    seconds = time.perf_counter() - start
+    cap.release()
+    return frames, seconds, {}
+
+
+def bench_infer(params):
+    model = pose_model(params)
+    cap = cv2.VideoCapture(params["video"])
+    frames, seconds = 0, 0.0
+    for batch in FrameBatcher(cap, params["batch_size"]):
+        start = time.perf_counter()
+        select_largest_person(infer_keypoints(model, batch, params["imgsz"]))
+        seconds += time.perf_counter() - start
+        frames += len(batch)
+    cap.release()
+    return frames, seconds, {"model": params["model_size"] or "stub"}
+
+
+def bench_segment(params):
+    keypoints = fixture_keypoints(params)
+    start = time.perf_counter()
+    persons, valid = select_largest_person(keypoints)
+    shoulders = side_joints(persons, select_sides(persons))[:, 0]
+    segmenter = SquatSegmenter(verbose=False)
+    for index in np.flatnonzero(valid):
+        segmenter.update(int(index), shoulders[index])
+    segments = segmenter.finish(len(valid))
+    return len(valid), time.perf_counter() - start, {"segments": len(segments)}
+
+
+def bench_kinematics(params):
+    persons, valid, segments = lifter_track(params)
+    frames = 0
+    start = time.perf_counter()
+    for segment in segments:
+        segment_range = slice(segment["start_frame"], segment["end_frame"])
+        metrics = compute_kinematics(persons[segment_range][valid[segment_range]], params["fps"], side="first")
+        segment_metrics(metrics, params["fps"])
+        frames += len(metrics["knee_angle"])
+    return frames, time.perf_counter() - start, {"segments": len(segments)}
+
+
+def annotated_segment_frames(params, persons, valid, segment):
+    from src.process_and_analyze_video import annotated_frames
+    segment_range = slice(segment["start_frame"], segment["end_frame"])
+    metrics = compute_kinematics(persons[segment_range][valid[segment_range]], params["fps"], side="first")
+    # Decoding is timed on its own; every rep is annotated over the same frame
+    frame = np.full((params["height"], params["width"], 3), 128, dtype=np.uint8)
+    return annotated_frames((frame for _ in metrics["knee_angle"]), metrics, params["fps"],
+                            (params["width"], params["height"]))
+
+
+def bench_chart(params):
+    persons, valid, segments = lifter_track(params)
+    frames = 0
+    start = time.perf_counter()
+    for segment in segments:
+        for _ in annotated_segment_frames(params, persons, valid, segment):
+            frames += 1
+    return frames, time.perf_counter() - start, {}
+
+
+def open_writer(path, fourcc, fps, size):
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*fourcc), fps, size)
+    if writer.isOpened() or fourcc == "mp4v":
+        return writer, fourcc
+    # Builds of OpenCV without an H264 encoder still give a comparable mpeg4 timing
+    writer.release()
+    return cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, size), "mp4v"
+
+
+def bench_encode(params):
+    persons, valid, segments = lifter_track(params)
+    size = (params["width"] + CHART_WIDTH, params["height"])
+    frames, seconds, fourcc = 0, 0.0, params["fourcc"]
+    for segment in segments:
+        path = os.path.join(params["work_dir"], f"encode_{segment['index']}.mp4")
+        start = time.perf_counter()
+        writer, fourcc = open_writer(path, params["fourcc"], params["fps"], size)
+        seconds += time.perf_counter() - start
+        # Frames are annotated as the renderer produces them; only the writer calls are timed
+        for frame in annotated_segment_frames(params, persons, valid, segment):
+            start = time.perf_counter()
+            writer.write(frame)
+            seconds += time.perf_counter() - start
+            frames += 1
+        start = time.perf_counter()
+        writer.release()
+        seconds += time.perf_counter() - start
+    return frames, seconds, {"fourcc": fourcc}
+
+
+def bench_pipeline(params):
+    from src.model_registry import register_pose_model
+    from src.process_and_analyze_video import analyze_video
+
+    model_path = None
+    if not params["model_size"]:
+        model_path = STUB_MODEL_PATH
+        register_pose_model(model_path, pose_model(params))
+    output_dir = os.path.join(params["work_dir"], "pipeline")
+    start = time.perf_counter()
+    result = analyze_video(params["video"], output_dir, yolo_model_path=model_path, model_size=params["model_size"],
+                           batch_size=params["batch_size"], imgsz=params["imgsz"], raw_clips=False, store_keypoints=False)
+    seconds = time.perf_counter() - start
+    if not result["segments"]:
+        # A run without reps skips rendering and encoding, and its throughput would mean nothing
+        raise RuntimeError("The pipeline found no reps in the fixture video")
+    busy = {stats["stage"]: round(stats["busy_seconds"], 4) for stats in result["stage_stats"]}
+    return result["frame_count"], seconds, {"segments": len(result["segments"]), "busy_seconds": busy}
+
+
+BENCHMARKS = {
+    "decode": bench_decode,
+    "infer": bench_infer,
+    "segment": bench_segment,
+    "kinematics": bench_kinematics,
+    "chart": bench_chart,
+    "encode": bench_encode,
+    "pipeline": bench_pipeline,
+}
+
+
+def run_stage(stage, params):
+    """
+    Run one benchmark in this process, keeping the fastest of at least params["repeat"] runs.
+    :return: Dict with frames, seconds, frames_per_second, peak_rss_mb and stage specific details
+    """
+    best, runs, total_seconds = None, 0, 0.0
+    while runs < params["repeat"] or total_seconds < MIN_SECONDS:
+        frames, seconds, details = BENCHMARKS[stage](params)
+        if best is None or seconds < best[1]:
+            best = (frames, seconds, details)
+        runs += 1
+        total_seconds += seconds
+        if stage == "pipeline":
+            # An end to end run is long enough on its own
+            break
+    frames, seconds, details = best
+    return {
+        "runs": runs,
+        "frames": frames,
+        "seconds": round(seconds, 4),
+        "frames_per_second": round(frames / seconds, 1) if seconds else None,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        **details,
+    }
+
+
+def run_isolated(stage, params):
+    # A fresh interpreter per stage, so the peak RSS of one stage does not hide another's
+    context = multiprocessing.get_context("spawn")
+    with concurrent.futures.ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+        return executor.submit(run_stage, stage, params).result()
+
+
+def compare(current, baseline, tolerance):
+    """
+    Stages that are slower or use more memory than the baseline by more than the tolerance.
+    :return: List of (stage, metric, baseline value, current value)
+    """
+    regressions = []
+    for stage, result in current["stages"].items():
+        previous = baseline["stages"].get(stage)
+        if previous is None:
+            continue
+        if previous["frames_per_second"] and result["frames_per_second"] is not None \
+                and result["frames_per_second"] < previous["frames_per_second"] * (1 - tolerance):
+            regressions.append((stage, "frames_per_second", previous["frames_per_second"], result["frames_per_second"]))
+        if result["peak_rss_mb"] > previous["peak_rss_mb"] * (1 + tolerance):
+            regressions.append((stage, "peak_rss_mb", previous["peak_rss_mb"], result["peak_rss_mb"]))
+    return regressions
+
+
+def print_report(report, baseline):
+    print(f"{'stage':12s} {'frames':>7s} {'seconds':>9s} {'frames/s':>10s} {'baseline':>10s} {'peak RSS':>10s}")
+    for stage, result in report["stages"].items():
+        previous = (baseline or {}).get("stages", {}).get(stage, {}).get("frames_per_second")
+        fps = f"{result['frames_per_second']:10.1f}" if result["frames_per_second"] else f"{'-':>10s}"
+        previous = f"{previous:10.1f}" if previous else f"{'-':>10s}"
+        print(f"{stage:12s} {result['frames']:7d} {result['seconds']:9.3f} {fps} {previous} {result['peak_rss_mb']:8.1f}MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES))
+    parser.add_argument("--frames", type=int, default=300, help="Length of the synthetic video")
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--bystanders", type=int, default=1, help="People next to the lifter")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--imgsz", type=int, default=DEFAULT_IMGSZ)
+    parser.add_argument("--fourcc", default="H264", help="Codec of the encode stage")
+    parser.add_argument("--model-size", help="Time real pose weights (n/s/m/l) instead of the stub model")
+    parser.add_argument("--stub-latency-ms", type=float, default=0.0, help="Per-frame delay of the stub model")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per stage, the fastest is kept")
+    parser.add_argument("--baseline", default=os.path.join(RESULTS_DIR, "baseline.json"))
+    parser.add_argument("--save-baseline", action="store_true", help="Make this run the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative slowdown or RSS growth")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="squat_bench_")
+    params = {
+        "frames": args.frames, "width": args.width, "height": args.height, "fps": args.fps,
+        "bystanders": args.bystanders, "batch_size": args.batch_size, "imgsz": args.imgsz,
+        "fourcc": args.fourcc, "model_size": args.model_size, "stub_latency_ms": args.stub_latency_ms,
+        "repeat": max(args.repeat, 1), "work_dir": work_dir, "video": os.path.join(work_dir, "squat.mp4"),
+    }
+    try:
+        write_synthetic_video(params["video"], fixture_keypoints(params), args.fps, args.width, args.height)
+        stages = {}
+        for stage in args.stages:
+            stages[stage] = run_isolated(stage, params)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    fixture = {key: params[key] for key in ("frames", "width", "height", "fps", "bystanders", "batch_size", "imgsz", "model_size", "stub_latency_ms")}
+    report = {
+        "created_at": time.time(),
+        "host": platform.node(),
+        "python": platform.python_version(),
+        "opencv": cv2.__version__,
+        "fixture": fixture,
+        "stages": stages,
+    }
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    with open(os.path.join(RESULTS_DIR, "latest.json"), "w") as f:
+        json.dump(report, f, indent=2)
+
+    regressions = []
+    if baseline is not None:
+        if baseline["fixture"] != fixture:
+            print(f"Baseline {args.baseline} was recorded with different fixture settings; not comparing")
+        else:
+            regressions = compare(report, baseline, args.tolerance)
+            for stage, metric, previous, current in regressions:
+                print(f"Regression in {stage}: {metric} {previous} -> {current}")
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline) or ".", exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
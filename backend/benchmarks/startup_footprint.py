@@ -0,0 +1,142 @@
+"""
+Startup time and memory of the API process, with and without the analysis stack loaded.
+
+Run from the backend directory:
+    python -m benchmarks.startup_footprint
+    python -m benchmarks.startup_footprint --repeats 10 --no-server
+Each scenario imports the app in a fresh interpreter and reports the median import time, the peak RSS and
+which heavy modules ended up loaded:
+    api             import main, as a uvicorn worker does
+    api+analysis    also the analysis modules main.py used to import at load time (cv2, NumPy, charts)
+    api+model       also ultralytics/torch, when installed
+The server check starts uvicorn and reports the time until POST /login answers and the RSS of the API
+process at that point (job workers are separate processes and not included).
+Everything runs in a temporary directory, so no uploads or databases of the checkout are touched.
+"""
+import argparse
+import importlib.util
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ("cv2", "numpy", "matplotlib", "PIL", "ultralytics", "torch", "onnxruntime")
+
+SCENARIOS = {
+    "api": ["main"],
+    "api+analysis": ["main", "src.split_video_by_squat", "src.process_and_analyze_video"],
+    "api+model": ["main", "src.split_video_by_squat", "src.process_and_analyze_video", "ultralytics"],
+}
+
+CHILD = """
+import json, resource, sys, time
+start = time.perf_counter()
+for name in {modules!r}:
+    __import__(name)
+seconds = time.perf_counter() - start
+peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({{
+    "seconds": seconds,
+    "peak_rss_mb": peak / 2 ** 20 if sys.platform == "darwin" else peak / 1024,
+    "heavy_modules": [m for m in {heavy!r} if m in sys.modules],
+}}))
+"""
+
+
+def child_env():
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [BACKEND_DIR, os.environ.get("PYTHONPATH")])))
+    # The app then creates its SQLite database in the temporary working directory
+    env.pop("DATABASE_URL", None)
+    return env
+
+
+def measure_imports(modules, repeats, workdir):
+    runs = []
+    for _ in range(repeats):
+        output = subprocess.run([sys.executable, "-c", CHILD.format(modules=modules, heavy=HEAVY_MODULES)],
+                                cwd=workdir, env=child_env(), capture_output=True, text=True, check=True).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+    return {
+        "seconds": statistics.median(r["seconds"] for r in runs),
+        "peak_rss_mb": statistics.median(r["peak_rss_mb"] for r in runs),
+        "heavy_modules": runs[-1]["heavy_modules"],
+    }
+
+
+def rss_mb(pid):
+    # Linux only; None elsewhere
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def measure_server(workdir, timeout=60):
+    """Seconds from starting uvicorn until POST /login answers, and the RSS of the server then"""
+    port = free_port()
+    start = time.perf_counter()
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+                              cwd=workdir, env=child_env(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    request = urllib.request.Request(f"http://127.0.0.1:{port}/login", data=json.dumps({"username": "startup", "password": "x"}).encode(),
+                                     headers={"Content-Type": "application/json"})
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                urllib.request.urlopen(request, timeout=1)
+            except urllib.error.HTTPError:
+                pass  # 400 for the unknown user is an answer
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.01)
+                continue
+            return {"seconds": time.perf_counter() - start, "rss_mb": rss_mb(server.pid)}
+        raise TimeoutError(f"uvicorn did not answer within {timeout}s")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--no-server", action="store_true", help="Skip the uvicorn time-to-first-response check")
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        print(f"{'scenario':14s} {'import s':>9s} {'peak MB':>8s}  heavy modules")
+        for name, modules in SCENARIOS.items():
+            if "ultralytics" in modules and importlib.util.find_spec("ultralytics") is None:
+                print(f"{name:14s} skipped, ultralytics is not installed")
+                continue
+            result = results[name] = measure_imports(modules, args.repeats, workdir)
+            print(f"{name:14s} {result['seconds']:9.3f} {result['peak_rss_mb']:8.1f}  {', '.join(result['heavy_modules']) or '-'}")
+
+        if not args.no_server:
+            server = results["server"] = measure_server(workdir)
+            rss = f"{server['rss_mb']:.1f} MB" if server["rss_mb"] is not None else "unknown"
+            print(f"uvicorn answered POST /login after {server['seconds']:.2f}s, API process RSS {rss}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,79 @@
-from sqlalchemy import Column, Integer, String, create_engine
+import os
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Index, UniqueConstraint, create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import sessionmaker, relationship
+from datetime import datetime
 
-# 数据库 URL
-DATABASE_URL = "sqlite:///./users.db"
+# 数据库 URL；设置 DATABASE_URL 使用 Postgres，例如 postgresql://user:password@db:5432/titan
+# （需要安装 asyncpg 和 psycopg2-binary）
+DATABASE_URL = os.environ.get("DATABASE_URL", "sqlite:///./users.db")
 
-# 创建数据库引擎
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+# 连接池大小：常驻连接、高峰时额外连接、等待空闲连接的秒数
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = int(os.environ.get("DB_POOL_TIMEOUT", "30"))
+
+# SQLite 连接参数：WAL 让读不阻塞写，busy_timeout 让并发写等待锁而不是立刻报 "database is locked"
+SQLITE_PRAGMAS = (
+    "journal_mode=WAL",
+    "synchronous=NORMAL",  # WAL 模式下 NORMAL 断电最多丢最后几个事务，不会损坏数据库
+    "busy_timeout=5000",
+    "foreign_keys=ON",
+    "cache_size=-16000",  # 每个连接 16 MB 页缓存
+    "temp_store=MEMORY",
+)
+
+# 异步驱动：API 进程通过它访问数据库，不阻塞事件循环
+ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg"}
+
+
+def async_database_url(url):
+    """
+    The URL of the async driver for a database URL, e.g. sqlite:///./users.db -> sqlite+aiosqlite:///./users.db
+    """
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"Unsupported database {backend}, use sqlite or postgresql")
+    return url.set(drivername=ASYNC_DRIVERS[backend])
+
+
+def _engine_options(url):
+    if make_url(url).get_backend_name() == "sqlite":
+        # 文件数据库的连接可以跨线程使用；连接池仍由 SQLAlchemy 管理
+        return {"connect_args": {"check_same_thread": False}, "pool_size": DB_POOL_SIZE, "max_overflow": DB_MAX_OVERFLOW,
+                "pool_timeout": DB_POOL_TIMEOUT}
+    # Postgres 连接可能被服务器或代理断开，取出连接前先检查
+    return {"pool_size": DB_POOL_SIZE, "max_overflow": DB_MAX_OVERFLOW, "pool_timeout": DB_POOL_TIMEOUT,
+            "pool_pre_ping": True, "pool_recycle": 1800}
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for pragma in SQLITE_PRAGMAS:
+        cursor.execute(f"PRAGMA {pragma}")
+    cursor.close()
+
+
+# 同步引擎：分析进程和命令行工具使用
+engine = create_engine(DATABASE_URL, **_engine_options(DATABASE_URL))
+
+# 异步引擎：API 请求使用
+async_engine = create_async_engine(async_database_url(DATABASE_URL), **_engine_options(DATABASE_URL))
+
+if engine.dialect.name == "sqlite":
+    event.listen(engine, "connect", _set_sqlite_pragmas)
+    event.listen(async_engine.sync_engine, "connect", _set_sqlite_pragmas)
 
 # 声明基类
 Base = declarative_base()
 
 # 创建会话工厂
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# 提交后不让对象过期，避免在异步会话中访问属性时触发隐式查询
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 
 # 用户模型
 class User(Base):
@@ -22,5 +83,58 @@ class User(Base):
     username = Column(String, unique=True, index=True)
     password = Column(String)
 
+# 上传视频目录：每个上传的视频一行，替代每次请求 os.walk
+class Upload(Base):
+    __tablename__ = "uploads"
+    __table_args__ = (
+        UniqueConstraint("username", "timestamp", "filename", name="uq_uploads_user_timestamp_filename"),
+        Index("ix_uploads_username_created_at", "username", "created_at"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    username = Column(String, nullable=False)
+    timestamp = Column(String, nullable=False)  # uploads/<user>/<timestamp>/ 目录名
+    filename = Column(String, nullable=False)
+    path = Column(String, nullable=False)  # 相对 URL，例如 uploads/<user>/<timestamp>/<file>
+    size_bytes = Column(Integer)
+    sha256 = Column(String, index=True)
+    duration_seconds = Column(Float)  # 分析时填写
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    runs = relationship("AnalysisRun", back_populates="upload", order_by="AnalysisRun.id", cascade="all, delete-orphan")
+
+# 一次分析运行
+class AnalysisRun(Base):
+    __tablename__ = "analysis_runs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    upload_id = Column(Integer, ForeignKey("uploads.id"), nullable=False, index=True)
+    job_id = Column(String, index=True)
+    model_name = Column(String)
+    status = Column(String, nullable=False, default="done")
+    rep_count = Column(Integer, default=0)
+    min_knee_angle = Column(Float)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    upload = relationship("Upload", back_populates="runs")
+    segments = relationship("Segment", back_populates="run", order_by="Segment.rep_index", cascade="all, delete-orphan")
+
+# 分析得到的每个深蹲片段
+class Segment(Base):
+    __tablename__ = "segments"
+
+    id = Column(Integer, primary_key=True, index=True)
+    run_id = Column(Integer, ForeignKey("analysis_runs.id"), nullable=False, index=True)
+    rep_index = Column(Integer, nullable=False)
+    path = Column(String, nullable=False)  # 带图表的分析视频
+    start_frame = Column(Integer)
+    end_frame = Column(Integer)
+    duration_seconds = Column(Float)
+    min_knee_angle = Column(Float)
+    min_hip_angle = Column(Float)
+    max_depth = Column(Float)
+
+    run = relationship("AnalysisRun", back_populates="segments")
+
 # 创建所有表
 Base.metadata.create_all(bind=engine)
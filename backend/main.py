@@ -1,18 +1,51 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from fastapi import FastAPI, Depends, HTTPException, File, UploadFile, Form
-from sqlalchemy.orm import Session
-from database import SessionLocal, User
+from fastapi import FastAPI, Depends, HTTPException, Form, Request, WebSocket
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import AsyncSessionLocal, User, async_engine
 import os
 from pathlib import Path
-from datetime import datetime
 from fastapi.staticfiles import StaticFiles
-from src.split_video_by_squat import split_video_by_squat  # Ensure the path is correct
-from src.process_and_analyze_video import process_and_analyze_video
+from fastapi.responses import StreamingResponse, Response
+from fastapi.concurrency import run_in_threadpool
+# The vision stack (cv2, NumPy, the pose model) is imported inside the endpoints that need it, so workers
+# start quickly and small; analyses run in the JobQueue worker processes
+from src.model_registry import MODEL_SIZES, get_pose_model
+from src.jobs import JobStore, JobQueue, QueueFullError, PROGRESS_INTERVAL_SECONDS
+from src.segmentation import THRESHOLD_DOWN, THRESHOLD_UP, THRESHOLD_HORIZONTAL, EXTRA_FRAMES
+from src.catalog import record_upload, list_history, DEFAULT_PAGE_SIZE
+from src.metrics import CONTENT_TYPE, REQUESTS_IN_PROGRESS, QUEUE_DEPTH, QUEUE_CAPACITY, observe_request, render_metrics
+from src.uploads import (
+    MAX_UPLOAD_BYTES, UPLOAD_CHUNK_SIZE, FormUpload, ResumableUploadStore, UploadBusyError, UploadOffsetError,
+    UploadTooLargeError, new_upload_dir, safe_filename, write_manifest,
+)
+import asyncio
+import json
+import time
 
 app = FastAPI()
 
+# Background analysis jobs; created at startup so each analysis worker warms up its own models
+job_store = JobStore()
+job_queue = None
+
+@app.on_event("startup")
+def start_job_queue():
+    global job_queue
+    job_store.fail_interrupted()
+    job_queue = JobQueue(job_store)
+
+@app.on_event("shutdown")
+def stop_job_queue():
+    if job_queue is not None:
+        job_queue.shutdown()
+
+@app.on_event("shutdown")
+async def close_database_pool():
+    await async_engine.dispose()
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  # Allow all origins for CORS requests (replace with frontend domain in production, e.g., ["http://localhost:5173"])
@@ -21,31 +54,41 @@ app.add_middleware(
     allow_headers=["*"],  # Allow all request headers
 )
 
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    # Latency up to the start of the response; streamed bodies (events, videos) are not included
+    start = time.perf_counter()
+    REQUESTS_IN_PROGRESS.inc(method=request.method)
+    try:
+        response = await call_next(request)
+    finally:
+        REQUESTS_IN_PROGRESS.inc(-1, method=request.method)
+    # The route template keeps the label set small, e.g. /jobs/{job_id} rather than one label per job
+    route = request.scope.get("route")
+    observe_request(request.method, getattr(route, "path", "unmatched"), response.status_code, time.perf_counter() - start)
+    return response
+
 # Data model
 class RegisterRequest(BaseModel):
     username: str
     password: str
 
-# Get database session
-def get_db():
-    db = SessionLocal()
-    try:
+# Get database session; queries are awaited so they do not hold up the event loop
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 @app.post("/register")
-async def register_user(data: RegisterRequest, db: Session = Depends(get_db)):
+async def register_user(data: RegisterRequest, db: AsyncSession = Depends(get_db)):
     # Check if the username already exists
-    existing_user = db.query(User).filter(User.username == data.username).first()
+    existing_user = await db.scalar(select(User).where(User.username == data.username))
     if existing_user:
         raise HTTPException(status_code=400, detail="User already exists")
 
     # Create a new user
     new_user = User(username=data.username, password=data.password)
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
     return {"message": "Registration successful"}
 
 class LoginRequest(BaseModel):
@@ -53,9 +96,9 @@ class LoginRequest(BaseModel):
     password: str
 
 @app.post("/login")
-async def login_user(data: LoginRequest, db: Session = Depends(get_db)):
+async def login_user(data: LoginRequest, db: AsyncSession = Depends(get_db)):
     # Look up the user in the database
-    user = db.query(User).filter(User.username == data.username).first()
+    user = await db.scalar(select(User).where(User.username == data.username))
     if not user or user.password != data.password:
         raise HTTPException(status_code=400, detail="Invalid username or password")
 
@@ -68,76 +111,535 @@ Path(UPLOAD_ROOT_DIR).mkdir(parents=True, exist_ok=True)
 # Mount static file directory
 app.mount("/uploads", StaticFiles(directory=UPLOAD_ROOT_DIR), name="uploads")
 
-@app.post("/upload")
-async def upload_video(username: str = Form(...), file: UploadFile = File(...)):
-    # Generate a timestamp and create the user directory
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    user_dir = os.path.join(UPLOAD_ROOT_DIR, username, timestamp)
-    Path(user_dir).mkdir(parents=True, exist_ok=True)
-
-    # Save the uploaded file
-    file_path = os.path.join(user_dir, file.filename)
-    with open(file_path, "wb") as f:
-        f.write(await file.read())
+resumable_uploads = ResumableUploadStore(UPLOAD_ROOT_DIR)
 
+def upload_response(user_dir, file_path, filename, timestamp, size, sha256):
     # Generate relative path
     relative_file_path = os.path.relpath(file_path, UPLOAD_ROOT_DIR)  # Get relative path
     relative_file_path = relative_file_path.replace(os.sep, "/")  # Convert to URL format
 
     return {
         "message": f"Video uploaded successfully to {user_dir}",
-        "filename": file.filename,
+        "filename": filename,
         "file_path": f"uploads/{relative_file_path}",  # Ensure the response returns a relative path
-        "timestamp": timestamp
+        "timestamp": timestamp,
+        "size": size,
+        "sha256": sha256
     }
 
-# Analyze squat video segments API
-@app.post("/analyze_squat_segments")
-async def analyze_squat_segments(username: str = Form(...), filename: str = Form(...), timestamp: str = Form(...)):
-    # Construct file path
+# Form of POST /upload for the API docs; the endpoint parses the body itself
+UPLOAD_FORM_SCHEMA = {
+    "requestBody": {
+        "required": True,
+        "content": {"multipart/form-data": {"schema": {
+            "type": "object",
+            "required": ["username", "file"],
+            "properties": {"username": {"type": "string"}, "file": {"type": "string", "format": "binary"}},
+        }}},
+    },
+}
+
+@app.post("/upload", openapi_extra=UPLOAD_FORM_SCHEMA)
+async def upload_video(request: Request, db: AsyncSession = Depends(get_db)):
+    # The body is parsed here rather than through File(...)/Form(...), which would spool the whole upload
+    # before this runs: oversized uploads are rejected first, and the file is written to disk only once
+    content_length = request.headers.get("content-length")
+    if content_length is not None:
+        try:
+            announced_size = int(content_length)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid Content-Length header")
+        if announced_size > MAX_UPLOAD_BYTES:
+            raise HTTPException(status_code=413, detail=f"Upload exceeds the {MAX_UPLOAD_BYTES} byte limit")
+
+    try:
+        upload = FormUpload(request.headers.get("content-type"), resumable_uploads.root)
+        sha256 = await upload.receive(request.stream())
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    username = upload.fields.get("username")
+    if username is None or upload.filename is None:
+        upload.discard()
+        raise HTTPException(status_code=422, detail="username and file are required")
+    try:
+        filename = safe_filename(upload.filename)
+        # Generate a timestamp and create the user directory
+        timestamp, user_dir = new_upload_dir(UPLOAD_ROOT_DIR, username)
+    except ValueError as e:
+        upload.discard()
+        raise HTTPException(status_code=400, detail=str(e))
+
+    file_path = os.path.join(user_dir, filename)
+    upload.save(file_path)
+    write_manifest(user_dir, filename, upload.size, sha256)
+    await db.run_sync(record_upload, safe_filename(username), timestamp, filename, upload.size, sha256)
+
+    return upload_response(user_dir, file_path, filename, timestamp, upload.size, sha256)
+
+@app.post("/upload/resumable")
+async def create_resumable_upload(username: str = Form(...), filename: str = Form(...), total_size: int = Form(...)):
+    """
+    Start a resumable upload; chunks are then sent with PUT /upload/resumable/{upload_id}?offset=N
+    """
+    try:
+        upload_id = resumable_uploads.create(username, filename, total_size)
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"upload_id": upload_id, "chunk_size": UPLOAD_CHUNK_SIZE, "received": 0}
+
+@app.get("/upload/resumable/{upload_id}")
+async def get_resumable_upload(upload_id: str):
+    """
+    Report how many bytes of a resumable upload have been received, so an interrupted client can resume
+    """
+    try:
+        meta = resumable_uploads.status(upload_id)
+    except (KeyError, ValueError):
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return {"upload_id": upload_id, "received": meta["received"], "total_size": meta["total_size"]}
+
+@app.put("/upload/resumable/{upload_id}")
+async def append_resumable_upload(upload_id: str, offset: int, request: Request):
+    """
+    Append the raw request body at the given offset
+    """
+    try:
+        received = await resumable_uploads.append(upload_id, offset, request.stream())
+    except (KeyError, ValueError):
+        raise HTTPException(status_code=404, detail="Upload not found")
+    except UploadOffsetError as e:
+        raise HTTPException(status_code=409, detail={"message": str(e), "received": e.expected_offset})
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except UploadBusyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"upload_id": upload_id, "received": received}
+
+@app.post("/upload/resumable/{upload_id}/complete")
+async def complete_resumable_upload(upload_id: str, db: AsyncSession = Depends(get_db)):
+    """
+    Finish a resumable upload and move it into the user's upload directory
+    """
+    try:
+        upload = await run_in_threadpool(resumable_uploads.complete, upload_id)
+    except (KeyError, ValueError):
+        raise HTTPException(status_code=404, detail="Upload not found")
+    except UploadOffsetError as e:
+        raise HTTPException(status_code=409, detail={"message": "Upload is incomplete", "received": e.expected_offset})
+    except UploadBusyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    await db.run_sync(record_upload, upload["username"], upload["timestamp"], upload["filename"], upload["size"], upload["sha256"])
+    user_dir = os.path.dirname(upload["file_path"])
+    return upload_response(user_dir, upload["file_path"], upload["filename"], upload["timestamp"], upload["size"], upload["sha256"])
+
+async def submit_analysis_job(username, filename, timestamp, model_size, raw_clips=None, profile=False, track_lifter=None):
+    """
+    Validate an analysis request and queue it.
+    :param raw_clips: Also cut the unannotated clip of each rep; defaults to the RAW_CLIP_MODE setting
+    :param profile: Save a stack profile of the run under ANALYSIS_PROFILE_DIR
+    :param track_lifter: Follow the lifter across frames in crowded footage; defaults to the POSE_TRACK_LIFTER setting
+    :return: (job_id, future) of the queued job
+    """
+    from src.clips import RAW_CLIP_MODE
+    from src.tracking import TRACK_LIFTER
+
+    if raw_clips is None:
+        raw_clips = RAW_CLIP_MODE != "none"
+    if track_lifter is None:
+        track_lifter = TRACK_LIFTER
+    if model_size is not None and model_size not in MODEL_SIZES:
+        raise HTTPException(status_code=400, detail=f"Unknown model size '{model_size}'")
+
+    # Construct file path; the names are sanitized as on upload so a request cannot leave the uploads directory
+    try:
+        username, timestamp, filename = safe_filename(username), safe_filename(timestamp), safe_filename(filename)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     user_dir = os.path.join(UPLOAD_ROOT_DIR, username, timestamp)
     file_path = os.path.join(user_dir, filename)
     output_dir = os.path.join(user_dir, "segments")
 
     if not os.path.exists(file_path):
-        return {"message": "File not found", "error": True}
+        raise HTTPException(status_code=404, detail="File not found")
+
+    try:
+        # The queue checks its depth and records the job in SQLite
+        return await run_in_threadpool(
+            job_queue.submit, username, file_path, output_dir, f"uploads/{username}/{timestamp}/segments", model_size,
+            raw_clips, profile, track_lifter,
+        )
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+
+# Analyze squat video segments API
+@app.post("/analyze_squat_segments")
+async def analyze_squat_segments(username: str = Form(...), filename: str = Form(...), timestamp: str = Form(...), model_size: str = Form(None), raw_clips: bool = Form(None), profile: bool = Form(False), track_lifter: bool = Form(None)):
+    try:
+        job_id, future = await submit_analysis_job(username, filename, timestamp, model_size, raw_clips, profile, track_lifter)
+    except HTTPException as e:
+        return {"message": e.detail, "error": True}
 
     try:
-        # Call the segmentation logic
-        segment_files = process_and_analyze_video(file_path, output_dir)
+        # Wait for the background job without blocking the event loop
+        result = await asyncio.wrap_future(future)
 
         # Return the list of segmented video paths
         return {
             "message": "Squat segments analyzed successfully",
-            "segments": [f"uploads/{username}/{timestamp}/segments/{os.path.basename(f)}" for f in segment_files]
+            "job_id": job_id,
+            "segments": result["segments"],
+            **({"profile": result["profile"]} if "profile" in result else {}),
         }
     except Exception as e:
-        return {"message": "Analysis failed", "error": str(e)}
+        return {"message": "Analysis failed", "job_id": job_id, "error": str(e)}
 
-UPLOAD_ROOT_DIR = os.path.join(os.getcwd(), "uploads")
+# Seconds without events after which a comment is sent so proxies keep the stream open
+SSE_KEEPALIVE_SECONDS = 15
+
+async def job_event_stream(request, job_id, after_seq=0):
+    """
+    Server-sent events of a job: status, progress, one "segment" event per finished rep, then "done" or "failed".
+    :param after_seq: Last event id the client already received
+    """
+    idle = 0.0
+    while not await request.is_disconnected():
+        events = await run_in_threadpool(job_store.events, job_id, after_seq)
+        for seq, event_type, data in events:
+            after_seq = seq
+            yield f"id: {seq}\nevent: {event_type}\ndata: {json.dumps(data)}\n\n"
+            if event_type in ("done", "failed"):
+                return
+
+        if events:
+            idle = 0.0
+        else:
+            # Jobs interrupted by a restart never record a final event
+            job = await run_in_threadpool(job_store.get, job_id)
+            if job["status"] not in ("queued", "running"):
+                yield f"event: {job['status']}\ndata: {json.dumps({'error': job['error']})}\n\n"
+                return
+            idle += PROGRESS_INTERVAL_SECONDS
+            if idle >= SSE_KEEPALIVE_SECONDS:
+                idle = 0.0
+                yield ": keep-alive\n\n"
+        await asyncio.sleep(PROGRESS_INTERVAL_SECONDS)
+
+def event_stream_response(request, job_id, after_seq=0):
+    return StreamingResponse(
+        job_event_stream(request, job_id, after_seq),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.post("/analyze_squat_segments/stream")
+async def analyze_squat_segments_stream(request: Request, username: str = Form(...), filename: str = Form(...), timestamp: str = Form(...), model_size: str = Form(None), raw_clips: bool = Form(None), profile: bool = Form(False), track_lifter: bool = Form(None)):
+    """
+    Queue a squat analysis and stream its progress and each rep as soon as it is rendered (server-sent events)
+    """
+    job_id, _ = await submit_analysis_job(username, filename, timestamp, model_size, raw_clips, profile, track_lifter)
+    return event_stream_response(request, job_id)
+
+@app.post("/jobs")
+async def create_analysis_job(username: str = Form(...), filename: str = Form(...), timestamp: str = Form(...), model_size: str = Form(None), raw_clips: bool = Form(None), profile: bool = Form(False), track_lifter: bool = Form(None)):
+    """
+    Queue a squat analysis and return its job id immediately
+    """
+    job_id, _ = await submit_analysis_job(username, filename, timestamp, model_size, raw_clips, profile, track_lifter)
+    return {"message": "Analysis queued", "job_id": job_id, "status": "queued"}
+
+@app.get("/jobs/{job_id}")
+async def get_analysis_job(job_id: str):
+    """
+    Report the status and progress (frames processed / total) of an analysis job
+    """
+    job = await run_in_threadpool(job_store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    return {
+        "job_id": job_id,
+        "status": job["status"],
+        "frames_processed": job["frames_processed"],
+        "total_frames": job["total_frames"],
+        "error": job["error"],
+        "queue_depth": await run_in_threadpool(job_queue.depth),
+    }
+
+@app.get("/jobs/{job_id}/events")
+async def stream_analysis_job_events(job_id: str, request: Request):
+    """
+    Stream the events of an analysis job (server-sent events); reconnecting clients resume after Last-Event-ID
+    """
+    if await run_in_threadpool(job_store.get, job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    try:
+        after_seq = int(request.headers.get("last-event-id", 0))
+    except ValueError:
+        after_seq = 0
+    return event_stream_response(request, job_id, after_seq)
+
+@app.get("/jobs/{job_id}/result")
+async def get_analysis_job_result(job_id: str):
+    """
+    Return the segments produced by a finished analysis job
+    """
+    job = await run_in_threadpool(job_store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job["status"] == "failed":
+        return {"message": "Analysis failed", "job_id": job_id, "error": job["error"]}
+    if job["status"] != "done":
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}")
+
+    response = {"message": "Squat segments analyzed successfully", "job_id": job_id, "segments": job["result"]["segments"]}
+    if "profile" in job["result"]:
+        response["profile"] = job["result"]["profile"]
+    return response
+
+# Live sessions being served; each one keeps an analysis thread busy
+live_sessions = 0
+
+async def start_live_analysis(source_or_frames, model_size, track_lifter):
+    """
+    Load the pose model and start the threads of a live session in the API process.
+    :return: (bridge, frames, stop) of the session
+    """
+    from src.live import EventBridge, LiveAnalyzer, start_live_session
+    from src.tracking import TRACK_LIFTER
+
+    model = await run_in_threadpool(get_pose_model, model_size)
+    analyzer = LiveAnalyzer(model, track_lifter=TRACK_LIFTER if track_lifter is None else track_lifter)
+    bridge = EventBridge(asyncio.get_running_loop())
+    frames, stop, _ = start_live_session(source_or_frames, analyzer, bridge.emit)
+    return bridge, frames, stop
+
+async def send_live_events(websocket, bridge):
+    while True:
+        event = await bridge.get()
+        await websocket.send_text(json.dumps(event))
+        if event["type"] == "end":
+            return
+
+@app.websocket("/live/ws")
+async def live_analysis_websocket(websocket: WebSocket, model_size: str = None, track_lifter: bool = None):
+    """
+    Live squat analysis of a camera: the client sends frames as binary JPEG messages (and the text message
+    "end" to finish) and receives "angles", "rep_start", "rep", "stats" and a final "end" event as JSON.
+    Frames arriving faster than they can be analyzed are dropped, so events stay within the latency budget.
+    """
+    global live_sessions
+    from src.live import LIVE_MAX_SESSIONS, LatestFrame
+    await websocket.accept()
+    if model_size is not None and model_size not in MODEL_SIZES:
+        await websocket.close(code=1008, reason=f"Unknown model size '{model_size}'")
+        return
+    if live_sessions >= LIVE_MAX_SESSIONS:
+        await websocket.close(code=1013, reason="Too many live sessions, try again later")
+        return
+
+    live_sessions += 1
+    stop = None
+    try:
+        bridge, frames, stop = await start_live_analysis(LatestFrame(), model_size, track_lifter)
+        sender = asyncio.create_task(send_live_events(websocket, bridge))
+        try:
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    stop.set()
+                    sender.cancel()
+                    return
+                if message.get("bytes") is not None:
+                    frames.put(message["bytes"])
+                elif message.get("text") == "end":
+                    break
+        finally:
+            frames.close()
+        # The analysis finishes the frame in progress, closes an open rep and sends "end"
+        await sender
+        await websocket.close()
+    finally:
+        if stop is not None:
+            stop.set()
+        live_sessions -= 1
+
+async def live_event_stream(request, source, model_size, track_lifter):
+    """
+    Server-sent events of a live session. The session is started here rather than in the endpoint, so it
+    only exists while the stream is being consumed and this generator's finally always releases it.
+    """
+    global live_sessions
+    from src.live import LIVE_MAX_SESSIONS
+    # Checked again: other sessions may have started since the endpoint accepted the request
+    if live_sessions >= LIVE_MAX_SESSIONS:
+        yield f"event: error\ndata: {json.dumps({'type': 'error', 'error': 'Too many live sessions, try again later'})}\n\n"
+        return
+
+    live_sessions += 1
+    stop = None
+    try:
+        try:
+            bridge, _, stop = await start_live_analysis(source, model_size, track_lifter)
+        except Exception as e:
+            yield f"event: error\ndata: {json.dumps({'type': 'error', 'error': str(e)})}\n\n"
+            return
+        while True:
+            try:
+                event = await asyncio.wait_for(bridge.get(), SSE_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    return
+                yield ": keep-alive\n\n"
+                continue
+            yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+            if event["type"] == "end":
+                return
+    finally:
+        if stop is not None:
+            stop.set()
+        live_sessions -= 1
+
+@app.get("/live/stream")
+async def live_analysis_stream(request: Request, source: str = None, username: str = None, timestamp: str = None,
+                               filename: str = None, model_size: str = None, track_lifter: bool = None):
+    """
+    Live squat analysis of an RTSP camera (source=rtsp://...) or of an uploaded video played back in real
+    time (username, timestamp and filename), streamed as server-sent events like /live/ws. A camera that
+    cannot be opened or fails while being read is reported as an "error" event before "end".
+    """
+    from src.live import LIVE_MAX_SESSIONS
+    if model_size is not None and model_size not in MODEL_SIZES:
+        raise HTTPException(status_code=400, detail=f"Unknown model size '{model_size}'")
+    if source is not None:
+        # Only network cameras; local devices and paths are not reachable through the API
+        if not source.startswith(("rtsp://", "rtsps://")):
+            raise HTTPException(status_code=400, detail="source must be an rtsp:// or rtsps:// URL")
+    else:
+        try:
+            source = os.path.join(UPLOAD_ROOT_DIR, safe_filename(username or ""), safe_filename(timestamp or ""), safe_filename(filename or ""))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if not os.path.isfile(source):
+            raise HTTPException(status_code=404, detail="File not found")
+    if live_sessions >= LIVE_MAX_SESSIONS:
+        raise HTTPException(status_code=429, detail="Too many live sessions, try again later")
+
+    return StreamingResponse(
+        live_event_stream(request, source, model_size, track_lifter),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/metrics")
+async def get_metrics():
+    """
+    Request, analysis, pipeline stage, model and queue metrics in the Prometheus text format
+    """
+    QUEUE_DEPTH.set(await run_in_threadpool(job_queue.depth))
+    QUEUE_CAPACITY.set(job_queue.max_workers + job_queue.max_queue_depth)
+    return Response(render_metrics(), media_type=CONTENT_TYPE)
+
+@app.get("/models")
+async def get_model_stats():
+    """
+    Report the pose models loaded in each analysis worker with their load and warm-up latency
+    """
+    workers = await run_in_threadpool(job_queue.worker_model_stats)
+    return {"sizes": list(MODEL_SIZES), "workers": workers}
+
+# Upper bound on the frames returned by one keypoint query
+KEYPOINT_QUERY_MAX_FRAMES = 5000
+
+def open_keypoint_track(username, timestamp, filename):
+    from src.keypoint_store import load_keypoints
+
+    try:
+        file_path = os.path.join(UPLOAD_ROOT_DIR, safe_filename(username), safe_filename(timestamp), safe_filename(filename))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    track = load_keypoints(file_path)
+    if track is None:
+        raise HTTPException(status_code=404, detail="No stored keypoints for this video, analyze it first")
+    return track
+
+def keypoint_window(track, start, end, metrics):
+    from src.keypoint_store import frame_metrics
+
+    start = max(start, 0)
+    end = min(len(track) if end is None else end, start + KEYPOINT_QUERY_MAX_FRAMES, len(track))
+
+    response = {
+        "meta": track.meta,
+        "start": start,
+        "end": end,
+        "timestamps": track.timestamps[start:end].tolist(),
+        "valid": track.valid[start:end].tolist(),
+        "keypoints": track.xy[start:end].astype(float).round(1).tolist(),
+        "confidence": track.confidence[start:end].astype(float).round(3).tolist(),
+    }
+    if metrics:
+        response["metrics"] = frame_metrics(track, start, end)
+    return response
+
+@app.get("/keypoints/{username}/{timestamp}/{filename}")
+async def get_keypoints(username: str, timestamp: str, filename: str, start: int = 0, end: int = None, metrics: bool = False):
+    """
+    Return the stored keypoints of frames [start, end) of an analyzed video, optionally with the
+    per-frame joint angles and shoulder speed recomputed from them
+    """
+    # Reading the memory-mapped track and computing metrics take a while on long videos, so they run off the event loop
+    track = await run_in_threadpool(open_keypoint_track, username, timestamp, filename)
+    return await run_in_threadpool(keypoint_window, track, start, end, metrics)
+
+@app.post("/keypoints/{username}/{timestamp}/{filename}/segments")
+async def resegment_keypoints(username: str, timestamp: str, filename: str,
+                              threshold_down: float = Form(THRESHOLD_DOWN), threshold_up: float = Form(THRESHOLD_UP),
+                              threshold_horizontal: float = Form(THRESHOLD_HORIZONTAL), extra_frames: int = Form(EXTRA_FRAMES)):
+    """
+    Detect squat segments and their metrics again from the stored keypoints with other thresholds, without rerunning the model
+    """
+    from src.keypoint_store import resegment
+
+    track = await run_in_threadpool(open_keypoint_track, username, timestamp, filename)
+    # The segmenter steps through every frame, so it runs off the event loop
+    segments = await run_in_threadpool(
+        resegment, track, threshold_down=threshold_down, threshold_up=threshold_up,
+        threshold_horizontal=threshold_horizontal, extra_frames=extra_frames,
+    )
+    return {"segments": segments, "frame_count": len(track)}
+
+@app.get("/cache/stats")
+async def get_cache_stats():
+    """
+    Report hit/miss counters and disk usage of the analysis cache
+    """
+    from src.analysis_cache import AnalysisCache
+
+    return AnalysisCache().stats()
 
 @app.post("/history")
-async def get_user_history(username: str = Form(...)):
+async def get_user_history(username: str = Form(...), page: int = Form(1), page_size: int = Form(DEFAULT_PAGE_SIZE), db: AsyncSession = Depends(get_db)):
     """
     Retrieve the upload history of a user
     :param username: The username (submitted via form)
-    :return: A history of uploaded videos by the user
-    """
-    # Check if the user directory exists
-    user_dir = os.path.join(UPLOAD_ROOT_DIR, username)
-    if not os.path.exists(user_dir):
-        return {"message": "No history found for this user.", "videos": []}
-
-    # Traverse the user directory and get all video file information
-    history = []
-    for root, dirs, files in os.walk(user_dir):
-        for file in files:
-            if file.endswith((".mp4", ".avi", ".mkv")):  # Supported video formats
-                relative_path = os.path.relpath(os.path.join(root, file), UPLOAD_ROOT_DIR)
-                history.append({
-                    "filename": file,
-                    "path": f"uploads/{relative_path}",
-                    "timestamp": os.path.basename(root),  # Timestamp is derived from the directory name
-                })
-
-    return {"message": "History retrieved successfully.", "videos": history}
+    :param page: 1-based page number
+    :param page_size: Number of uploads per page
+    :return: A page of uploaded videos, newest first, with the segments and metrics of their latest analysis
+    """
+    # Uploads are recorded under the sanitized name of their directory
+    try:
+        username = safe_filename(username)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    # The catalog queries are shared with the analysis workers, which use plain sessions
+    total, history = await db.run_sync(list_history, username, page, page_size)
+    if total == 0:
+        return {"message": "No history found for this user.", "videos": [], "total": 0, "page": page, "page_size": page_size}
+
+    return {"message": "History retrieved successfully.", "videos": history, "total": total, "page": page, "page_size": page_size}
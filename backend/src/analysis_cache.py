@@ -0,0 +1,205 @@
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import time
+import numpy as np
+
+ANALYSIS_CACHE_DIR = os.environ.get("ANALYSIS_CACHE_DIR", os.path.join(os.getcwd(), "cache"))
+ANALYSIS_CACHE_MAX_BYTES = int(os.environ.get("ANALYSIS_CACHE_MAX_BYTES", str(10 * 1024 ** 3)))
+ANALYSIS_CACHE_MAX_ENTRIES = int(os.environ.get("ANALYSIS_CACHE_MAX_ENTRIES", "500"))
+
+# Bumped whenever the layout or the meaning of an entry changes (3: segment ends include their last frame),
+# so older entries are never read and age out of the LRU
+CACHE_FORMAT = 3
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    """Content hash of a file, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def video_content_hash(video_path):
+    """
+    Content hash of an uploaded video, taken from its upload manifest when available.
+    """
+    from src.uploads import read_manifest
+    entry = read_manifest(os.path.dirname(video_path), os.path.basename(video_path))
+    if entry is not None and entry.get("size") == os.path.getsize(video_path):
+        return entry["sha256"]
+    return file_sha256(video_path)
+
+
+def cache_key(content_hash, model_name, params):
+    """
+    Key of an analysis result.
+    :param content_hash: SHA-256 of the video
+    :param model_name: Name of the pose model weights
+    :param params: Dict of every parameter that changes the result (thresholds, inference size, ...)
+    :return: Hex digest identifying the analysis
+    """
+    payload = json.dumps({"format": CACHE_FORMAT, "video": content_hash, "model": model_name, "params": params}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _link_or_copy(src, dst):
+    # Hard links make hits and stores free when the cache and uploads share a filesystem
+    if os.path.exists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+class AnalysisCache:
+    """
+    Content-addressed store of analysis results under <cache_dir>/<key>/.
+    Each entry keeps the selected keypoints, the segment boundaries and the rendered videos.
+    A SQLite index tracks size and last access for LRU eviction and the hit/miss counters,
+    so every worker process shares the same view.
+    """
+
+    def __init__(self, cache_dir=ANALYSIS_CACHE_DIR, max_bytes=ANALYSIS_CACHE_MAX_BYTES, max_entries=ANALYSIS_CACHE_MAX_ENTRIES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        os.makedirs(cache_dir, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, size_bytes INTEGER, created_at REAL, last_access REAL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_entries_last_access ON entries (last_access)")
+            conn.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER)")
+
+    def _connect(self):
+        return sqlite3.connect(os.path.join(self.cache_dir, "index.db"), timeout=30)
+
+    def _count(self, conn, name):
+        conn.execute("INSERT INTO counters (name, value) VALUES (?, 1) ON CONFLICT(name) DO UPDATE SET value = value + 1", (name,))
+
+    def _entry_dir(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def lookup(self, key, output_dir):
+        """
+        Restore a cached analysis into output_dir.
+        :return: The stored analysis result with its paths inside output_dir on a hit, None on a miss
+        """
+        entry_dir = self._entry_dir(key)
+        with self._connect() as conn:
+            row = conn.execute("SELECT key FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None or not os.path.isdir(entry_dir):
+                self._count(conn, "misses")
+                return None
+            conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key))
+
+        # Another worker may evict the entry while its files are linked out; that is a miss, not an error
+        linked = []
+        try:
+            with open(os.path.join(entry_dir, "segments.json")) as f:
+                manifest = json.load(f)
+            os.makedirs(output_dir, exist_ok=True)
+            for name in manifest["files"]:
+                _link_or_copy(os.path.join(entry_dir, name), os.path.join(output_dir, name))
+                linked.append(name)
+        except FileNotFoundError:
+            for name in linked:
+                os.remove(os.path.join(output_dir, name))
+            with self._connect() as conn:
+                self._count(conn, "misses")
+            return None
+
+        with self._connect() as conn:
+            self._count(conn, "hits")
+        result = manifest["result"]
+        result["segment_files"] = [os.path.join(output_dir, name) for name in result["segment_files"]]
+        for segment in result["segments"]:
+            segment["file"] = os.path.join(output_dir, segment["file"])
+        return result
+
+    def load_keypoints(self, key):
+        """
+        Keypoints stored with an entry.
+        :return: (persons, valid) arrays, or None if the entry does not exist
+        """
+        entry_dir = self._entry_dir(key)
+        try:
+            return np.load(os.path.join(entry_dir, "persons.npy")), np.load(os.path.join(entry_dir, "valid.npy"))
+        except FileNotFoundError:
+            # Missing or evicted by another worker since the lookup
+            return None
+
+    def store(self, key, output_files, result, persons, valid):
+        """
+        Save an analysis and evict old entries if the cache is over budget.
+        :param output_files: Every video written by the analysis
+        :param result: Analysis result (segment_files, segments with their metrics, fps, ...)
+        :param persons: Selected keypoints per frame, shape (frames, 17, 3)
+        :param valid: Per-frame detection mask
+        """
+        entry_dir = self._entry_dir(key)
+        temp_dir = f"{entry_dir}.tmp{os.getpid()}"
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        os.makedirs(temp_dir)
+
+        files = [os.path.basename(path) for path in output_files if os.path.exists(path)]
+        for path in output_files:
+            if os.path.exists(path):
+                _link_or_copy(path, os.path.join(temp_dir, os.path.basename(path)))
+        np.save(os.path.join(temp_dir, "persons.npy"), persons)
+        np.save(os.path.join(temp_dir, "valid.npy"), valid)
+        with open(os.path.join(temp_dir, "segments.json"), "w") as f:
+            # Paths are stored relative to the entry and rebased into the output directory on lookup
+            json.dump({
+                "files": files,
+                "result": {
+                    **result,
+                    "segment_files": [os.path.basename(p) for p in result["segment_files"]],
+                    "segments": [{**segment, "file": os.path.basename(segment["file"])} for segment in result["segments"]],
+                },
+            }, f)
+
+        size = sum(os.path.getsize(os.path.join(temp_dir, name)) for name in os.listdir(temp_dir))
+
+        # Another worker may have stored the same analysis meanwhile; keep whichever landed first
+        try:
+            os.rename(temp_dir, entry_dir)
+        except OSError:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+            return
+
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO entries (key, size_bytes, created_at, last_access) VALUES (?, ?, ?, ?)", (key, size, now, now))
+        self.evict()
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits its size and entry budgets"""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT key, size_bytes FROM entries ORDER BY last_access DESC").fetchall()
+            total = 0
+            for position, (key, size) in enumerate(rows):
+                total += size
+                if total > self.max_bytes or position >= self.max_entries:
+                    conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                    shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+                    self._count(conn, "evictions")
+                    total -= size
+
+    def stats(self):
+        with self._connect() as conn:
+            counters = dict(conn.execute("SELECT name, value FROM counters").fetchall())
+            entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size_bytes), 0) FROM entries").fetchone()
+        return {
+            "hits": counters.get("hits", 0),
+            "misses": counters.get("misses", 0),
+            "evictions": counters.get("evictions", 0),
+            "entries": entries,
+            "size_bytes": size,
+            "max_bytes": self.max_bytes,
+        }
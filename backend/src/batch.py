@@ -0,0 +1,349 @@
+"""
+Batch re-analysis of the uploads archive, e.g. after a change of model or thresholds.
+
+Run from the backend directory, like the API:
+    python -m src.batch --dry-run
+    python -m src.batch --workers 4 --model-size l
+    python -m src.batch --shard 0/2        # on a second host: --shard 1/2
+Every video under uploads/<user>/<timestamp>/ whose segments/ directory has no analysis stamp (pending), or a
+stamp written with another model or other settings, or older than the video (stale), is analyzed again with
+analyze_video and recorded in the catalog like an analysis job. Videos are spread over --workers local
+processes, each keeping its pose model loaded; --shard K/N only takes a stable Kth share of them.
+Finished videos are appended to a checkpoint, so an interrupted run started again with the same settings
+skips what is done (and what failed, unless --retry-failed). A JSON report with the timing of every video
+and the throughput of the run is written at the end, also when the run is interrupted.
+"""
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from src.analysis_cache import AnalysisCache
+from src.catalog import upload_parts, VIDEO_EXTENSIONS
+from src.clips import RAW_CLIP_MODE, ANNOTATED_HEIGHT, ANNOTATED_BITRATE_KBPS
+from src.jobs import record_catalog_run, ANALYSIS_WORKERS, ANALYSIS_CACHE_ENABLED
+from src.model_registry import pose_model_name, MODEL_SIZES
+from src.pose_inference import DEFAULT_BATCH_SIZE, DEFAULT_IMGSZ
+from src.process_and_analyze_video import analyze_video, analysis_params, analysis_fingerprint, read_analysis_stamp
+from src.sampling import SAMPLE_EVERY
+from src.segmentation import SquatSegmenter
+from src.tracking import TRACK_LIFTER, ROI_CROP
+
+BATCH_DIR = os.path.join(os.getcwd(), "batch")
+SEGMENT_FILE_PATTERN = re.compile(r"squat_segment_(\d+)(_second)?\.mp4$")
+
+
+def discover_videos(upload_root, users=None):
+    """
+    Uploaded videos directly under uploads/<user>/<timestamp>/, in path order.
+    :param users: Only the uploads of these users
+    :return: List of paths
+    """
+    videos = []
+    for username in sorted(os.listdir(upload_root)):
+        user_dir = os.path.join(upload_root, username)
+        # Hidden directories are not users, e.g. the .incoming of partial uploads left by older versions
+        if username.startswith(".") or not os.path.isdir(user_dir) or (users and username not in users):
+            continue
+        for timestamp in sorted(os.listdir(user_dir)):
+            upload_dir = os.path.join(user_dir, timestamp)
+            if not os.path.isdir(upload_dir):
+                continue
+            videos.extend(os.path.join(upload_dir, filename) for filename in sorted(os.listdir(upload_dir))
+                          if filename.endswith(VIDEO_EXTENSIONS))
+    return videos
+
+
+def segment_dir(video_path):
+    return os.path.join(os.path.dirname(video_path), "segments")
+
+
+def analysis_state(video_path, fingerprint):
+    """
+    Whether a video needs to be analyzed again.
+    :param fingerprint: analysis_fingerprint of the model and settings of this run
+    :return: "pending" (never analyzed), "stale" (other model or settings, or the video changed since) or "current"
+    """
+    stamp = read_analysis_stamp(segment_dir(video_path), os.path.basename(video_path))
+    if stamp is None:
+        return "pending"
+    if stamp.get("fingerprint") != fingerprint or os.path.getmtime(video_path) > stamp.get("analyzed_at", 0):
+        return "stale"
+    return "current"
+
+
+def in_shard(video_path, upload_root, shard):
+    """
+    :param shard: (index, count); a video stays in its shard as videos are added or removed
+    """
+    index, count = shard
+    relative = os.path.relpath(video_path, upload_root).replace(os.sep, "/")
+    return int(hashlib.sha1(relative.encode()).hexdigest(), 16) % count == index
+
+
+def parse_shard(value):
+    try:
+        index, count = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError("expected INDEX/COUNT, e.g. 0/4")
+    if count < 1 or not 0 <= index < count:
+        raise argparse.ArgumentTypeError("expected 0 <= INDEX < COUNT")
+    return index, count
+
+
+class Checkpoint:
+    """
+    Append-only JSON lines file of the videos a batch configuration has finished.
+    Entries of other configurations (fingerprints) in the same file are ignored; the last entry of a video wins.
+    Every entry is flushed to disk before the next video is reported, so a killed run loses at most the
+    videos that were still being analyzed.
+    """
+
+    def __init__(self, path, fingerprint):
+        self.path = path
+        self.fingerprint = fingerprint
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # A line cut short by a crash
+                    if entry.get("fingerprint") == fingerprint:
+                        self.entries[entry["video"]] = entry
+        self.file = None
+
+    def get(self, video):
+        return self.entries.get(video)
+
+    def record(self, entry):
+        entry = {**entry, "fingerprint": self.fingerprint}
+        self.entries[entry["video"]] = entry
+        if self.file is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self.file = open(self.path, "a")
+        self.file.write(json.dumps(entry) + "\n")
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+
+def remove_leftover_segments(output_dir, rep_indexes):
+    # A re-analysis with other thresholds can find fewer reps than the last one; drop the clips of the reps that are gone
+    for name in os.listdir(output_dir):
+        match = SEGMENT_FILE_PATTERN.match(name)
+        if match and int(match.group(1)) not in rep_indexes:
+            os.remove(os.path.join(output_dir, name))
+
+
+def _init_worker(threads):
+    # Workers share the host: without a limit every worker's inference would use every core.
+    # Set before the first analysis loads torch or ONNX Runtime
+    os.environ.setdefault("OMP_NUM_THREADS", str(threads))
+    os.environ.setdefault("POSE_ONNX_THREADS", str(threads))
+
+
+def analyze_one(video_path, options, record_catalog=True):
+    """
+    Analyze one video into its segments/ directory; runs in a batch worker.
+    :param options: Keyword arguments of analyze_video, plus use_cache
+    :param record_catalog: Record the run in the catalog like an analysis job
+    :return: Timing and outcome of the video for the report
+    """
+    options = dict(options)
+    cache = AnalysisCache() if options.pop("use_cache") else None
+    output_dir = segment_dir(video_path)
+    start = time.perf_counter()
+    analysis = analyze_video(video_path, output_dir, cache=cache, **options)
+    seconds = time.perf_counter() - start
+
+    remove_leftover_segments(output_dir, {segment["index"] for segment in analysis["segments"]})
+    if record_catalog:
+        username, timestamp, _ = upload_parts(video_path)
+        record_catalog_run(None, video_path, analysis, f"uploads/{username}/{timestamp}/segments")
+    return {
+        "status": "done",
+        # A cache hit restores the result without running the pipeline
+        "cached": "stage_stats" not in analysis,
+        "seconds": seconds,
+        "frames": analysis["frame_count"],
+        "reps": len(analysis["segments"]),
+        "duration_seconds": analysis["duration_seconds"],
+    }
+
+
+def run_batch(queue, options, checkpoint, upload_root, workers=ANALYSIS_WORKERS, record_catalog=True):
+    """
+    Analyze the queued videos and checkpoint each one as it finishes.
+    :param queue: List of (video path, "pending" or "stale")
+    :param workers: Worker processes; 0 analyzes the videos one after another in this process
+    :return: (report rows of the videos finished by this run, whether the run was interrupted)
+    """
+    rows = []
+
+    def finish(video, state, outcome):
+        row = {"video": os.path.relpath(video, upload_root), "state": state, **outcome}
+        checkpoint.record(row)
+        rows.append(row)
+        status = "cached" if row.get("cached") else row["status"]
+        detail = f"{row['seconds']:.1f}s, {row['frames']} frames, {row['reps']} reps" if row["status"] == "done" else row["error"]
+        print(f"[{len(rows)}/{len(queue)}] {row['video']}: {status} ({detail})", flush=True)
+
+    def failure(e):
+        return {"status": "failed", "error": f"{type(e).__name__}: {e}"}
+
+    if workers <= 0:
+        try:
+            for video, state in queue:
+                try:
+                    outcome = analyze_one(video, options, record_catalog)
+                except Exception as e:
+                    outcome = failure(e)
+                finish(video, state, outcome)
+        except KeyboardInterrupt:
+            return rows, True
+        return rows, False
+
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                   initializer=_init_worker, initargs=(threads,))
+    try:
+        futures = {executor.submit(analyze_one, video, options, record_catalog): (video, state) for video, state in queue}
+        for future in as_completed(futures):
+            try:
+                outcome = future.result()
+            except Exception as e:
+                outcome = failure(e)
+            finish(*futures[future], outcome)
+    except KeyboardInterrupt:
+        # Videos still being analyzed are not checkpointed and are picked up again by the next run
+        executor.shutdown(wait=False, cancel_futures=True)
+        return rows, True
+    executor.shutdown()
+    return rows, False
+
+
+def summarize(rows, wall_seconds, checkpoint, skipped):
+    """
+    Totals of a run for the report.
+    :param rows: Report rows of the videos finished by this run
+    :param skipped: Dict of skip reason -> number of videos
+    """
+    done = [row for row in rows if row["status"] == "done"]
+    analyzed = [row for row in done if not row["cached"]]
+    frames = sum(row["frames"] for row in done)
+    video_seconds = sum(row["seconds"] for row in done)
+    return {
+        "wall_seconds": wall_seconds,
+        "videos_done": len(done),
+        "videos_cached": len(done) - len(analyzed),
+        "videos_failed": len(rows) - len(done),
+        "videos_skipped": skipped,
+        "frames": frames,
+        "video_seconds": video_seconds,
+        "frames_per_second": frames / wall_seconds if wall_seconds else None,
+        "videos_per_hour": 3600 * len(done) / wall_seconds if wall_seconds else None,
+        # Above 1 when workers analyze videos at the same time
+        "parallelism": video_seconds / wall_seconds if wall_seconds else None,
+        "frames_per_second_per_video": (sum(row["frames"] for row in analyzed) / sum(row["seconds"] for row in analyzed)
+                                        if analyzed else None),
+        "checkpoint_entries": len(checkpoint.entries),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--uploads", default=os.path.join(os.getcwd(), "uploads"))
+    parser.add_argument("--users", nargs="+", help="Only the uploads of these users")
+    parser.add_argument("--workers", type=int, default=ANALYSIS_WORKERS, help="Worker processes; 0 runs in this process")
+    parser.add_argument("--shard", type=parse_shard, default=(0, 1), help="INDEX/COUNT: only this share of the videos")
+    parser.add_argument("--limit", type=int, help="Analyze at most this many videos")
+    parser.add_argument("--force", action="store_true",
+                        help="Also analyze videos whose analysis is current; videos the checkpoint has as done are still "
+                             "skipped, so a forced run can be resumed (start over with another --checkpoint)")
+    parser.add_argument("--retry-failed", action="store_true", help="Analyze videos that failed in an earlier run again")
+    parser.add_argument("--dry-run", action="store_true", help="Only list the videos that would be analyzed")
+    parser.add_argument("--model-size", choices=MODEL_SIZES, help="Pose model size; defaults to POSE_MODEL_SIZE")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--imgsz", type=int, default=DEFAULT_IMGSZ)
+    parser.add_argument("--sample-every", type=int, default=SAMPLE_EVERY)
+    parser.add_argument("--track-lifter", action=argparse.BooleanOptionalAction, default=TRACK_LIFTER)
+    parser.add_argument("--raw-clips", action=argparse.BooleanOptionalAction, default=RAW_CLIP_MODE != "none")
+    parser.add_argument("--no-cache", action="store_true", help="Bypass the analysis cache")
+    parser.add_argument("--no-catalog", action="store_true", help="Do not record the runs in the catalog")
+    parser.add_argument("--checkpoint", default=os.path.join(BATCH_DIR, "checkpoint.jsonl"))
+    parser.add_argument("--report", help="Path of the JSON report (default: batch/report-<time>.json)")
+    args = parser.parse_args()
+
+    # The same settings analyze_video uses for the API, so analyses made by jobs count as current
+    model_name = pose_model_name(args.model_size)
+    params = analysis_params(args.imgsz, args.sample_every, args.raw_clips, SquatSegmenter(verbose=False),
+                             ROI_CROP if args.track_lifter else None, ANNOTATED_HEIGHT, ANNOTATED_BITRATE_KBPS)
+    fingerprint = analysis_fingerprint(model_name, params)
+    options = {
+        "model_size": args.model_size, "batch_size": args.batch_size, "imgsz": args.imgsz, "sample_every": args.sample_every,
+        "raw_clips": args.raw_clips, "track_lifter": args.track_lifter, "use_cache": ANALYSIS_CACHE_ENABLED and not args.no_cache,
+    }
+
+    checkpoint = Checkpoint(args.checkpoint, fingerprint)
+    queue = []
+    skipped = {"current": 0, "checkpoint_done": 0, "checkpoint_failed": 0, "other_shard": 0}
+    for video in discover_videos(args.uploads, args.users):
+        if args.shard[1] > 1 and not in_shard(video, args.uploads, args.shard):
+            skipped["other_shard"] += 1
+            continue
+        state = analysis_state(video, fingerprint)
+        entry = checkpoint.get(os.path.relpath(video, args.uploads))
+        if entry is not None and entry["status"] == "failed" and not args.retry_failed:
+            skipped["checkpoint_failed"] += 1
+        elif entry is not None and entry["status"] == "done" and state == "current":
+            skipped["checkpoint_done"] += 1
+        elif state == "current" and not args.force:
+            skipped["current"] += 1
+        else:
+            queue.append((video, state))
+    if args.limit is not None:
+        queue = queue[:args.limit]
+
+    skip_counts = "".join(f", {count} skipped as {reason.replace('_', ' ')}" for reason, count in skipped.items() if count)
+    print(f"Model {model_name}, settings {fingerprint[:12]}: {len(queue)} videos to analyze "
+          f"({sum(state == 'pending' for _, state in queue)} pending, {sum(state == 'stale' for _, state in queue)} stale)"
+          f"{skip_counts}")
+    if args.dry_run:
+        for video, state in queue:
+            print(f"{state:8s} {os.path.relpath(video, args.uploads)}")
+        checkpoint.close()
+        return
+
+    start = time.perf_counter()
+    try:
+        rows, interrupted = run_batch(queue, options, checkpoint, args.uploads, args.workers, not args.no_catalog)
+    finally:
+        checkpoint.close()
+    summary = summarize(rows, time.perf_counter() - start, checkpoint, skipped)
+
+    report_path = args.report or os.path.join(BATCH_DIR, f"report-{time.strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(report_path)), exist_ok=True)
+    with open(report_path, "w") as f:
+        json.dump({
+            "model_name": model_name, "params": params, "fingerprint": fingerprint, "workers": args.workers,
+            "shard": "/".join(map(str, args.shard)), "interrupted": interrupted, "summary": summary, "videos": rows,
+        }, f, indent=2)
+
+    rate = f"{summary['frames_per_second']:.1f} frames/s, {summary['videos_per_hour']:.1f} videos/h" if summary["wall_seconds"] else "-"
+    print(f"{'Interrupted' if interrupted else 'Finished'} after {summary['wall_seconds']:.1f}s: {summary['videos_done']} done "
+          f"({summary['videos_cached']} from the cache), {summary['videos_failed']} failed, {summary['frames']} frames, {rate}")
+    print(f"Report written to {report_path}")
+    if interrupted:
+        raise SystemExit(130)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+"""
+Catalog of uploads, analysis runs and squat segments kept in the application database.
+
+Rows are written when a video is uploaded and when an analysis finishes, so the history
+endpoint reads an indexed table instead of walking the upload tree on every request.
+Existing upload trees can be imported with:
+    python -m src.catalog backfill [--uploads uploads]
+"""
+import argparse
+import os
+import re
+from datetime import datetime
+from sqlalchemy import func
+from sqlalchemy.orm import selectinload
+from database import SessionLocal, Upload, AnalysisRun, Segment
+from src.uploads import read_manifest
+
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mkv")
+ANNOTATED_SEGMENT_PATTERN = re.compile(r"squat_segment_(\d+)_second\.mp4$")
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+def upload_parts(file_path):
+    """
+    Split the path of an uploaded video into its catalog key.
+    :param file_path: Path of the form .../uploads/<username>/<timestamp>/<filename>
+    :return: (username, timestamp, filename)
+    """
+    timestamp_dir, filename = os.path.split(os.path.normpath(file_path))
+    user_dir, timestamp = os.path.split(timestamp_dir)
+    return os.path.basename(user_dir), timestamp, filename
+
+
+def record_upload(db, username, timestamp, filename, size_bytes=None, sha256=None):
+    """
+    Insert or update the catalog row of an uploaded video.
+    :param db: SQLAlchemy session
+    :return: The Upload row
+    """
+    upload = db.query(Upload).filter(
+        Upload.username == username, Upload.timestamp == timestamp, Upload.filename == filename
+    ).first()
+    if upload is None:
+        upload = Upload(
+            username=username, timestamp=timestamp, filename=filename,
+            path=f"uploads/{username}/{timestamp}/{filename}",
+        )
+        db.add(upload)
+    if size_bytes is not None:
+        upload.size_bytes = size_bytes
+    if sha256 is not None:
+        upload.sha256 = sha256
+    db.commit()
+    db.refresh(upload)
+    return upload
+
+
+def record_analysis(db, file_path, result, url_prefix, job_id=None, status="done"):
+    """
+    Store a finished analysis and its segments.
+    The upload row is created if the video was uploaded before the catalog existed.
+    :param db: SQLAlchemy session
+    :param file_path: Path of the analyzed upload
+    :param result: Result of analyze_video
+    :param url_prefix: URL prefix under which the segment videos are served
+    :param job_id: Id of the analysis job
+    :return: The AnalysisRun row
+    """
+    username, timestamp, filename = upload_parts(file_path)
+    upload = record_upload(db, username, timestamp, filename)
+    if result.get("duration_seconds") is not None:
+        upload.duration_seconds = result["duration_seconds"]
+
+    knee_angles = [s["min_knee_angle"] for s in result["segments"] if s.get("min_knee_angle") is not None]
+    run = AnalysisRun(
+        upload=upload,
+        job_id=job_id,
+        model_name=result.get("model_name"),
+        status=status,
+        rep_count=len(result["segments"]),
+        min_knee_angle=min(knee_angles) if knee_angles else None,
+    )
+    for segment in result["segments"]:
+        run.segments.append(Segment(
+            rep_index=segment["index"],
+            path=f"{url_prefix}/{os.path.basename(segment['file'])}",
+            start_frame=segment.get("start_frame"),
+            end_frame=segment.get("end_frame"),
+            duration_seconds=segment.get("duration_seconds"),
+            min_knee_angle=segment.get("min_knee_angle"),
+            min_hip_angle=segment.get("min_hip_angle"),
+            max_depth=segment.get("max_depth"),
+        ))
+    db.add(run)
+    db.commit()
+    return run
+
+
+def _upload_entry(upload):
+    latest_run = upload.runs[-1] if upload.runs else None
+    return {
+        "filename": upload.filename,
+        "path": upload.path,
+        "timestamp": upload.timestamp,
+        "size": upload.size_bytes,
+        "duration_seconds": upload.duration_seconds,
+        "rep_count": latest_run.rep_count if latest_run else None,
+        "min_knee_angle": latest_run.min_knee_angle if latest_run else None,
+        "segments": [
+            {
+                "index": s.rep_index,
+                "path": s.path,
+                "duration_seconds": s.duration_seconds,
+                "min_knee_angle": s.min_knee_angle,
+                "min_hip_angle": s.min_hip_angle,
+                "max_depth": s.max_depth,
+            }
+            for s in latest_run.segments
+        ] if latest_run else [],
+    }
+
+
+def list_history(db, username, page=1, page_size=DEFAULT_PAGE_SIZE):
+    """
+    One page of a user's uploads, newest first, with the metrics of their latest analysis.
+    :param db: SQLAlchemy session
+    :param page: 1-based page number
+    :param page_size: Uploads per page, capped at MAX_PAGE_SIZE
+    :return: (total number of uploads, list of upload entries)
+    """
+    page = max(page, 1)
+    page_size = min(max(page_size, 1), MAX_PAGE_SIZE)
+
+    # Served by ix_uploads_username_created_at
+    query = db.query(Upload).filter(Upload.username == username)
+    total = db.query(func.count(Upload.id)).filter(Upload.username == username).scalar()
+    uploads = (
+        query.options(selectinload(Upload.runs).selectinload(AnalysisRun.segments))
+        .order_by(Upload.created_at.desc(), Upload.id.desc())
+        .offset((page - 1) * page_size)
+        .limit(page_size)
+        .all()
+    )
+    return total, [_upload_entry(upload) for upload in uploads]
+
+
+def backfill(db, upload_root):
+    """
+    Import upload trees written before the catalog existed.
+    Videos directly under uploads/<user>/<timestamp>/ become uploads; annotated videos in
+    their segments/ directory become an imported analysis run without metrics.
+    :param upload_root: The uploads directory
+    :return: (uploads added, runs added)
+    """
+    added_uploads = added_runs = 0
+    for username in sorted(os.listdir(upload_root)):
+        user_dir = os.path.join(upload_root, username)
+        # Hidden directories are not users, e.g. the .incoming of partial uploads left by older versions
+        if username.startswith(".") or not os.path.isdir(user_dir):
+            continue
+        for timestamp in sorted(os.listdir(user_dir)):
+            upload_dir = os.path.join(user_dir, timestamp)
+            if not os.path.isdir(upload_dir):
+                continue
+            manifest = read_manifest(upload_dir) or {}
+            for filename in sorted(os.listdir(upload_dir)):
+                if not filename.endswith(VIDEO_EXTENSIONS):
+                    continue
+                existing = db.query(Upload.id).filter(
+                    Upload.username == username, Upload.timestamp == timestamp, Upload.filename == filename
+                ).first()
+                if existing is not None:
+                    continue
+
+                entry = manifest.get(filename, {})
+                size = entry.get("size", os.path.getsize(os.path.join(upload_dir, filename)))
+                upload = record_upload(db, username, timestamp, filename, size, entry.get("sha256"))
+                # Keep the history order of the original uploads rather than the import time
+                upload.created_at = datetime.utcfromtimestamp(os.path.getmtime(os.path.join(upload_dir, filename)))
+                db.commit()
+                added_uploads += 1
+
+                segment_dir = os.path.join(upload_dir, "segments")
+                annotated = sorted(
+                    (int(match.group(1)), match.group(0))
+                    for match in map(ANNOTATED_SEGMENT_PATTERN.match, os.listdir(segment_dir) if os.path.isdir(segment_dir) else [])
+                    if match
+                )
+                if annotated:
+                    run = AnalysisRun(upload=upload, status="imported", rep_count=len(annotated))
+                    for rep_index, name in annotated:
+                        run.segments.append(Segment(rep_index=rep_index, path=f"uploads/{username}/{timestamp}/segments/{name}"))
+                    db.add(run)
+                    db.commit()
+                    added_runs += 1
+    return added_uploads, added_runs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    backfill_parser = subparsers.add_parser("backfill", help="Import existing uploads/ trees into the catalog")
+    backfill_parser.add_argument("--uploads", default=os.path.join(os.getcwd(), "uploads"))
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        added_uploads, added_runs = backfill(db, args.uploads)
+    finally:
+        db.close()
+    print(f"Imported {added_uploads} uploads and {added_runs} analysis runs from {args.uploads}")
+
+
+if __name__ == "__main__":
+    main()
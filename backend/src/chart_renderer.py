@@ -0,0 +1,98 @@
+import math
+import cv2
+import numpy as np
+
+CHART_WIDTH = 500  # Width (in pixels) of the chart panel placed next to the video
+
+# Title, y label, y range, line colour (BGR) and legend of the three stacked charts
+CHART_SPECS = (
+    ("Shoulder Rising Speed", "Speed (px/s)", (-1000, 1000), (255, 0, 0), "Rise Speed (px/s)"),
+    ("Knee Angle Change", "Angle (degrees)", (0, 180), (0, 0, 255), "Knee Angle (degrees)"),
+    ("Hip Angle Change", "Angle (degrees)", (0, 180), (0, 128, 0), "Hip Angle (degrees)"),
+)
+
+MARGIN_LEFT = 62
+MARGIN_RIGHT = 14
+MARGIN_TOP = 26
+MARGIN_BOTTOM = 34
+
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+TEXT_COLOR = (0, 0, 0)
+GRID_COLOR = (220, 220, 220)
+AXIS_COLOR = (60, 60, 60)
+
+
+class ChartOverlay:
+    """
+    Incremental replacement for plot_dynamic_chart.
+    Axes, grid and labels are drawn once into a preallocated BGR panel at the output size;
+    each frame only draws the line segment from the previous data point to the new one.
+    """
+
+    def __init__(self, video_length_seconds, height, width=CHART_WIDTH):
+        self.video_length_seconds = max(video_length_seconds, 1e-6)
+        self.width = width
+        self.height = height
+        self.panel = np.full((height, width, 3), 255, dtype=np.uint8)
+        self.plot_areas = []
+        self.previous_points = [None] * len(CHART_SPECS)
+
+        row_height = height // len(CHART_SPECS)
+        for row, spec in enumerate(CHART_SPECS):
+            top = row * row_height
+            area = (MARGIN_LEFT, top + MARGIN_TOP, width - MARGIN_RIGHT, top + row_height - MARGIN_BOTTOM)
+            self.plot_areas.append(area)
+            self._draw_static(area, spec)
+
+    def _draw_static(self, area, spec):
+        title, y_label, (y_min, y_max), color, legend = spec
+        x0, y0, x1, y1 = area
+        panel = self.panel
+
+        # Grid lines and tick labels, five divisions on each axis
+        for i in range(5):
+            x = int(round(x0 + (x1 - x0) * i / 4))
+            y = int(round(y1 - (y1 - y0) * i / 4))
+            cv2.line(panel, (x, y0), (x, y1), GRID_COLOR, 1)
+            cv2.line(panel, (x0, y), (x1, y), GRID_COLOR, 1)
+            x_tick = self.video_length_seconds * i / 4
+            cv2.putText(panel, f"{x_tick:.1f}", (x - 10, y1 + 14), FONT, 0.35, TEXT_COLOR, 1, cv2.LINE_AA)
+            y_tick = y_min + (y_max - y_min) * i / 4
+            cv2.putText(panel, f"{y_tick:g}", (x0 - 40, y + 4), FONT, 0.35, TEXT_COLOR, 1, cv2.LINE_AA)
+
+        cv2.rectangle(panel, (x0, y0), (x1, y1), AXIS_COLOR, 1)
+        (title_width, _), _ = cv2.getTextSize(title, FONT, 0.5, 1)
+        cv2.putText(panel, title, ((x0 + x1 - title_width) // 2, y0 - 8), FONT, 0.5, TEXT_COLOR, 1, cv2.LINE_AA)
+        cv2.putText(panel, "Time (s)", ((x0 + x1) // 2 - 25, y1 + 28), FONT, 0.4, TEXT_COLOR, 1, cv2.LINE_AA)
+        cv2.putText(panel, y_label, (4, y0 - 8), FONT, 0.35, TEXT_COLOR, 1, cv2.LINE_AA)
+
+        # Legend in the top-right corner of the plot area
+        cv2.line(panel, (x1 - 170, y0 + 12), (x1 - 150, y0 + 12), color, 2)
+        cv2.putText(panel, legend, (x1 - 145, y0 + 16), FONT, 0.35, TEXT_COLOR, 1, cv2.LINE_AA)
+
+    def _to_pixel(self, area, y_range, t, value):
+        x0, y0, x1, y1 = area
+        y_min, y_max = y_range
+        t = min(max(t, 0.0), self.video_length_seconds)
+        value = min(max(value, y_min), y_max)
+        x = x0 + (x1 - x0) * t / self.video_length_seconds
+        y = y1 - (y1 - y0) * (value - y_min) / (y_max - y_min)
+        return int(round(x)), int(round(y))
+
+    def append(self, t, speed, knee_angle, hip_angle):
+        """
+        Add one data point to each chart.
+        :param t: Time of the frame in seconds
+        :param speed: Shoulder rising speed in px/s
+        :param knee_angle: Knee angle in degrees
+        :param hip_angle: Hip angle in degrees
+        :return: The chart panel (height x width BGR), updated in place
+        """
+        for row, value in enumerate((speed, knee_angle, hip_angle)):
+            if value is None or math.isnan(value):
+                continue
+            point = self._to_pixel(self.plot_areas[row], CHART_SPECS[row][2], t, float(value))
+            previous = self.previous_points[row]
+            cv2.line(self.panel, previous or point, point, CHART_SPECS[row][3], 2, cv2.LINE_AA)
+            self.previous_points[row] = point
+        return self.panel
@@ -0,0 +1,135 @@
+import os
+import shutil
+import subprocess
+import cv2
+import numpy as np
+
+# How raw squat clips are produced: "copy" cuts them out of the original video, "none" skips them
+RAW_CLIP_MODE = os.environ.get("RAW_CLIP_MODE", "copy")
+
+# Height of the video part of the annotated segment videos; 0 keeps the source height, larger values are ignored
+ANNOTATED_HEIGHT = int(os.environ.get("ANNOTATED_VIDEO_HEIGHT", "0"))
+# Bitrate of the annotated segment videos in kbit/s; 0 keeps the encoder default. OpenCV's writer has no
+# bitrate setting, so these are encoded by ffmpeg (libx264) when it is installed
+ANNOTATED_BITRATE_KBPS = int(os.environ.get("ANNOTATED_VIDEO_BITRATE_KBPS", "0"))
+
+FFMPEG = shutil.which("ffmpeg")
+
+
+def new_output_file(path):
+    # Unlink instead of truncating: the old file may be hard-linked into the analysis cache
+    if os.path.exists(path):
+        os.remove(path)
+    return path
+
+
+def annotated_frame_size(frame_width, frame_height, height=ANNOTATED_HEIGHT):
+    """
+    Size of the video part of an annotated segment video, next to which the chart panel is placed.
+    :param height: Requested output height, see ANNOTATED_HEIGHT
+    :return: (width, height); the source size unless a smaller height is requested, then scaled to even sizes
+    """
+    if height <= 0 or height >= frame_height:
+        return frame_width, frame_height
+    width = max(2, round(frame_width * height / frame_height / 2) * 2)
+    return width, max(2, height // 2 * 2)
+
+
+class FfmpegVideoWriter:
+    """
+    VideoWriter replacement piping raw BGR frames to ffmpeg, for encoder settings OpenCV does not expose.
+    """
+
+    def __init__(self, path, fps, size, bitrate_kbps):
+        width, height = size
+        command = [
+            FFMPEG, "-v", "error", "-y",
+            "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{width}x{height}", "-r", str(fps), "-i", "-",
+            # yuv420p needs even sizes
+            "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2", "-c:v", "libx264", "-b:v", f"{bitrate_kbps}k",
+            "-pix_fmt", "yuv420p", "-movflags", "+faststart",
+            new_output_file(path),
+        ]
+        self.path = path
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+    def write(self, frame):
+        self.process.stdin.write(memoryview(np.ascontiguousarray(frame)))
+
+    def release(self):
+        if self.process.stdin.closed:
+            return
+        self.process.stdin.close()
+        error = self.process.stderr.read()
+        if self.process.wait() != 0:
+            print(f"Encoding {self.path} failed: {error.decode(errors='replace').strip()}")
+
+
+def open_video_writer(path, fourcc, fps, size, bitrate_kbps=0):
+    """
+    Writer of a new video file: OpenCV's VideoWriter, or ffmpeg when a bitrate is requested and installed.
+    :param fourcc: Codec of the OpenCV writer; ffmpeg always encodes H.264
+    :param size: (width, height) of the frames
+    :param bitrate_kbps: Video bitrate in kbit/s, 0 for the encoder default
+    :return: Object with write(frame) and release()
+    """
+    if bitrate_kbps > 0:
+        if FFMPEG is not None:
+            return FfmpegVideoWriter(path, fps, size, bitrate_kbps)
+        print(f"ffmpeg is not installed, {path} is written at the default bitrate")
+    return cv2.VideoWriter(new_output_file(path), fourcc, fps, size)
+
+
+def stream_copy_clip(video_path, output_file, start_frame, end_frame, fps):
+    """
+    Cut [start_frame, end_frame) out of a video without re-encoding.
+    The clip starts at the keyframe at or before start_frame, so it can begin slightly early.
+    :return: True if ffmpeg produced the clip
+    """
+    if FFMPEG is None:
+        return False
+    command = [
+        FFMPEG, "-v", "error", "-y",
+        "-ss", f"{start_frame / fps:.3f}", "-i", video_path,
+        "-t", f"{(end_frame - start_frame) / fps:.3f}",
+        "-map", "0:v:0", "-c", "copy", "-avoid_negative_ts", "make_zero",
+        new_output_file(output_file),
+    ]
+    result = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        print(f"Stream copy of {output_file} failed: {result.stderr.decode(errors='replace').strip()}")
+        return False
+    return True
+
+
+def seek_copy_clip(video_path, output_file, start_frame, end_frame, fps, fourcc="mp4v"):
+    """
+    Seek to start_frame and write the frames up to end_frame; used where ffmpeg is not installed.
+    """
+    cap = cv2.VideoCapture(video_path)
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+    out = cv2.VideoWriter(new_output_file(output_file), cv2.VideoWriter_fourcc(*fourcc), fps, (width, height))
+    for _ in range(end_frame - start_frame):
+        ret, frame = cap.read()
+        if not ret:
+            break
+        out.write(frame)
+    out.release()
+    cap.release()
+
+
+def extract_clip(video_path, output_file, start_frame, end_frame, fps):
+    """
+    Build the raw clip of a segment from the original video, by stream copy when ffmpeg is available.
+    :param video_path: Path to the original video
+    :param output_file: Path of the clip
+    :param start_frame: First frame of the segment
+    :param end_frame: Frame after the last frame of the segment
+    :param fps: Frame rate of the original video
+    :return: output_file
+    """
+    if not stream_copy_clip(video_path, output_file, start_frame, end_frame, fps):
+        seek_copy_clip(video_path, output_file, start_frame, end_frame, fps)
+    return output_file
@@ -0,0 +1,356 @@
+import json
+import multiprocessing
+import os
+import sqlite3
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from src.metrics import observe_analysis, observe_failed_analysis
+
+# Analysis concurrency and backlog limits
+ANALYSIS_WORKERS = int(os.environ.get("ANALYSIS_WORKERS", "2"))
+ANALYSIS_QUEUE_DEPTH = int(os.environ.get("ANALYSIS_QUEUE_DEPTH", "8"))
+JOBS_DB_PATH = os.environ.get("JOBS_DB_PATH", os.path.join(os.getcwd(), "jobs.db"))
+ANALYSIS_CACHE_ENABLED = os.environ.get("ANALYSIS_CACHE_ENABLED", "1") == "1"
+
+# Minimum interval between progress writes from a worker
+PROGRESS_INTERVAL_SECONDS = 0.5
+
+ACTIVE_STATUSES = ("queued", "running")
+
+
+class QueueFullError(Exception):
+    """Raised when the analysis queue already holds the maximum number of jobs"""
+
+
+class JobStore:
+    """
+    SQLite-backed job table shared by the API process and the analysis workers.
+    Every call opens its own connection so the store can be used from any process.
+    """
+
+    def __init__(self, db_path=JOBS_DB_PATH):
+        self.db_path = db_path
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    username TEXT,
+                    params TEXT,
+                    status TEXT,
+                    frames_processed INTEGER DEFAULT 0,
+                    total_frames INTEGER DEFAULT 0,
+                    result TEXT,
+                    error TEXT,
+                    created_at REAL,
+                    updated_at REAL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_jobs_status ON jobs (status)")
+            # Ordered log of progress and per-rep events that the API streams to clients
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS job_events (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    job_id TEXT,
+                    type TEXT,
+                    data TEXT,
+                    created_at REAL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_job_events_job_seq ON job_events (job_id, seq)")
+            # Models loaded by each analysis worker, published by the workers themselves for GET /models
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS worker_models (
+                    pid INTEGER PRIMARY KEY,
+                    models TEXT,
+                    updated_at REAL
+                )
+            """)
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def create(self, username, params):
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, username, params, status, created_at, updated_at) VALUES (?, ?, ?, 'queued', ?, ?)",
+                (job_id, username, json.dumps(params), now, now),
+            )
+        return job_id
+
+    def update(self, job_id, **fields):
+        if "result" in fields:
+            fields["result"] = json.dumps(fields["result"])
+        fields["updated_at"] = time.time()
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        with self._connect() as conn:
+            conn.execute(f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+
+    def get(self, job_id):
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["params"] = json.loads(job["params"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def add_event(self, job_id, event_type, data):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO job_events (job_id, type, data, created_at) VALUES (?, ?, ?, ?)",
+                (job_id, event_type, json.dumps(data), time.time()),
+            )
+
+    def events(self, job_id, after_seq=0):
+        """
+        Events of a job recorded after the given sequence number, oldest first.
+        :return: List of (seq, type, data)
+        """
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT seq, type, data FROM job_events WHERE job_id = ? AND seq > ? ORDER BY seq", (job_id, after_seq)
+            ).fetchall()
+        return [(seq, event_type, json.loads(data)) for seq, event_type, data in rows]
+
+    def count_active(self):
+        with self._connect() as conn:
+            return conn.execute(
+                f"SELECT COUNT(*) FROM jobs WHERE status IN ({', '.join('?' * len(ACTIVE_STATUSES))})", ACTIVE_STATUSES
+            ).fetchone()[0]
+
+    def record_worker_models(self, pid, models):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO worker_models (pid, models, updated_at) VALUES (?, ?, ?)",
+                (pid, json.dumps(models), time.time()),
+            )
+
+    def worker_models(self):
+        """
+        Models loaded by each analysis worker, as last published by the worker.
+        :return: List of {"pid", "models", "updated_at"}
+        """
+        with self._connect() as conn:
+            rows = conn.execute("SELECT pid, models, updated_at FROM worker_models ORDER BY pid").fetchall()
+        return [{"pid": pid, "models": json.loads(models), "updated_at": updated_at} for pid, models, updated_at in rows]
+
+    def clear_worker_models(self):
+        """Forget the workers of a previous pool; the new workers publish their models as they start"""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM worker_models")
+
+    def fail_interrupted(self):
+        """Mark jobs left queued or running by a previous server process as failed"""
+        with self._connect() as conn:
+            conn.execute(
+                f"UPDATE jobs SET status = 'failed', error = 'Interrupted by server restart', updated_at = ? "
+                f"WHERE status IN ({', '.join('?' * len(ACTIVE_STATUSES))})",
+                (time.time(), *ACTIVE_STATUSES),
+            )
+
+
+def publish_worker_models(db_path):
+    # Written by the worker itself, so reading the stats never waits behind the analyses in the pool
+    from src.model_registry import model_stats
+    try:
+        JobStore(db_path).record_worker_models(os.getpid(), model_stats())
+    except sqlite3.Error as e:
+        print(f"Could not publish the models of worker {os.getpid()}: {e}")
+
+
+def _init_worker(db_path):
+    # Each analysis worker loads and warms up its own copy of the pose models
+    # A failure here would break the whole pool, so models are then loaded on first use instead
+    from src.model_registry import preload_pose_models
+    try:
+        preload_pose_models()
+    except Exception as e:
+        print(f"Pose model preload failed in worker {os.getpid()}: {e}")
+    publish_worker_models(db_path)
+
+
+def _worker_ready():
+    """No-op task; runs once the worker's initializer has finished"""
+
+
+def segment_event(segment, url_prefix):
+    """Client-facing view of a finished segment: its URL, frame range and metrics"""
+    return {
+        "index": segment["index"],
+        "url": f"{url_prefix}/{os.path.basename(segment['file'])}",
+        "start_frame": segment["start_frame"],
+        "end_frame": segment["end_frame"],
+        "duration_seconds": segment["duration_seconds"],
+        "min_knee_angle": segment["min_knee_angle"],
+        "min_hip_angle": segment["min_hip_angle"],
+        "max_depth": segment["max_depth"],
+    }
+
+
+def record_catalog_run(job_id, file_path, analysis, url_prefix):
+    # The videos are already written; a catalog failure is logged rather than failing the job
+    from database import SessionLocal
+    from src.catalog import record_analysis
+    db = SessionLocal()
+    try:
+        record_analysis(db, file_path, analysis, url_prefix, job_id=job_id)
+    except Exception as e:
+        print(f"Could not record analysis {job_id} in the catalog: {e}")
+    finally:
+        db.close()
+
+
+def run_analysis_job(job_id, db_path, file_path, output_dir, url_prefix, model_size=None, raw_clips=True, profile=False,
+                     track_lifter=False):
+    """
+    Run one squat analysis inside a worker process and record its progress and result.
+    :param job_id: Id of the job in the store
+    :param db_path: Path of the job store database
+    :param file_path: Path to the uploaded video
+    :param output_dir: Directory to store the segment videos
+    :param url_prefix: URL prefix under which output_dir is served
+    :param model_size: Pose model size (n/s/m/l)
+    :param raw_clips: Also cut the unannotated clips of each segment
+    :param profile: Sample the stacks of every thread during the analysis and save them (see StackSampler)
+    :param track_lifter: Follow the lifter across frames instead of taking the largest person in each frame
+    :return: Job result with the segment URLs, plus the metrics of the run for the API process
+    """
+    from src.process_and_analyze_video import analyze_video
+    from src.analysis_cache import AnalysisCache
+    from src.metrics import job_metrics
+    from src.profiling import StackSampler, profile_path
+
+    store = JobStore(db_path)
+    store.update(job_id, status="running")
+    store.add_event(job_id, "status", {"status": "running"})
+    last_write = 0.0
+    last_reported = None
+
+    def report_progress(frames_processed, total_frames):
+        nonlocal last_write, last_reported
+        now = time.monotonic()
+        if (frames_processed, total_frames) == last_reported:
+            return
+        if now - last_write >= PROGRESS_INTERVAL_SECONDS or frames_processed >= total_frames:
+            last_write = now
+            last_reported = (frames_processed, total_frames)
+            store.update(job_id, frames_processed=frames_processed, total_frames=total_frames)
+            store.add_event(job_id, "progress", {"frames_processed": frames_processed, "total_frames": total_frames})
+
+    def report_segment(segment):
+        store.add_event(job_id, "segment", segment_event(segment, url_prefix))
+
+    sampler = StackSampler().start() if profile else None
+    start = time.perf_counter()
+    try:
+        analysis = analyze_video(
+            file_path, output_dir, model_size=model_size, progress_callback=report_progress, raw_clips=raw_clips,
+            cache=AnalysisCache() if ANALYSIS_CACHE_ENABLED else None, segment_callback=report_segment,
+            track_lifter=track_lifter,
+        )
+    except Exception as e:
+        store.update(job_id, status="failed", error=str(e))
+        store.add_event(job_id, "failed", {"error": str(e)})
+        raise
+    finally:
+        if sampler is not None:
+            sampler.stop()
+        # The job may have loaded a model size the worker had not preloaded
+        publish_worker_models(db_path)
+    seconds = time.perf_counter() - start
+
+    record_catalog_run(job_id, file_path, analysis, url_prefix)
+
+    result = {"segments": [f"{url_prefix}/{os.path.basename(f)}" for f in analysis["segment_files"]]}
+    if sampler is not None:
+        result["profile"] = sampler.save(profile_path(job_id))
+    store.update(job_id, status="done", result=result)
+    store.add_event(job_id, "done", result)
+    return {**result, "metrics": job_metrics(analysis, seconds)}
+
+
+class JobQueue:
+    """
+    Bounded process pool that runs analysis jobs in the background.
+    """
+
+    def __init__(self, store, max_workers=ANALYSIS_WORKERS, max_queue_depth=ANALYSIS_QUEUE_DEPTH):
+        self.store = store
+        self.max_workers = max_workers
+        self.max_queue_depth = max_queue_depth
+        self.executor = self._create_executor()
+        self.futures = {}
+
+    def _create_executor(self):
+        self.store.clear_worker_models()
+        # Spawned rather than forked: forking after torch/OpenCV threads have started can deadlock the child
+        executor = ProcessPoolExecutor(
+            max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn"), initializer=_init_worker,
+            initargs=(self.store.db_path,),
+        )
+        # The pool only starts a worker when a task finds none idle, so one no-op per worker starts them all
+        # now and the models warm up before the first request rather than during it
+        for _ in range(self.max_workers):
+            executor.submit(_worker_ready)
+        return executor
+
+    def _submit(self, fn, *args):
+        try:
+            return self.executor.submit(fn, *args)
+        except BrokenProcessPool:
+            # A worker died (e.g. killed for memory); replace the pool rather than failing every later job
+            self.executor = self._create_executor()
+            return self.executor.submit(fn, *args)
+
+    def submit(self, username, file_path, output_dir, url_prefix, model_size=None, raw_clips=True, profile=False,
+               track_lifter=False):
+        """
+        Queue an analysis job.
+        :return: (job_id, future) of the submitted job
+        :raises QueueFullError: If the running and waiting jobs exceed the configured limits
+        """
+        if self.store.count_active() >= self.max_workers + self.max_queue_depth:
+            raise QueueFullError("Analysis queue is full, please retry later")
+
+        params = {
+            "file_path": file_path, "output_dir": output_dir, "model_size": model_size, "raw_clips": raw_clips,
+            "profile": profile, "track_lifter": track_lifter,
+        }
+        job_id = self.store.create(username, params)
+        future = self._submit(
+            run_analysis_job, job_id, self.store.db_path, file_path, output_dir, url_prefix, model_size, raw_clips, profile,
+            track_lifter,
+        )
+        self.futures[job_id] = future
+        future.add_done_callback(lambda f: self._on_done(job_id, f))
+        return job_id, future
+
+    def _on_done(self, job_id, future):
+        self.futures.pop(job_id, None)
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is None:
+            observe_analysis(future.result()["metrics"])
+            return
+        observe_failed_analysis()
+        # A worker that died (e.g. out of memory) cannot record its own failure
+        if self.store.get(job_id)["status"] in ACTIVE_STATUSES:
+            self.store.update(job_id, status="failed", error=str(error))
+            self.store.add_event(job_id, "failed", {"error": str(error)})
+
+    def depth(self):
+        return self.store.count_active()
+
+    def worker_model_stats(self):
+        return self.store.worker_models()
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,125 @@
+import json
+import os
+import shutil
+import time
+import numpy as np
+from src.segmentation import SquatSegmenter
+from src.kinematics import select_sides, side_joints, compute_kinematics, segment_metrics
+
+# Keypoints of an upload are kept in uploads/<user>/<timestamp>/keypoints/<filename>/
+KEYPOINT_DIR = "keypoints"
+
+
+def keypoint_dir(video_path):
+    """Directory holding the stored keypoints of a video"""
+    return os.path.join(os.path.dirname(video_path), KEYPOINT_DIR, os.path.basename(video_path))
+
+
+def has_keypoints(video_path):
+    return os.path.exists(os.path.join(keypoint_dir(video_path), "meta.json"))
+
+
+def save_keypoints(video_path, persons, valid, fps, **meta):
+    """
+    Store the selected keypoints of every frame next to the video.
+    Coordinates and confidences are stored as float16 (sub-pixel below 1024 px, about 1 px up to 2048 px),
+    one .npy file per column so each can be memory-mapped on its own.
+    :param video_path: Path to the analyzed video
+    :param persons: Keypoints of the lifter per frame, shape (frames, 17, 3)
+    :param valid: Per-frame detection mask
+    :param fps: Frame rate of the video, used for the frame timestamps
+    :param meta: Extra metadata stored in meta.json (model name, inference size, ...)
+    """
+    target = keypoint_dir(video_path)
+    temp_dir = f"{target}.tmp{os.getpid()}"
+    shutil.rmtree(temp_dir, ignore_errors=True)
+    os.makedirs(temp_dir)
+
+    np.save(os.path.join(temp_dir, "xy.npy"), persons[..., :2].astype(np.float16))
+    np.save(os.path.join(temp_dir, "confidence.npy"), persons[..., 2].astype(np.float16))
+    np.save(os.path.join(temp_dir, "valid.npy"), np.asarray(valid, dtype=bool))
+    np.save(os.path.join(temp_dir, "timestamps.npy"), (np.arange(len(valid)) / fps).astype(np.float32))
+    with open(os.path.join(temp_dir, "meta.json"), "w") as f:
+        json.dump({"fps": fps, "frame_count": len(valid), "created_at": time.time(), **meta}, f)
+
+    # Replace a previous analysis in one step so readers never see a partial store
+    shutil.rmtree(target, ignore_errors=True)
+    os.replace(temp_dir, target)
+
+
+class KeypointTrack:
+    """
+    Memory-mapped view of the stored keypoints of a video; slicing only reads the requested frames.
+    """
+
+    def __init__(self, video_path):
+        directory = keypoint_dir(video_path)
+        with open(os.path.join(directory, "meta.json")) as f:
+            self.meta = json.load(f)
+        self.xy = np.load(os.path.join(directory, "xy.npy"), mmap_mode="r")
+        self.confidence = np.load(os.path.join(directory, "confidence.npy"), mmap_mode="r")
+        self.valid = np.load(os.path.join(directory, "valid.npy"), mmap_mode="r")
+        self.timestamps = np.load(os.path.join(directory, "timestamps.npy"), mmap_mode="r")
+        self.fps = self.meta["fps"]
+
+    def __len__(self):
+        return len(self.valid)
+
+    def persons(self, start=0, end=None):
+        """Keypoints of frames [start, end) as float32 (x, y, confidence), shape (frames, 17, 3)"""
+        return np.concatenate(
+            (self.xy[start:end].astype(np.float32), self.confidence[start:end, :, None].astype(np.float32)), axis=2
+        )
+
+
+def load_keypoints(video_path):
+    """
+    Open the stored keypoints of a video.
+    :return: KeypointTrack, or None if the video has not been analyzed since keypoints were stored
+    """
+    if not has_keypoints(video_path):
+        return None
+    return KeypointTrack(video_path)
+
+
+def _json_floats(values):
+    # Angles are NaN where a joint pair coincides; JSON has no NaN
+    return [float(v) if np.isfinite(v) else None for v in values]
+
+
+def frame_metrics(track, start=0, end=None):
+    """
+    Joint angles and shoulder speed of the frames [start, end) with a detection.
+    :return: Dict with frame indices and the per-frame metrics as lists
+    """
+    valid = np.asarray(track.valid[start:end])
+    frames = np.flatnonzero(valid) + start
+    metrics = compute_kinematics(track.persons(start, end)[valid], track.fps)
+    return {
+        "frames": frames.tolist(),
+        "knee_angle": _json_floats(metrics["knee_angle"]),
+        "hip_angle": _json_floats(metrics["hip_angle"]),
+        "shoulder_velocity": _json_floats(metrics["shoulder_velocity"]),
+        "depth": _json_floats(metrics["depth"]),
+    }
+
+
+def resegment(track, **thresholds):
+    """
+    Run squat segmentation and the per-rep metrics on stored keypoints, without the model or the video.
+    :param thresholds: SquatSegmenter thresholds (threshold_down, threshold_up, threshold_horizontal, extra_frames)
+    :return: List of segments with their metrics
+    """
+    segmenter = SquatSegmenter(verbose=False, **thresholds)
+    persons = track.persons()
+    valid = np.asarray(track.valid)
+    shoulders = side_joints(persons, select_sides(persons))[:, 0]
+    for index in np.flatnonzero(valid):
+        segmenter.update(int(index), shoulders[index])
+    segments = segmenter.finish(len(valid))
+
+    for segment in segments:
+        segment_range = slice(segment["start_frame"], segment["end_frame"])
+        metrics = compute_kinematics(persons[segment_range][valid[segment_range]], track.fps, side="first")
+        segment.update(segment_metrics(metrics, track.fps))
+    return segments
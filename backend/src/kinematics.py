@@ -0,0 +1,134 @@
+import numpy as np
+
+# COCO keypoint indices of shoulder, hip, knee and ankle on each body side
+LEFT_JOINTS = [5, 11, 13, 15]
+RIGHT_JOINTS = [6, 12, 14, 16]
+
+
+def bounding_box_areas(keypoints):
+    """
+    Area of the keypoint bounding box of every person in every frame.
+    :param keypoints: Array of shape (frames, persons, 17, 2+)
+    :return: Array of shape (frames, persons)
+    """
+    xy = keypoints[..., :2]
+    extent = xy.max(axis=-2) - xy.min(axis=-2)
+    return extent[..., 0] * extent[..., 1]
+
+
+def select_largest_person(keypoints):
+    """
+    Select the person with the largest bounding box in every frame.
+    :param keypoints: Array of shape (frames, persons, 17, 3)
+    :return: persons of shape (frames, 17, 3) and a (frames,) mask of frames where somebody was detected
+    """
+    frames = keypoints.shape[0]
+    if keypoints.shape[1] == 0:
+        return np.zeros((frames,) + keypoints.shape[2:], dtype=keypoints.dtype), np.zeros(frames, dtype=bool)
+
+    areas = bounding_box_areas(keypoints)
+    largest = areas.argmax(axis=1)
+    persons = keypoints[np.arange(frames), largest]
+    valid = areas[np.arange(frames), largest] > 0
+    return persons, valid
+
+
+def select_sides(persons, side=None):
+    """
+    Choose which body side to measure in every frame.
+    :param persons: Array of shape (frames, 17, 2+)
+    :param side: None to pick the side facing the camera per frame, 'left' or 'right' to force a side,
+                 or 'first' to keep the side chosen on the first frame
+    :return: Boolean array of shape (frames,), True where the left side is used
+    """
+    if side == "left":
+        return np.ones(len(persons), dtype=bool)
+    if side == "right":
+        return np.zeros(len(persons), dtype=bool)
+
+    left_x = persons[:, LEFT_JOINTS, 0].mean(axis=1)
+    right_x = persons[:, RIGHT_JOINTS, 0].mean(axis=1)
+    is_left = left_x < right_x
+    if side == "first" and len(is_left):
+        is_left[:] = is_left[0]
+    return is_left
+
+
+def side_joints(persons, is_left):
+    """
+    Gather shoulder, hip, knee and ankle of the selected side.
+    :param persons: Array of shape (frames, 17, 2+)
+    :param is_left: Boolean array of shape (frames,)
+    :return: Array of shape (frames, 4, 2) ordered shoulder, hip, knee, ankle
+    """
+    indices = np.where(is_left[:, None], LEFT_JOINTS, RIGHT_JOINTS)
+    return np.take_along_axis(persons[..., :2], indices[..., None], axis=1)
+
+
+def joint_angles(a, b, c):
+    """
+    Angle at b (in degrees) formed by a-b-c for every row; NaN where a segment has zero length.
+    :param a: Array of shape (frames, 2)
+    :param b: Array of shape (frames, 2)
+    :param c: Array of shape (frames, 2)
+    :return: Array of shape (frames,)
+    """
+    v1 = (a - b).astype(np.float64)
+    v2 = (c - b).astype(np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cos_angle = (v1 * v2).sum(axis=1) / (np.linalg.norm(v1, axis=1) * np.linalg.norm(v2, axis=1))
+        return np.degrees(np.arccos(cos_angle))
+
+
+def compute_kinematics(persons, fps, side=None):
+    """
+    Compute per-frame squat metrics for one person's keypoint track.
+    :param persons: Array of shape (frames, 17, 2+) with no missing frames
+    :param fps: Frame rate used to convert shoulder displacement to px/s
+    :param side: Side selection passed to select_sides
+    :return: Dict of arrays: is_left, shoulder/hip/knee/ankle (frames, 2), knee_angle, hip_angle,
+             shoulder_velocity (rise speed in px/s, 0 on the first frame) and depth (hip below knee in px)
+    """
+    is_left = select_sides(persons, side)
+    joints = side_joints(persons, is_left)
+    shoulder, hip, knee, ankle = joints[:, 0], joints[:, 1], joints[:, 2], joints[:, 3]
+
+    # Image y grows downwards, so a rising shoulder has a decreasing y
+    shoulder_velocity = np.zeros(len(persons))
+    shoulder_velocity[1:] = (shoulder[:-1, 1] - shoulder[1:, 1]) * fps
+
+    return {
+        "is_left": is_left,
+        "shoulder": shoulder,
+        "hip": hip,
+        "knee": knee,
+        "ankle": ankle,
+        "knee_angle": joint_angles(hip, knee, ankle),
+        "hip_angle": joint_angles(shoulder, hip, knee),
+        "shoulder_velocity": shoulder_velocity,
+        "depth": hip[:, 1] - knee[:, 1],
+    }
+
+
+def _reduce_or_none(reduce, values):
+    # Frames without usable joints are NaN; a rep with none at all is stored as missing rather than NaN
+    values = np.asarray(values, dtype=np.float64)
+    if not np.isfinite(values).any():
+        return None
+    return float(reduce(values[np.isfinite(values)]))
+
+
+def segment_metrics(metrics, fps):
+    """
+    Summarize the per-frame kinematics of a rep.
+    :param metrics: Output of compute_kinematics for the segment
+    :param fps: Frame rate of the source video
+    :return: Dict with duration_seconds, min_knee_angle, min_hip_angle and max_depth
+    """
+    # Depth is hip_y - knee_y in image coordinates, so the deepest point is the largest value
+    return {
+        "duration_seconds": len(metrics["knee_angle"]) / fps,
+        "min_knee_angle": _reduce_or_none(np.min, metrics["knee_angle"]),
+        "min_hip_angle": _reduce_or_none(np.min, metrics["hip_angle"]),
+        "max_depth": _reduce_or_none(np.max, metrics["depth"]),
+    }
@@ -0,0 +1,370 @@
+"""
+Live squat analysis of a camera stream.
+
+Frames arrive from a WebSocket client or a capture source (RTSP camera, webcam or a video file played
+back in real time) and are analyzed one at a time with the same lifter selection and squat state machine
+as the upload analysis. Only the newest frame is kept: a frame that arrives while the previous one is still
+being analyzed replaces any frame still waiting, and a frame older than the latency budget is skipped.
+
+Run against a local source from the backend directory:
+    python -m src.live rtsp://camera.local/stream --model-size n
+    python -m src.live uploads/alice/20250101_120000/squat.mp4 --latency-ms 300
+"""
+import argparse
+import asyncio
+import json
+import os
+import threading
+import time
+import cv2
+import numpy as np
+from src.pose_inference import infer_keypoints, DEFAULT_IMGSZ
+from src.segmentation import SquatSegmenter
+from src.kinematics import select_largest_person, compute_kinematics, segment_metrics
+from src.tracking import LifterTracker, TRACK_LIFTER
+
+# Frames older than this when the analysis is ready for them are skipped
+LIVE_LATENCY_MS = int(os.environ.get("LIVE_LATENCY_MS", "500"))
+# Live sessions served at once; each one keeps a thread busy with pose inference
+LIVE_MAX_SESSIONS = int(os.environ.get("LIVE_MAX_SESSIONS", "2"))
+
+# Interval of the "stats" events
+STATS_INTERVAL_SECONDS = 1.0
+# Undelivered events after which per-frame "angles" events are dropped for a slow client
+LIVE_EVENT_BACKLOG = 30
+
+
+# Sessions of the same model size share the registry's instance, and a model must not predict from two
+# threads at once, so inference is serialized per model
+_inference_locks = {}
+_inference_locks_guard = threading.Lock()
+
+
+def inference_lock(model):
+    """Lock held around every inference of this model by a live session"""
+    with _inference_locks_guard:
+        return _inference_locks.setdefault(id(model), threading.Lock())
+
+
+def _json_float(value):
+    # Angles are NaN where a joint pair coincides; JSON has no NaN
+    return float(value) if np.isfinite(value) else None
+
+
+class LatestFrame:
+    """
+    Single-slot handoff between a frame producer and the analysis thread.
+    put() replaces a frame that has not been taken yet, so the consumer always gets the newest one.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._item = None
+        self._closed = False
+        self.error = None
+        self.received = 0
+        self.replaced = 0
+
+    def put(self, frame, captured_at=None):
+        """
+        :param frame: Decoded BGR frame, or encoded image bytes decoded by the consumer
+        :param captured_at: time.monotonic() of the capture, defaults to now
+        """
+        with self._condition:
+            if self._item is not None:
+                self.replaced += 1
+            self._item = (self.received, frame, time.monotonic() if captured_at is None else captured_at)
+            self.received += 1
+            self._condition.notify()
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def close(self, error=None):
+        """
+        :param error: Why the producer stopped early, reported to the client by run_live
+        """
+        with self._condition:
+            self._closed = True
+            if error is not None and self.error is None:
+                self.error = error
+            self._condition.notify()
+
+    def take(self, timeout=None):
+        """
+        Wait for the next frame.
+        :return: (frame_index, frame, captured_at), or None once the producer closed the slot (or on timeout)
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self._item is not None or self._closed, timeout)
+            item, self._item = self._item, None
+            return item
+
+
+class LiveAnalyzer:
+    """
+    Incremental squat analysis of single frames.
+    process() returns the events of a frame: "angles" with the joint angles of the lifter, "rep_start" when
+    a squat starts and "rep" with the boundaries and metrics of a finished rep.
+    """
+
+    def __init__(self, model, imgsz=DEFAULT_IMGSZ, track_lifter=TRACK_LIFTER, segmenter=None):
+        self.model = model
+        self.lock = inference_lock(model)
+        self.imgsz = imgsz
+        self.tracker = LifterTracker() if track_lifter else None
+        self.segmenter = segmenter or SquatSegmenter(verbose=False)
+        self.previous_shoulder = None
+        # Lifter keypoints and capture times of the frames of the rep in progress
+        self.rep_persons = []
+        self.rep_times = []
+
+    def _select(self, frame):
+        frames = frame[None]
+        with self.lock:
+            if self.tracker is not None:
+                return self.tracker.infer(self.model, frames, self.imgsz)
+            keypoints = infer_keypoints(self.model, frames, self.imgsz)
+        return select_largest_person(keypoints)
+
+    def _rep_event(self, segment):
+        persons = np.stack(self.rep_persons)
+        elapsed = self.rep_times[-1] - self.rep_times[0]
+        # Frames may have been skipped, so the rate is the one actually analyzed
+        fps = (len(persons) - 1) / elapsed if elapsed > 0 else 1.0
+        metrics = segment_metrics(compute_kinematics(persons, fps, side="first"), fps)
+        metrics["duration_seconds"] = elapsed
+        self.rep_persons, self.rep_times = [], []
+        return {"type": "rep", "index": segment["index"], "start_frame": segment["start_frame"],
+                "end_frame": segment["end_frame"], **metrics}
+
+    def process(self, frame_index, frame, captured_at):
+        """
+        Analyze one frame.
+        :param frame_index: Index of the frame in the source, counting skipped frames
+        :param frame: BGR frame
+        :param captured_at: time.monotonic() of the capture
+        :return: List of events
+        """
+        persons, valid = self._select(frame)
+        if not valid[0]:
+            return [{"type": "angles", "frame": frame_index, "detected": False, "recording": self.segmenter.recording}]
+
+        metrics = compute_kinematics(persons, 1.0)
+        shoulder = metrics["shoulder"][0]
+        # Image y grows downwards, so a rising shoulder has a decreasing y
+        velocity = 0.0
+        if self.previous_shoulder is not None and captured_at > self.previous_shoulder[1]:
+            velocity = (self.previous_shoulder[0] - shoulder[1]) / (captured_at - self.previous_shoulder[1])
+        self.previous_shoulder = (shoulder[1], captured_at)
+
+        events = []
+        state = self.segmenter.update(frame_index, shoulder)
+        if state == "start":
+            events.append({"type": "rep_start", "index": self.segmenter.current_segment["index"], "start_frame": frame_index})
+        if self.segmenter.recording or state == "end":
+            self.rep_persons.append(persons[0])
+            self.rep_times.append(captured_at)
+        events.append({
+            "type": "angles",
+            "frame": frame_index,
+            "detected": True,
+            "recording": self.segmenter.recording,
+            "knee_angle": _json_float(metrics["knee_angle"][0]),
+            "hip_angle": _json_float(metrics["hip_angle"][0]),
+            "depth": _json_float(metrics["depth"][0]),
+            "shoulder_velocity": float(velocity),
+        })
+        if state == "end":
+            events.append(self._rep_event(self.segmenter.segments[-1]))
+        return events
+
+    def finish(self, frame_count):
+        """Close a rep still in progress when the stream ends; returns its events"""
+        open_segment = self.segmenter.current_segment if self.segmenter.recording else None
+        self.segmenter.finish(frame_count)
+        if open_segment is None or not self.rep_persons:
+            return []
+        return [self._rep_event(open_segment)]
+
+
+def decode_image(data):
+    """Decode an encoded image (JPEG, PNG, ...) sent by a client; None if it is not an image"""
+    return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+
+def run_live(frames, analyzer, emit, stop, latency_budget=LIVE_LATENCY_MS / 1000):
+    """
+    Analyze the newest frame of a LatestFrame slot until it is closed or stop is set.
+    :param frames: LatestFrame fed by the producer
+    :param analyzer: LiveAnalyzer
+    :param emit: Callable receiving each event dict; a final "end" event is emitted when the loop stops,
+                 preceded by an "error" event when the producer closed the slot with an error
+    :param stop: threading.Event ending the loop
+    :param latency_budget: Seconds after capture from which a frame is skipped instead of analyzed
+    """
+    processed = stale = 0
+    latency_total = 0.0
+    last_stats = time.monotonic()
+    last_index = -1
+
+    def stats_event():
+        return {
+            "type": "stats",
+            "received": frames.received,
+            "processed": processed,
+            "dropped_replaced": frames.replaced,
+            "dropped_stale": stale,
+            "mean_latency_ms": round(1000 * latency_total / processed, 1) if processed else None,
+        }
+
+    try:
+        while not stop.is_set():
+            item = frames.take(timeout=STATS_INTERVAL_SECONDS)
+            if item is None:
+                if frames.closed:
+                    break
+                continue
+            frame_index, frame, captured_at = item
+            last_index = frame_index
+
+            if time.monotonic() - captured_at > latency_budget:
+                stale += 1
+                continue
+            if isinstance(frame, bytes):
+                frame = decode_image(frame)
+                if frame is None:
+                    continue
+
+            events = analyzer.process(frame_index, frame, captured_at)
+            latency = time.monotonic() - captured_at
+            processed += 1
+            latency_total += latency
+            for event in events:
+                event["latency_ms"] = round(1000 * latency, 1)
+                emit(event)
+
+            if time.monotonic() - last_stats >= STATS_INTERVAL_SECONDS:
+                last_stats = time.monotonic()
+                emit(stats_event())
+
+        if frames.error is not None:
+            emit({"type": "error", "error": frames.error})
+        for event in analyzer.finish(last_index + 1):
+            emit(event)
+        emit(stats_event())
+    finally:
+        emit({"type": "end"})
+
+
+def capture_source(source, frames, stop, realtime=True):
+    """
+    Read a capture source into a LatestFrame slot until it ends or stop is set, then close the slot.
+    A source that cannot be opened or read closes the slot with the error, which run_live sends as an
+    "error" event, since nothing would see an exception raised in the capture thread.
+    :param source: RTSP/HTTP URL, video file path or webcam index
+    :param realtime: Pace video files at their frame rate so they behave like a camera
+    """
+    cap = cv2.VideoCapture(source)
+    if not cap.isOpened():
+        frames.close(f"Cannot open live source {source}")
+        return
+    is_file = isinstance(source, str) and os.path.isfile(source)
+    interval = 1 / (cap.get(cv2.CAP_PROP_FPS) or 30)
+    next_frame = time.monotonic()
+    try:
+        while not stop.is_set():
+            ret, frame = cap.read()
+            if not ret:
+                break
+            frames.put(frame)
+            if realtime and is_file:
+                next_frame += interval
+                time.sleep(max(next_frame - time.monotonic(), 0))
+    except Exception as e:
+        frames.close(f"Live source {source} failed: {e}")
+    finally:
+        cap.release()
+        frames.close()
+
+
+def start_live_session(source_or_frames, analyzer, emit, latency_budget=LIVE_LATENCY_MS / 1000, realtime=True):
+    """
+    Start the capture (for a source) and analysis threads of a live session.
+    :param source_or_frames: Capture source for capture_source, or a LatestFrame fed by the caller
+    :return: (frames, stop, threads); set stop and close frames to end the session
+    """
+    frames = source_or_frames if isinstance(source_or_frames, LatestFrame) else LatestFrame()
+    stop = threading.Event()
+    threads = [threading.Thread(target=run_live, args=(frames, analyzer, emit, stop, latency_budget),
+                                name="live-analysis", daemon=True)]
+    if not isinstance(source_or_frames, LatestFrame):
+        threads.append(threading.Thread(target=capture_source, args=(source_or_frames, frames, stop, realtime),
+                                        name="live-capture", daemon=True))
+    for thread in threads:
+        thread.start()
+    return frames, stop, threads
+
+
+class EventBridge:
+    """
+    Hands the events of the analysis thread to an asyncio consumer (a WebSocket or event stream).
+    While the client is behind, per-frame "angles" events are dropped; rep, stats and end events are always kept.
+    """
+
+    def __init__(self, loop, max_backlog=LIVE_EVENT_BACKLOG):
+        self.loop = loop
+        self.max_backlog = max_backlog
+        self.queue = asyncio.Queue()
+        self.dropped = 0
+
+    def _put(self, event):
+        if event["type"] == "angles" and self.queue.qsize() >= self.max_backlog:
+            self.dropped += 1
+            return
+        self.queue.put_nowait(event)
+
+    def emit(self, event):
+        """Thread-safe; pass as the emit callable of run_live"""
+        try:
+            self.loop.call_soon_threadsafe(self._put, event)
+        except RuntimeError:
+            # The event loop is gone (server shutting down)
+            pass
+
+    async def get(self):
+        return await self.queue.get()
+
+
+def main():
+    from src.model_registry import get_pose_model
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", help="RTSP/HTTP URL, video file or webcam index")
+    parser.add_argument("--model-size", help="Pose model size (n/s/m/l)")
+    parser.add_argument("--imgsz", type=int, default=DEFAULT_IMGSZ)
+    parser.add_argument("--track-lifter", action="store_true", default=TRACK_LIFTER)
+    parser.add_argument("--latency-ms", type=int, default=LIVE_LATENCY_MS)
+    parser.add_argument("--no-realtime", action="store_true", help="Read video files as fast as possible")
+    parser.add_argument("--angles", action="store_true", help="Also print the per-frame angle events")
+    args = parser.parse_args()
+
+    source = int(args.source) if args.source.isdigit() else args.source
+    analyzer = LiveAnalyzer(get_pose_model(args.model_size), args.imgsz, args.track_lifter)
+
+    def emit(event):
+        if event["type"] != "angles" or args.angles:
+            print(json.dumps(event), flush=True)
+
+    _, stop, threads = start_live_session(source, analyzer, emit, args.latency_ms / 1000, not args.no_realtime)
+    try:
+        for thread in threads:
+            thread.join()
+    except KeyboardInterrupt:
+        stop.set()
+        threads[0].join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+import threading
+
+# Content type of the Prometheus text exposition format served on /metrics
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Bucket upper bounds in seconds: HTTP requests, analysis jobs and single pipeline stages
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+ANALYSIS_BUCKETS = (1, 2.5, 5, 10, 20, 30, 60, 120, 300, 600, 1200)
+STAGE_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300, 600)
+
+_registry = []
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra is not None:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """
+    A named metric with a fixed set of label names; one value (or histogram) per combination of label values.
+    Metrics register themselves and are rendered by render_metrics().
+    """
+
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _samples(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            lines.extend(self._samples())
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in self._values.items()]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=REQUEST_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value)
+
+    def _samples(self):
+        lines = []
+        for key, (counts, total) in self._values.items():
+            # Bucket counts are cumulative, so the +Inf bucket is the number of observations
+            for bound, count in zip(self.buckets, counts):
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', _format_value(bound)))} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {counts[-1]}")
+        return lines
+
+
+def render_metrics():
+    """Every registered metric in the Prometheus text format"""
+    return "\n".join(line for metric in _registry for line in metric.render()) + "\n"
+
+
+# Metrics of the API process; analysis workers report theirs with each finished job (see observe_analysis)
+REQUEST_SECONDS = Histogram(
+    "squat_http_request_duration_seconds", "Time until the response of an HTTP request started",
+    ("method", "route", "status"), REQUEST_BUCKETS,
+)
+REQUESTS_IN_PROGRESS = Gauge("squat_http_requests_in_progress", "HTTP requests being handled", ("method",))
+ANALYSIS_JOBS = Counter("squat_analysis_jobs_total", "Finished analysis jobs", ("status", "cached"))
+ANALYSIS_SECONDS = Histogram(
+    "squat_analysis_duration_seconds", "Wall time of an analysis job in its worker", ("cached",), ANALYSIS_BUCKETS,
+)
+STAGE_SECONDS = Histogram(
+    "squat_pipeline_stage_seconds",
+    "Time a pipeline stage spent per analysis: working (busy), starved by the previous stage (input_wait) "
+    "or blocked by the next one (output_wait)",
+    ("stage", "state"), STAGE_BUCKETS,
+)
+FRAMES_PROCESSED = Counter("squat_frames_processed_total", "Video frames analyzed")
+FRAMES_INFERRED = Counter("squat_frames_inferred_total", "Video frames that went through pose inference")
+SEGMENTS_FOUND = Counter("squat_segments_total", "Squat segments found by analysis jobs")
+MODEL_LOAD_SECONDS = Gauge("squat_model_load_seconds", "Time to load the pose model weights in a worker", ("model", "pid"))
+MODEL_WARMUP_SECONDS = Gauge("squat_model_warmup_seconds", "Time of the warm-up inference of a pose model", ("model", "pid"))
+QUEUE_DEPTH = Gauge("squat_analysis_queue_depth", "Analysis jobs queued or running")
+QUEUE_CAPACITY = Gauge("squat_analysis_queue_capacity", "Analysis jobs accepted before new ones are rejected")
+
+
+def observe_request(method, route, status, seconds):
+    REQUEST_SECONDS.observe(seconds, method=method, route=route, status=status)
+
+
+def job_metrics(analysis, seconds):
+    """
+    Measurements of one analysis, collected in the worker and returned with the job result.
+    :param analysis: Result of analyze_video
+    :param seconds: Wall time of the analysis
+    :return: Dict of plain values that can cross the process boundary
+    """
+    from src.model_registry import model_stats
+    return {
+        "seconds": seconds,
+        "cached": "stage_stats" not in analysis,
+        "frames": analysis["frame_count"],
+        "inferred_frames": analysis.get("sampling", {}).get("inferred_frames", 0),
+        "segments": len(analysis["segments"]),
+        "stages": analysis.get("stage_stats", []),
+        "models": model_stats(),
+    }
+
+
+def observe_analysis(metrics):
+    """Record the metrics of a finished job (see job_metrics) in the API process"""
+    cached = "true" if metrics["cached"] else "false"
+    ANALYSIS_JOBS.inc(status="done", cached=cached)
+    ANALYSIS_SECONDS.observe(metrics["seconds"], cached=cached)
+    if not metrics["cached"]:
+        FRAMES_PROCESSED.inc(metrics["frames"])
+        FRAMES_INFERRED.inc(metrics["inferred_frames"])
+    SEGMENTS_FOUND.inc(metrics["segments"])
+    for stats in metrics["stages"]:
+        for state in ("busy", "input_wait", "output_wait"):
+            STAGE_SECONDS.observe(stats[f"{state}_seconds"], stage=stats["stage"], state=state)
+    for model in metrics["models"]:
+        MODEL_LOAD_SECONDS.set(model["load_seconds"], model=model["model"], pid=model["pid"])
+        MODEL_WARMUP_SECONDS.set(model["warmup_seconds"], model=model["model"], pid=model["pid"])
+
+
+def observe_failed_analysis():
+    ANALYSIS_JOBS.inc(status="failed", cached="false")
+
@@ -0,0 +1,157 @@
+import os
+import threading
+import time
+
+# Pose model sizes that can be selected per request
+MODEL_SIZES = ("n", "s", "m", "l")
+DEFAULT_MODEL_SIZE = os.environ.get("POSE_MODEL_SIZE", "l")
+# Inference backend: "torch" runs the YOLO weights, "onnx" an exported copy through ONNX Runtime (see onnx_backend)
+BACKENDS = ("torch", "onnx")
+POSE_BACKEND = os.environ.get("POSE_BACKEND", "torch")
+
+# Models are cached per worker process, keyed by the path of the weights (or exported model) they run
+_models = {}
+_stats = {}
+_lock = threading.Lock()
+
+
+def model_path_for_size(size):
+    """
+    Resolve the weights file for a pose model size.
+    :param size: One of MODEL_SIZES
+    :return: Path to the YOLO pose weights
+    """
+    if size not in MODEL_SIZES:
+        raise ValueError(f"Unknown pose model size '{size}', expected one of {', '.join(MODEL_SIZES)}")
+    return os.path.join(os.getcwd(), "models", f"yolov8{size}-pose.pt")
+
+
+def resolve_model_path(size=None, yolo_model_path=None):
+    """
+    Weights path used for a request, from an explicit path or a model size.
+    """
+    if yolo_model_path is not None:
+        return yolo_model_path
+    return model_path_for_size(size or DEFAULT_MODEL_SIZE)
+
+
+def model_artifact_path(yolo_model_path, backend=None):
+    """
+    File a backend runs for a weights path: the weights themselves, or the exported model cached next to them.
+    """
+    backend = backend or POSE_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown pose backend '{backend}', expected one of {', '.join(BACKENDS)}")
+    if backend == "onnx":
+        from src.onnx_backend import exported_model_path, ONNX_QUANTIZATION
+        return exported_model_path(yolo_model_path, ONNX_QUANTIZATION)
+    return yolo_model_path
+
+
+def pose_model_name(size=None, yolo_model_path=None, backend=None):
+    """
+    Name of the model used for a request, e.g. yolov8l-pose.pt or yolov8l-pose.int8.onnx.
+    Cached analyses and stored keypoints are keyed by it, since backends differ slightly in their output.
+    """
+    return os.path.basename(model_artifact_path(resolve_model_path(size, yolo_model_path), backend))
+
+
+def register_pose_model(yolo_model_path, model):
+    """
+    Make an already constructed model (or a test double) the shared model for a weights path.
+    """
+    with _lock:
+        _models[yolo_model_path] = model
+
+
+def _warm_up(model, imgsz=640):
+    # Run one dummy frame so the first real request does not pay for lazy initialisation
+    import numpy as np
+    from src.pose_inference import infer_keypoints
+
+    dummy_frames = np.zeros((1, imgsz, imgsz, 3), dtype=np.uint8)
+    start = time.perf_counter()
+    infer_keypoints(model, dummy_frames, imgsz)
+    return time.perf_counter() - start
+
+
+def _load(yolo_model_path, backend):
+    if backend == "onnx":
+        from src.onnx_backend import OnnxPoseModel, export_onnx, ONNX_QUANTIZATION
+        return OnnxPoseModel(export_onnx(yolo_model_path, ONNX_QUANTIZATION))
+
+    # Imported on first load so processes that never run a model do not pay for torch
+    from ultralytics import YOLO
+    return YOLO(yolo_model_path)
+
+
+def get_pose_model(size=None, yolo_model_path=None, backend=None):
+    """
+    Return the shared, warmed-up pose model for this process, loading it on first use.
+    :param size: Model size (n/s/m/l), ignored when yolo_model_path is given
+    :param yolo_model_path: Explicit path to YOLO weights
+    :param backend: One of BACKENDS, defaults to the POSE_BACKEND setting; the ONNX model is exported on first use
+    :return: A YOLO model instance, or an OnnxPoseModel
+    """
+    backend = backend or POSE_BACKEND
+    yolo_model_path = resolve_model_path(size, yolo_model_path)
+    artifact_path = model_artifact_path(yolo_model_path, backend)
+
+    model = _models.get(artifact_path)
+    if model is not None:
+        return model
+
+    with _lock:
+        model = _models.get(artifact_path)
+        if model is not None:
+            return model
+
+        # Check if the YOLO model path exists
+        if not os.path.exists(yolo_model_path):
+            raise FileNotFoundError(f"YOLO model not found at {yolo_model_path}")
+
+        start = time.perf_counter()
+        model = _load(yolo_model_path, backend)
+        load_seconds = time.perf_counter() - start
+        warmup_seconds = _warm_up(model)
+
+        _models[artifact_path] = model
+        _stats[artifact_path] = {
+            "model": os.path.basename(artifact_path),
+            "backend": backend,
+            "path": artifact_path,
+            "load_seconds": round(load_seconds, 4),
+            "warmup_seconds": round(warmup_seconds, 4),
+            "loaded_at": time.time(),
+            "pid": os.getpid(),
+        }
+        print(f"Loaded pose model {artifact_path} in {load_seconds:.2f}s (warm-up {warmup_seconds:.2f}s)")
+        return model
+
+
+def preload_pose_models(sizes=None):
+    """
+    Load and warm up pose models, typically at worker startup.
+    Sizes whose weights are missing are skipped rather than failing startup.
+    :param sizes: Iterable of model sizes, defaults to the POSE_MODEL_PRELOAD environment variable
+    :return: List of sizes that were loaded
+    """
+    if sizes is None:
+        sizes = [s.strip() for s in os.environ.get("POSE_MODEL_PRELOAD", DEFAULT_MODEL_SIZE).split(",") if s.strip()]
+
+    loaded = []
+    for size in sizes:
+        try:
+            get_pose_model(size)
+            loaded.append(size)
+        except FileNotFoundError as e:
+            print(f"Skipping preload of pose model '{size}': {e}")
+    return loaded
+
+
+def model_stats():
+    """
+    Report load and warm-up latency of the models loaded in this process.
+    :return: List of per-model statistics
+    """
+    return list(_stats.values())
@@ -0,0 +1,186 @@
+"""
+ONNX Runtime backend for the pose model, for CPU-only analysis hosts.
+
+The YOLO weights are exported once to ONNX with dynamic batch and input size, optionally quantized, and
+cached next to the weights: models/yolov8l-pose.pt -> models/yolov8l-pose.onnx, yolov8l-pose.int8.onnx or
+yolov8l-pose.fp16.onnx. An artifact older than its weights is exported again. Exporting needs ultralytics
+and onnx; inference only needs onnxruntime.
+
+Pre- and post-processing follow the ultralytics predictor (letterbox to a multiple of the stride, confidence
+filter, NMS, keypoints mapped back to the frame), so the keypoints match the PyTorch path up to numerics;
+benchmarks/report_onnx_parity.py measures the difference.
+"""
+import os
+import shutil
+import tempfile
+import cv2
+import numpy as np
+from src.pose_inference import DEFAULT_IMGSZ, NUM_KEYPOINTS
+from src.preprocess import letterbox_params, PAD_VALUE
+
+QUANTIZATIONS = ("none", "int8", "fp16")
+# Quantization of the exported model: int8 (dynamic, 4x smaller weights) or fp16 (half the size); whether
+# either is faster than fp32 depends on the CPU, so check with benchmarks/report_onnx_parity.py
+ONNX_QUANTIZATION = os.environ.get("POSE_ONNX_QUANTIZATION", "none")
+# Threads of one inference; 0 lets ONNX Runtime use every core. Lower it when several analysis workers share a host
+ONNX_THREADS = int(os.environ.get("POSE_ONNX_THREADS", "0"))
+
+# Prediction defaults of ultralytics
+CONF_THRESHOLD = 0.25
+IOU_THRESHOLD = 0.7
+MAX_DETECTIONS = 300
+MAX_NMS_CANDIDATES = 30000
+
+
+def exported_model_path(weights_path, quantization="none"):
+    """
+    Path of the exported model cached for a weights file.
+    :param quantization: One of QUANTIZATIONS
+    """
+    if quantization not in QUANTIZATIONS:
+        raise ValueError(f"Unknown quantization '{quantization}', expected one of {', '.join(QUANTIZATIONS)}")
+    suffix = "" if quantization == "none" else f".{quantization}"
+    return f"{os.path.splitext(weights_path)[0]}{suffix}.onnx"
+
+
+def _is_fresh(path, weights_path):
+    return os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(weights_path)
+
+
+def export_onnx(weights_path, quantization=ONNX_QUANTIZATION, imgsz=DEFAULT_IMGSZ):
+    """
+    Export the pose weights to ONNX (and quantize them) unless an up-to-date artifact is cached.
+    Artifacts are written under a temporary name and renamed, so workers exporting at the same time
+    only duplicate work and never read a partial file.
+    :param weights_path: Path of the YOLO .pt weights
+    :param quantization: One of QUANTIZATIONS
+    :param imgsz: Input size traced during export; the exported model accepts any multiple of the stride
+    :return: Path of the exported model
+    """
+    path = exported_model_path(weights_path, quantization)
+    if _is_fresh(path, weights_path):
+        return path
+
+    model_dir = os.path.dirname(os.path.abspath(weights_path))
+    fp32_path = exported_model_path(weights_path)
+    if not _is_fresh(fp32_path, weights_path):
+        from ultralytics import YOLO
+
+        # Exported next to a private copy, since ultralytics always writes beside the weights it loaded
+        with tempfile.TemporaryDirectory(dir=model_dir) as tmp:
+            weights_copy = shutil.copy2(weights_path, os.path.join(tmp, os.path.basename(weights_path)))
+            exported = YOLO(weights_copy).export(format="onnx", dynamic=True, imgsz=imgsz)
+            os.replace(exported, fp32_path)
+        print(f"Exported {weights_path} to {fp32_path}")
+    if quantization == "none":
+        return path
+
+    fd, tmp_path = tempfile.mkstemp(suffix=".onnx", dir=model_dir)
+    os.close(fd)
+    try:
+        if quantization == "int8":
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+            quantize_dynamic(fp32_path, tmp_path, weight_type=QuantType.QUInt8)
+        else:
+            import onnx
+            from onnxruntime.transformers.float16 import convert_float_to_float16
+            # Inputs and outputs stay float32, so pre- and post-processing do not change
+            onnx.save(convert_float_to_float16(onnx.load(fp32_path), keep_io_types=True), tmp_path)
+        # mkstemp creates the file readable by its owner only
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    print(f"Quantized {fp32_path} to {path} ({quantization})")
+    return path
+
+
+def nms(boxes, scores, iou_threshold):
+    """
+    Greedy non-maximum suppression.
+    :param boxes: Array of shape (n, 4) as (x0, y0, x1, y1)
+    :param scores: Array of shape (n,)
+    :return: Indices of the kept boxes, highest score first
+    """
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    order = np.argsort(-scores, kind="stable")
+    keep = []
+    while len(order):
+        best, rest = order[0], order[1:]
+        keep.append(best)
+        width = np.clip(np.minimum(boxes[best, 2], boxes[rest, 2]) - np.maximum(boxes[best, 0], boxes[rest, 0]), 0, None)
+        height = np.clip(np.minimum(boxes[best, 3], boxes[rest, 3]) - np.maximum(boxes[best, 1], boxes[rest, 1]), 0, None)
+        intersection = width * height
+        iou = intersection / (areas[best] + areas[rest] - intersection + 1e-7)
+        order = rest[iou <= iou_threshold]
+    return np.array(keep, dtype=np.int64)
+
+
+class OnnxPoseModel:
+    """
+    Exported YOLO pose model run by ONNX Runtime on the CPU.
+    infer_keypoints uses predict_keypoints directly, so the rest of the analysis does not depend on the backend.
+    """
+
+    def __init__(self, path, threads=ONNX_THREADS, conf=CONF_THRESHOLD, iou=IOU_THRESHOLD, max_detections=MAX_DETECTIONS):
+        import onnxruntime
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads > 0:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+        self.session = onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+        self.path = path
+        self.conf = conf
+        self.iou = iou
+        self.max_detections = max_detections
+
+    def _preprocess(self, frames, imgsz):
+        batch, frame_height, frame_width = frames.shape[:3]
+        new_width, new_height, left, top, input_width, input_height = letterbox_params(frame_height, frame_width, imgsz)
+        blob = np.full((batch, 3, input_height, input_width), PAD_VALUE / 255, dtype=np.float32)
+        for i, frame in enumerate(frames):
+            if (new_width, new_height) != (frame_width, frame_height):
+                frame = cv2.resize(frame, (new_width, new_height), interpolation=cv2.INTER_LINEAR)
+            # BGR HWC uint8 -> RGB CHW in [0, 1]
+            np.multiply(frame[..., ::-1].transpose(2, 0, 1), 1 / 255, out=blob[i, :, top:top + new_height, left:left + new_width],
+                        casting="unsafe")
+        scale = (new_width / frame_width, new_height / frame_height)
+        return blob, scale, (left, top)
+
+    def _postprocess(self, prediction, scale, pad, frame_height, frame_width):
+        # prediction: (4 box + 1 person score + 17 * 3 keypoint values, anchors)
+        candidates = prediction.T
+        candidates = candidates[candidates[:, 4] > self.conf]
+        if len(candidates) > MAX_NMS_CANDIDATES:
+            candidates = candidates[np.argsort(-candidates[:, 4], kind="stable")[:MAX_NMS_CANDIDATES]]
+        if not len(candidates):
+            return np.zeros((0, NUM_KEYPOINTS, 3), dtype=np.float32)
+
+        xy, wh = candidates[:, :2], candidates[:, 2:4] / 2
+        boxes = np.concatenate((xy - wh, xy + wh), axis=1)
+        keep = nms(boxes, candidates[:, 4], self.iou)[:self.max_detections]
+
+        keypoints = candidates[keep, 5:].reshape(len(keep), NUM_KEYPOINTS, 3).copy()
+        keypoints[..., 0] = np.clip((keypoints[..., 0] - pad[0]) / scale[0], 0, frame_width)
+        keypoints[..., 1] = np.clip((keypoints[..., 1] - pad[1]) / scale[1], 0, frame_height)
+        return keypoints
+
+    def predict_keypoints(self, frames, imgsz=DEFAULT_IMGSZ):
+        """
+        Pose inference on a batch of frames.
+        :param frames: Array of BGR frames with shape (batch, height, width, 3)
+        :param imgsz: Inference resolution, as for the YOLO model
+        :return: Keypoints with shape (batch, persons, 17, 3), zero-padded and ordered by confidence like infer_keypoints
+        """
+        blob, scale, pad = self._preprocess(frames, imgsz)
+        predictions = self.session.run(None, {self.input_name: blob})[0]
+        people = [self._postprocess(p, scale, pad, *frames.shape[1:3]) for p in predictions]
+        max_persons = max(len(p) for p in people)
+        batch = np.zeros((len(frames), max_persons, NUM_KEYPOINTS, 3), dtype=np.float32)
+        for i, keypoints in enumerate(people):
+            batch[i, :len(keypoints)] = keypoints
+        return batch
@@ -0,0 +1,186 @@
+import os
+import queue
+import threading
+import time
+
+# Items buffered between two stages; a full queue blocks the stage in front of it
+PIPELINE_QUEUE_SIZE = int(os.environ.get("PIPELINE_QUEUE_SIZE", "4"))
+
+# Interval at which blocked stages check whether the pipeline was stopped
+POLL_SECONDS = 0.1
+
+_END = object()
+
+
+class _Stopped(Exception):
+    """Unwinds a stage when another stage failed"""
+
+
+class StageStats:
+    """
+    Timing counters of one stage.
+    busy_seconds is time spent in the stage's own work, input_wait_seconds time spent waiting for the
+    previous stage (starved) and output_wait_seconds time spent blocked on a full queue (backpressure).
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.busy_seconds = 0.0
+        self.input_wait_seconds = 0.0
+        self.output_wait_seconds = 0.0
+
+    def as_dict(self):
+        return {
+            "stage": self.name,
+            "items": self.items,
+            "busy_seconds": round(self.busy_seconds, 4),
+            "input_wait_seconds": round(self.input_wait_seconds, 4),
+            "output_wait_seconds": round(self.output_wait_seconds, 4),
+        }
+
+
+class Pipeline:
+    """
+    A source and a chain of stages, each running in its own thread and connected by bounded queues,
+    so decoding, inference, rendering and encoding overlap and throughput is set by the slowest stage.
+    The first exception raised by any stage stops every other stage and is re-raised by run().
+    """
+
+    def __init__(self, queue_size=PIPELINE_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._stages = []
+        self._stats = []
+        self._stop = threading.Event()
+        self._error = None
+        self._error_lock = threading.Lock()
+
+    def source(self, name, produce):
+        """
+        Set the first stage.
+        :param produce: Callable returning an iterable of items
+        """
+        self._stages.insert(0, (name, produce, None, 0))
+        self._stats.insert(0, StageStats(name))
+        return self
+
+    def stage(self, name, process, finish=None, queue_size=None):
+        """
+        Append a stage.
+        :param process: Callable (item, emit) handling one item; emit(item) passes results to the next stage
+        :param finish: Optional callable (emit) run once the previous stage is exhausted
+        :param queue_size: Size of the queue feeding this stage, defaults to the pipeline's queue_size;
+                           keep it small for large items such as batches of frames
+        """
+        self._stages.append((name, process, finish, queue_size or self.queue_size))
+        self._stats.append(StageStats(name))
+        return self
+
+    def max_items_in_flight(self, last_stage=None):
+        """
+        Upper bound on source items held at once by the stages up to last_stage (default: all of them):
+        every queue full and every stage holding one.
+        """
+        names = [stage[0] for stage in self._stages]
+        stages = self._stages[:names.index(last_stage) + 1] if last_stage is not None else self._stages
+        return sum(stage[3] for stage in stages) + len(stages) + 1
+
+    def stats(self):
+        return [stats.as_dict() for stats in self._stats]
+
+    def _put(self, q, item, stats):
+        start = time.perf_counter()
+        try:
+            while True:
+                if self._stop.is_set():
+                    raise _Stopped()
+                try:
+                    q.put(item, timeout=POLL_SECONDS)
+                    return
+                except queue.Full:
+                    continue
+        finally:
+            stats.output_wait_seconds += time.perf_counter() - start
+
+    def _get(self, q, stats):
+        start = time.perf_counter()
+        try:
+            while True:
+                if self._stop.is_set():
+                    raise _Stopped()
+                try:
+                    return q.get(timeout=POLL_SECONDS)
+                except queue.Empty:
+                    continue
+        finally:
+            stats.input_wait_seconds += time.perf_counter() - start
+
+    def _run_stage(self, index, inbox, outbox):
+        name, process, finish, _ = self._stages[index]
+        stats = self._stats[index]
+
+        def emit(item):
+            if outbox is not None:
+                self._put(outbox, item, stats)
+
+        def timed(fn, *args):
+            # Time blocked in emit() is backpressure, not work done by this stage
+            waited = stats.output_wait_seconds
+            start = time.perf_counter()
+            result = fn(*args)
+            stats.busy_seconds += time.perf_counter() - start - (stats.output_wait_seconds - waited)
+            return result
+
+        try:
+            if inbox is None:
+                items = iter(process())
+                while True:
+                    item = timed(next, items, _END)
+                    if item is _END:
+                        break
+                    stats.items += 1
+                    emit(item)
+            else:
+                while True:
+                    item = self._get(inbox, stats)
+                    if item is _END:
+                        break
+                    timed(process, item, emit)
+                    stats.items += 1
+                if finish is not None:
+                    timed(finish, emit)
+            emit(_END)
+        except _Stopped:
+            pass
+        except BaseException as e:
+            with self._error_lock:
+                if self._error is None:
+                    self._error = e
+            self._stop.set()
+
+    def run(self):
+        """
+        Run every stage to completion.
+        :return: Per-stage timing statistics
+        :raises: The first exception raised by a stage
+        """
+        queues = [queue.Queue(stage[3]) for stage in self._stages[1:]]
+        threads = []
+        for index, (name, _, _, _) in enumerate(self._stages):
+            inbox = queues[index - 1] if index > 0 else None
+            outbox = queues[index] if index < len(queues) else None
+            thread = threading.Thread(target=self._run_stage, args=(index, inbox, outbox), name=f"pipeline-{name}", daemon=True)
+            threads.append(thread)
+            thread.start()
+
+        try:
+            for thread in threads:
+                thread.join()
+        except BaseException:
+            # Interrupted while waiting: let the stages unwind instead of leaving them blocked on a queue
+            self._stop.set()
+            raise
+
+        if self._error is not None:
+            raise self._error
+        return self.stats()
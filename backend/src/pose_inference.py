@@ -0,0 +1,95 @@
+import os
+import cv2
+import numpy as np
+
+# Frames per model call and inference resolution, overridable per call
+DEFAULT_BATCH_SIZE = int(os.environ.get("POSE_BATCH_SIZE", "8"))
+DEFAULT_IMGSZ = int(os.environ.get("POSE_IMGSZ", "640"))
+
+NUM_KEYPOINTS = 17
+
+
+class FrameBatcher:
+    """
+    Decodes a video into reusable (batch_size, height, width, 3) frame buffers.
+    Buffers are used in turn, so a batch stays valid until `buffers` more batches have been requested;
+    with the default single buffer callers must finish with a batch before requesting another.
+    """
+
+    def __init__(self, cap, batch_size=DEFAULT_BATCH_SIZE, buffers=1):
+        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        self.cap = cap
+        self.buffers = np.empty((buffers, batch_size, height, width, 3), dtype=np.uint8)
+
+    def __iter__(self):
+        batch_size = self.buffers.shape[1]
+        slot = 0
+        while True:
+            buffer = self.buffers[slot]
+            slot = (slot + 1) % len(self.buffers)
+            count = 0
+            while count < batch_size:
+                # Decode straight into the preallocated slot
+                target = buffer[count]
+                ret, frame = self.cap.read(target)
+                if not ret:
+                    break
+                if frame is not target:
+                    # OpenCV allocated a new array, e.g. for a frame whose size differs from the reported one
+                    # (rotated phone videos); the slot would otherwise keep stale pixels
+                    if frame.shape == target.shape:
+                        np.copyto(target, frame)
+                    else:
+                        cv2.resize(frame, (target.shape[1], target.shape[0]), dst=target)
+                count += 1
+            if count == 0:
+                return
+            yield buffer[:count]
+            if count < batch_size:
+                return
+
+
+def infer_keypoints(model, frames, imgsz=DEFAULT_IMGSZ):
+    """
+    Run pose inference on a batch of frames with a single model call.
+    :param model: YOLO pose model, or an exported model with predict_keypoints (see onnx_backend)
+    :param frames: Array of BGR frames with shape (batch, height, width, 3)
+    :param imgsz: Inference resolution
+    :return: Keypoints with shape (batch, persons, 17, 3) as (x, y, confidence), zero-padded
+             where a frame has fewer detections than the most crowded frame
+    """
+    if hasattr(model, "predict_keypoints"):
+        return model.predict_keypoints(frames, imgsz)
+
+    results = model(list(frames), imgsz=imgsz, verbose=False)
+    person_data = [r.keypoints.data if r.keypoints is not None else None for r in results]
+    counts = [len(data) if data is not None else 0 for data in person_data]
+    max_persons = max(counts, default=0)
+
+    if max_persons == 0:
+        return np.zeros((len(frames), 0, NUM_KEYPOINTS, 3), dtype=np.float32)
+
+    # Pad on the device and move the whole batch to the host in one transfer
+    reference = next(data for data in person_data if data is not None and len(data))
+    batch = reference.new_zeros((len(frames), max_persons, NUM_KEYPOINTS, 3))
+    for i, data in enumerate(person_data):
+        if counts[i]:
+            batch[i, :counts[i]] = data
+    return batch.cpu().numpy()
+
+
+def run_pose_inference(cap, model, batch_size=DEFAULT_BATCH_SIZE, imgsz=DEFAULT_IMGSZ):
+    """
+    Decode a video in batches and run pose inference on each batch.
+    :param cap: Opened VideoCapture
+    :param model: YOLO pose model
+    :param batch_size: Frames per model call
+    :param imgsz: Inference resolution
+    :return: Generator of (first_frame_index, frames, keypoints) per batch; frames is the reused decode buffer
+    """
+    frame_index = 0
+    for frames in FrameBatcher(cap, batch_size):
+        keypoints = infer_keypoints(model, frames, imgsz)
+        yield frame_index, frames, keypoints
+        frame_index += len(frames)
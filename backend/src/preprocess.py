@@ -0,0 +1,85 @@
+"""
+Downscaling of decoded frames for pose inference.
+
+The pose model only ever sees frames letterboxed to the inference size, so batches larger than that are
+resized once, in their own pipeline stage and into reused buffers, and inference gets the small copy.
+The letterbox is the one the ultralytics predictor and onnx_backend build themselves, so the model input
+does not change; Letterbox.to_source maps the keypoints back to the coordinates of the source frames.
+Rendering keeps reading the full-resolution video.
+"""
+import os
+import cv2
+import numpy as np
+
+# Letterbox frames larger than the inference size before inference instead of inside the model call;
+# 0 passes the full-resolution frames to the model
+DOWNSCALE_INPUT = os.environ.get("POSE_DOWNSCALE_INPUT", "1") == "1"
+
+MODEL_STRIDE = 32
+PAD_VALUE = 114
+
+
+def letterbox_params(frame_height, frame_width, imgsz):
+    """
+    Resize and padding of the ultralytics letterbox with minimal padding (rect inference).
+    :return: (resized width, resized height, left, top, input width, input height)
+    """
+    ratio = min(imgsz / frame_height, imgsz / frame_width)
+    new_width, new_height = round(frame_width * ratio), round(frame_height * ratio)
+    pad_width = ((imgsz - new_width) % MODEL_STRIDE) / 2
+    pad_height = ((imgsz - new_height) % MODEL_STRIDE) / 2
+    left, right = round(pad_width - 0.1), round(pad_width + 0.1)
+    top, bottom = round(pad_height - 0.1), round(pad_height + 0.1)
+    return new_width, new_height, left, top, new_width + left + right, new_height + top + bottom
+
+
+class Letterbox:
+    """
+    Letterboxes batches of frames of one size into reusable (batch_size, input_height, input_width, 3) buffers.
+    Buffers are used in turn like FrameBatcher's, so a batch stays valid until `buffers` more have been made.
+    """
+
+    def __init__(self, frame_height, frame_width, imgsz, batch_size, buffers=1):
+        new_width, new_height, left, top, input_width, input_height = letterbox_params(frame_height, frame_width, imgsz)
+        self.frame_width = frame_width
+        self.frame_height = frame_height
+        self.size = (new_width, new_height)
+        self.pad = (left, top)
+        self.scale = (new_width / frame_width, new_height / frame_height)
+        # The padding is filled once; frames are only ever resized into the area inside it
+        self.buffers = np.full((buffers, batch_size, input_height, input_width, 3), PAD_VALUE, dtype=np.uint8)
+        self.slot = 0
+
+    def __call__(self, frames):
+        """
+        :param frames: Array of BGR frames with shape (batch, frame_height, frame_width, 3), batch <= batch_size
+        :return: The letterboxed batch, a view of the next buffer
+        """
+        buffer = self.buffers[self.slot][:len(frames)]
+        self.slot = (self.slot + 1) % len(self.buffers)
+        (left, top), (new_width, new_height) = self.pad, self.size
+        for frame, inner in zip(frames, buffer[:, top:top + new_height, left:left + new_width]):
+            cv2.resize(frame, self.size, dst=inner, interpolation=cv2.INTER_LINEAR)
+        return buffer
+
+    def to_source(self, keypoints):
+        """
+        Map keypoints inferred on letterboxed frames to source frame coordinates.
+        :param keypoints: Array of shape (..., 17, 3) as (x, y, confidence); zero rows stay zero
+        :return: A new array of the same shape
+        """
+        keypoints = keypoints.copy()
+        for axis, limit in ((0, self.frame_width), (1, self.frame_height)):
+            keypoints[..., axis] = np.clip((keypoints[..., axis] - self.pad[axis]) / self.scale[axis], 0, limit)
+        return keypoints
+
+
+def input_letterbox(frame_height, frame_width, imgsz, batch_size, buffers=1, enabled=DOWNSCALE_INPUT):
+    """
+    Letterbox downscaling frames of this size for inference, or None where frames go to the model as they are:
+    when disabled, or when they already fit the inference size (the model upscales those itself, and doing
+    it here would only make the batches bigger).
+    """
+    if not enabled or max(frame_height, frame_width) <= imgsz:
+        return None
+    return Letterbox(frame_height, frame_width, imgsz, batch_size, buffers)
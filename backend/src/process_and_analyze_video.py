@@ -1,200 +1,564 @@
 import cv2
-from ultralytics import YOLO
+import hashlib
+import json
 import os
+import threading
+import time
 import numpy as np
-from ultralytics import YOLO
-from src.utils import calculate_bounding_box_area, calculate_distance, determine_side, plot_dynamic_chart, calculate_angle
-
-def process_and_analyze_video(video_path, output_dir, yolo_model_path=None):
+from src.model_registry import get_pose_model, pose_model_name
+from src.analysis_cache import cache_key, video_content_hash, CACHE_FORMAT
+from src.pose_inference import FrameBatcher, DEFAULT_BATCH_SIZE, DEFAULT_IMGSZ
+from src.sampling import AdaptiveSampler, SAMPLE_EVERY
+from src.tracking import LifterTracker, TRACK_LIFTER
+from src.render_pool import RENDER_WORKERS, render_concurrency, submit_render
+from src.pipeline import Pipeline
+from src.preprocess import input_letterbox
+from src.clips import (extract_clip, open_video_writer, annotated_frame_size, RAW_CLIP_MODE, ANNOTATED_HEIGHT,
+                       ANNOTATED_BITRATE_KBPS)
+from src.keypoint_store import save_keypoints, has_keypoints
+from src.segmentation import SquatSegmenter
+from src.chart_renderer import ChartOverlay, CHART_WIDTH
+from src.kinematics import select_sides, side_joints, compute_kinematics, segment_metrics
+
+# Written into the output directory by every analysis, so batch re-analysis can tell which videos are out of date
+ANALYSIS_STAMP = "analysis.json"
+
+def analysis_params(imgsz, sample_every, raw_clips, segmenter, roi_crop=None, output_height=0, output_bitrate_kbps=0):
+    """
+    Every setting besides the video and the model that changes the result of analyze_video.
+    Settings left at their neutral value are omitted, so adding one does not change existing keys.
+    :param segmenter: SquatSegmenter whose thresholds are used
+    :param roi_crop: ROI crop setting of the LifterTracker, None without lifter tracking
+    :return: Dict used for cache keys and analysis fingerprints
+    """
+    params = {"imgsz": imgsz, "sample_every": sample_every, "raw_clips": raw_clips, **segmenter.params()}
+    if roi_crop is not None:
+        params.update(track_lifter=True, roi_crop=roi_crop)
+    if output_height > 0:
+        params.update(output_height=output_height)
+    if output_bitrate_kbps > 0:
+        params.update(output_bitrate_kbps=output_bitrate_kbps)
+    return params
+
+def analysis_fingerprint(model_name, params):
+    """Hex digest identifying the model and settings of an analysis, independently of the video"""
+    # Shares the cache format, so outputs of an older format are reported as stale and reprocessed
+    payload = json.dumps({"format": CACHE_FORMAT, "model": model_name, "params": params}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+def write_analysis_stamp(output_dir, video_path, model_name, params, result):
+    """Record the model and settings the outputs of a video were produced with (see ANALYSIS_STAMP)"""
+    # Uploads started within the same second share a directory, so entries are keyed by filename
+    stamps = read_analysis_stamp(output_dir) or {}
+    stamps[os.path.basename(video_path)] = {
+        "fingerprint": analysis_fingerprint(model_name, params),
+        "model_name": model_name,
+        "params": params,
+        "frame_count": result["frame_count"],
+        "rep_count": len(result["segments"]),
+        "analyzed_at": time.time(),
+    }
+    temp_path = os.path.join(output_dir, f"{ANALYSIS_STAMP}.tmp{os.getpid()}")
+    with open(temp_path, "w") as f:
+        json.dump(stamps, f)
+    os.replace(temp_path, os.path.join(output_dir, ANALYSIS_STAMP))
+
+def read_analysis_stamp(output_dir, filename=None):
+    """
+    Read the stamps of the analyses written into output_dir.
+    :param filename: Return only the stamp of this video
+    :return: Dict of filename -> stamp (or a single stamp), None if there is none
+    """
+    try:
+        with open(os.path.join(output_dir, ANALYSIS_STAMP)) as f:
+            stamps = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return stamps if filename is None else stamps.get(filename)
+
+def process_and_analyze_video(video_path, output_dir, yolo_model_path=None, model_size=None, progress_callback=None,
+                              batch_size=DEFAULT_BATCH_SIZE, imgsz=DEFAULT_IMGSZ, cache=None, segment_callback=None,
+                              sample_every=SAMPLE_EVERY, raw_clips=RAW_CLIP_MODE != "none", store_keypoints=True,
+                              track_lifter=TRACK_LIFTER, render_workers=RENDER_WORKERS, output_height=ANNOTATED_HEIGHT,
+                              output_bitrate_kbps=ANNOTATED_BITRATE_KBPS):
     """
     Splits a video into multiple segments based on squat detection.
     :param video_path: Path to the input video
     :param output_dir: Directory to store segmented video clips
-    :param yolo_model_path: Path to the YOLO model
     :return: List of segmented video file paths
+    See analyze_video for the other parameters.
     """
-    # If the model path is not specified, dynamically get the default path
-    if yolo_model_path is None:
-        yolo_model_path = os.path.join(os.getcwd(), "models", "yolov8l-pose.pt")
-
-    # Check if the YOLO model path exists
-    if not os.path.exists(yolo_model_path):
-        raise FileNotFoundError(f"YOLO model not found at {yolo_model_path}")
-
-    # Load the YOLO model
-    model = YOLO(yolo_model_path)
+    result = analyze_video(video_path, output_dir, yolo_model_path, model_size, progress_callback, batch_size, imgsz, cache,
+                           segment_callback, sample_every, raw_clips, store_keypoints, track_lifter,
+                           render_workers, output_height, output_bitrate_kbps)
+    return result["segment_files"]
+
+def analyze_video(video_path, output_dir, yolo_model_path=None, model_size=None, progress_callback=None,
+                  batch_size=DEFAULT_BATCH_SIZE, imgsz=DEFAULT_IMGSZ, cache=None, segment_callback=None,
+                  sample_every=SAMPLE_EVERY, raw_clips=RAW_CLIP_MODE != "none", store_keypoints=True,
+                  track_lifter=TRACK_LIFTER, render_workers=RENDER_WORKERS, output_height=ANNOTATED_HEIGHT,
+                  output_bitrate_kbps=ANNOTATED_BITRATE_KBPS):
+    """
+    Split a video into squat segments and render an annotated video for each of them.
+    Pose inference runs once over the input video; the annotated segment videos are
+    rendered from the cached keypoints instead of re-running the model on every clip.
+    Each segment is rendered as soon as its end is detected, while later frames are still being analyzed.
+    Decoding, downscaling for inference, inference, segmentation, rendering and encoding run as a pipeline of threads;
+    only the annotated videos are rendered from full-resolution frames.
+    :param video_path: Path to the input video
+    :param output_dir: Directory to store segmented video clips
+    :param yolo_model_path: Path to the YOLO model
+    :param model_size: Pose model size (n/s/m/l), used when yolo_model_path is not given
+    :param progress_callback: Optional callable receiving (frames_processed, total_frames)
+    :param batch_size: Number of frames per pose inference call
+    :param imgsz: Pose inference resolution; larger frames are letterboxed to it before inference (see preprocess)
+    :param cache: Optional AnalysisCache; a video analyzed before with the same model and thresholds is restored from it
+    :param segment_callback: Optional callable receiving each finished segment (boundaries, metrics and file)
+    :param sample_every: Infer only every Kth frame while the lifter stands still (see AdaptiveSampler); 1 infers every frame
+    :param raw_clips: Also cut the unannotated squat_segment_N.mp4 clips out of the original video
+    :param store_keypoints: Keep the selected keypoints next to the video (see keypoint_store)
+    :param track_lifter: Follow the lifter across frames (see LifterTracker) instead of taking the largest person
+    :param render_workers: Render the annotated segments in this many processes at once (see ParallelSegmentRenderer);
+                           0 renders them in order inside the pipeline
+    :param output_height: Height of the video part of the annotated videos, 0 for the source height (see annotated_frame_size)
+    :param output_bitrate_kbps: Bitrate of the annotated videos in kbit/s, 0 for the encoder default
+    :return: Dict with segment_files, segments (boundaries and per-rep metrics), model_name, fps,
+             frame_count, duration_seconds, and for a fresh analysis stage_stats (per-stage timings),
+             sampling (frames inferred out of the total) and with track_lifter, tracking (frames inferred on a crop)
+    """
+    segmenter = SquatSegmenter()
+    tracker = LifterTracker() if track_lifter else None
+
+    model_name = pose_model_name(model_size, yolo_model_path)
+    params = analysis_params(imgsz, sample_every, raw_clips, segmenter, tracker.roi_crop if tracker is not None else None,
+                             output_height, output_bitrate_kbps)
+    if cache is not None:
+        key = cache_key(video_content_hash(video_path), model_name, params)
+        hit = cache.lookup(key, output_dir)
+        keypoints = None
+        if hit is not None and store_keypoints and not has_keypoints(video_path):
+            # The entry may have been evicted since the lookup, then the analysis is recomputed
+            keypoints = cache.load_keypoints(key)
+            if keypoints is None:
+                hit = None
+        if hit is not None:
+            print(f"Analysis cache hit for {video_path}")
+            if progress_callback is not None:
+                progress_callback(hit["frame_count"], hit["frame_count"])
+            if segment_callback is not None:
+                for segment in hit["segments"]:
+                    segment_callback(segment)
+            if keypoints is not None:
+                persons, valid = keypoints
+                save_keypoints(video_path, persons, valid, hit["fps"], model=model_name, imgsz=imgsz, sample_every=sample_every,
+                               track_lifter=track_lifter)
+            write_analysis_stamp(output_dir, video_path, model_name, params, hit)
+            return hit
+
+    # Reuse the process-wide model instead of loading weights on every call
+    model = get_pose_model(model_size, yolo_model_path)
 
     # Open the video
     cap = cv2.VideoCapture(video_path)
     fps = int(cap.get(cv2.CAP_PROP_FPS))
     width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
     height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-
-    # Variables to track squat status
-    initial_shoulder_pos = None
-    squat_start = False
-    segment_count = 0
-    current_video_writer = None
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
 
-    threshold_down = 20  # Threshold (in pixels) for detecting significant downward shoulder movement
-    threshold_up = 3  # Threshold for detecting the shoulder returning to the initial position
-    threshold_horizontal = 30  # Threshold for horizontal movement
+    os.makedirs(output_dir, exist_ok=True)
 
-    extra_frames = 15  # Number of additional frames to include after squat ends
-    extra_frame_counter = 0
+    # Decode, downscaling, inference, segmentation, chart rendering and encoding each run in their own thread
+    pipeline = Pipeline()
+    detector = SegmentDetector(segmenter, output_dir, raw_clips)
+    output_size = annotated_frame_size(width, height, output_height)
+    concurrency = render_concurrency(width, height, render_workers)
+    if concurrency:
+        renderer = ParallelSegmentRenderer(video_path, output_dir, fps, output_size, output_bitrate_kbps, render_workers,
+                                           concurrency)
+    else:
+        # An output frame is free again once the encoder queue and the encoder have moved past it
+        renderer = SegmentRenderer(video_path, output_dir, fps, output_size, output_buffers=pipeline.queue_size + 2)
+    encoder = SegmentEncoder(video_path, fps, output_bitrate_kbps)
+    # Crops around the lifter are cut from the full-resolution frames, so ROI tracking keeps them.
+    # A downscaled batch is free again once the inference queue and stage have moved past it
+    letterbox = None
+    if tracker is None or not tracker.roi_crop:
+        letterbox = input_letterbox(height, width, imgsz, batch_size, buffers=pipeline.queue_size + 2)
+    sampler = AdaptiveSampler(sample_every, threshold_down=segmenter.threshold_down, settle_frames=2 * segmenter.extra_frames,
+                              tracker=tracker, letterbox=letterbox)
+    segment_files_final = []
 
-    os.makedirs(output_dir, exist_ok=True)
-    segment_files = []
+    def on_segment_written(segment):
+        segment_files_final.append(segment["file"])
+        if segment_callback is not None:
+            segment_callback(segment)
+
+    def infer(batch, emit):
+        first_index, frames = batch
+        emit((first_index, *sampler.infer(model, frames, first_index, imgsz)))
+        if progress_callback is not None:
+            processed = first_index + len(frames)
+            progress_callback(processed, max(total_frames, processed))
+
+    def preprocess(batch, emit):
+        first_index, frames = batch
+        emit((first_index, letterbox(frames)))
+
+    pipeline.source("decode", lambda: enumerate_batches(batcher))
+    # Batches of full-resolution frames are large, so at most one waits in front of the stage reading them
+    if letterbox is not None:
+        pipeline.stage("preprocess", preprocess, queue_size=1)
+        pipeline.stage("infer", infer)
+    else:
+        pipeline.stage("infer", infer, queue_size=1)
+    pipeline.stage("segment", detector.process, detector.finish)
+    if concurrency:
+        # Whole segments are rendered and encoded by the pool; clips are still cut here
+        pipeline.stage("render", lambda commands, emit: renderer.process(commands, encoder, on_segment_written),
+                       lambda emit: renderer.finish())
+    else:
+        pipeline.stage("annotate", renderer.process)
+        pipeline.stage("encode", lambda commands, emit: encoder.process(commands, on_segment_written), encoder.finish)
+
+    # Decode buffers are reused in turn; only keypoints leave the inference stage (only downscaled copies
+    # the preprocess stage), so a buffer is free again once every batch that can be queued up to that
+    # stage has moved past it
+    first_reader = "preprocess" if letterbox is not None else "infer"
+    batcher = FrameBatcher(cap, batch_size, buffers=pipeline.max_items_in_flight(first_reader) + 1)
+    try:
+        stage_stats = pipeline.run()
+    finally:
+        cap.release()
+        renderer.release()
+        encoder.finish()
+
+    persons, valid = detector.keypoints()
+    if progress_callback is not None:
+        progress_callback(len(valid), len(valid))
+    if store_keypoints:
+        save_keypoints(video_path, persons, valid, fps, model=model_name, imgsz=imgsz, sample_every=sample_every,
+                       track_lifter=track_lifter)
+    print("Pipeline stages: " + ", ".join(
+        f"{stats['stage']} {stats['busy_seconds']:.2f}s busy / {stats['input_wait_seconds']:.2f}s starved / "
+        f"{stats['output_wait_seconds']:.2f}s blocked" for stats in stage_stats
+    ))
+
+    result = {
+        "segment_files": segment_files_final,
+        "segments": segmenter.segments,
+        "model_name": model_name,
+        "fps": fps,
+        "frame_count": len(valid),
+        "duration_seconds": len(valid) / fps if fps else None,
+    }
+
+    if cache is not None:
+        cache.store(key, detector.raw_segment_files + segment_files_final, result, persons, valid)
+    write_analysis_stamp(output_dir, video_path, model_name, params, result)
+
+    # Timings describe this run only, so they are not cached with the result
+    run_stats = {"stage_stats": stage_stats, "sampling": sampler.stats()}
+    if tracker is not None:
+        run_stats["tracking"] = tracker.stats()
+    return {**result, **run_stats}
+
+def enumerate_batches(batcher):
+    """Decoder source: (first_frame_index, frames) per batch"""
+    frame_index = 0
+    for frames in batcher:
+        yield frame_index, frames
+        frame_index += len(frames)
+
+class SegmentDetector:
+    """
+    Pipeline stage that runs the squat state machine on the lifter's keypoints.
+    Segments are kept as frame ranges; when one ends, a ("clip", ...) command for its raw clip and a
+    ("render", segment, persons, valid) command for its annotated video are emitted.
+    """
 
-    results = model(video_path, stream=True)  # Perform pose detection using YOLO
-    for result in results:
-        ret, frame = cap.read()
-        if not ret:
-            break
-
-        all_keypoints = result.keypoints.data
-        max_area = 0
-        largest_person = None
-
-        # Find the largest detected person
-        for keypoints in all_keypoints:
-            area = calculate_bounding_box_area(keypoints)
-            if area > max_area:
-                max_area = area
-                largest_person = keypoints
-
-        if largest_person is not None:
-            # Get coordinates of key body joints
-            side = None
-            left_shoulder = largest_person[5][:2].cpu().numpy()
-            left_hip = largest_person[11][:2].cpu().numpy()
-            left_knee = largest_person[13][:2].cpu().numpy()
-            left_ankle = largest_person[15][:2].cpu().numpy()
-
-            right_shoulder = largest_person[6][:2].cpu().numpy()
-            right_hip = largest_person[12][:2].cpu().numpy()
-            right_knee = largest_person[14][:2].cpu().numpy()
-            right_ankle = largest_person[16][:2].cpu().numpy()
-
-            side, shoulder, hip, knee, ankle = determine_side(
-                side, left_shoulder, left_hip, left_knee, left_ankle, 
-                right_shoulder, right_hip, right_knee, right_ankle
-            )
+    def __init__(self, segmenter, output_dir, raw_clips=True):
+        self.segmenter = segmenter
+        self.output_dir = output_dir
+        self.raw_clips = raw_clips
+        self.raw_segment_files = []
+        # Keypoints (17, 3) of the selected person per frame and whether anybody was detected, per batch
+        self.persons_batches = []
+        self.valid_batches = []
+
+    def keypoints(self):
+        """Selected keypoints and detection mask of every frame seen so far"""
+        persons = np.concatenate(self.persons_batches) if self.persons_batches else np.zeros((0, 17, 3), dtype=np.float32)
+        valid = np.concatenate(self.valid_batches) if self.valid_batches else np.zeros(0, dtype=bool)
+        return persons, valid
+
+    def segment_commands(self, segment, persons, valid):
+        commands = []
+        if self.raw_clips:
+            segment_file = os.path.join(self.output_dir, f"squat_segment_{segment['index']}.mp4")
+            self.raw_segment_files.append(segment_file)
+            commands.append(("clip", segment_file, segment["start_frame"], segment["end_frame"]))
+        commands.append(("render", segment, persons, valid))
+        return commands
+
+    def process(self, batch, emit):
+        first_index, batch_persons, batch_valid = batch
+
+        # Side choice for the whole batch at once
+        shoulders = side_joints(batch_persons, select_sides(batch_persons))[:, 0]
+        self.persons_batches.append(batch_persons)
+        self.valid_batches.append(batch_valid)
+
+        for offset in np.flatnonzero(batch_valid):
+            if self.segmenter.update(first_index + int(offset), shoulders[offset]) == "end":
+                # The keypoints of every frame up to the end of the segment are already known
+                emit(self.segment_commands(self.segmenter.segments[-1], *self.keypoints()))
+
+    def finish(self, emit):
+        # A segment still open at the end of the video is cut and rendered last
+        open_segment = self.segmenter.current_segment if self.segmenter.recording else None
+        persons, valid = self.keypoints()
+        self.segmenter.finish(len(valid))
+        if open_segment is not None:
+            emit(self.segment_commands(open_segment, persons, valid))
+
+class SegmentRenderer:
+    """
+    Pipeline stage that turns ("render", ...) commands into the annotated video of a segment,
+    read from the original input with the selected keypoints; other commands are passed through.
+    Segments must be rendered in order; the capture only moves forward, skipping the frames between them.
+    Output frames are written into output_buffers preallocated frames in turn (see annotated_frames).
+    """
 
-            if initial_shoulder_pos is None:
-                # Initialize the shoulder position
-                initial_shoulder_pos = shoulder
+    def __init__(self, video_path, output_dir, fps, output_size, output_buffers=1):
+        self.cap = cv2.VideoCapture(video_path)
+        self.position = 0
+        self.output_dir = output_dir
+        self.fps = fps
+        self.output_size = output_size
+        self.output_buffers = output_buffers
+        self.fourcc = cv2.VideoWriter_fourcc(*'H264')
+
+    def process(self, commands, emit):
+        passthrough = []
+        for command in commands:
+            if command[0] != "render":
+                passthrough.append(command)
                 continue
+            if passthrough:
+                emit(passthrough)
+                passthrough = []
+            self.render(command[1], command[2], command[3], emit)
+        if passthrough:
+            emit(passthrough)
+
+    def render(self, segment, persons, valid, emit):
+        """
+        Emit the encoder commands writing one annotated segment and add its metrics and file to the segment dict.
+        :param segment: Segment with start_frame and end_frame
+        :param persons: Selected keypoints of at least every frame up to the end of the segment
+        :param valid: Per-frame detection mask matching persons
+        """
+        output_file = os.path.join(self.output_dir, f"squat_segment_{segment['index']}_second.mp4")
+
+        # Skip ahead to the segment without decoding the frames in between
+        while self.position < segment["start_frame"] and self.cap.grab():
+            self.position += 1
+
+        # Only frames with a detected person are written, as in the detection pass
+        segment_range = slice(segment["start_frame"], segment["end_frame"])
+        segment_valid = valid[segment_range]
+        segment_persons = persons[segment_range][segment_valid]
+
+        # All per-frame metrics of the segment in one pass; the side is kept from the first frame
+        metrics = compute_kinematics(segment_persons, self.fps, side="first")
+        segment.update(segment_metrics(metrics, self.fps), file=output_file)
+
+        output_width, output_height = self.output_size
+        emit([("open", output_file, self.fourcc, (output_width + CHART_WIDTH, output_height))])  # Charts add 500px
+        frames = iter_segment_frames(self.cap, segment_valid)
+        for combined_frame in annotated_frames(frames, metrics, self.fps, self.output_size, self.output_buffers):
+            emit([("write", output_file, combined_frame)])
+        emit([("close", output_file, segment)])
+        self.position = segment["end_frame"]
+
+    def release(self):
+        self.cap.release()
+
+def render_segment(video_path, output_file, start_frame, segment_persons, segment_valid, fps, output_size, bitrate_kbps=0):
+    """
+    Write the annotated video of one segment; runs in a render worker, so it reads the source video on its own.
+    :param start_frame: First frame of the segment
+    :param segment_persons: Selected keypoints of every frame of the segment
+    :param segment_valid: Per-frame detection mask of the segment
+    :param output_size: Size of the video part of the output, see annotated_frame_size
+    :param bitrate_kbps: Bitrate of the output in kbit/s, 0 for the encoder default
+    :return: Per-rep metrics of the segment (see segment_metrics)
+    """
+    cap = cv2.VideoCapture(video_path)
+    cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+    metrics = compute_kinematics(segment_persons[segment_valid], fps, side="first")
+    output_width, output_height = output_size
+    out = open_video_writer(output_file, cv2.VideoWriter_fourcc(*'H264'), fps, (output_width + CHART_WIDTH, output_height),
+                            bitrate_kbps)
+    try:
+        # Writing is synchronous, so a single output frame is reused throughout
+        for combined_frame in annotated_frames(iter_segment_frames(cap, segment_valid), metrics, fps, output_size):
+            out.write(combined_frame)
+    finally:
+        out.release()
+        cap.release()
+    return segment_metrics(metrics, fps)
 
-            shoulder_vertical_movement = shoulder[1] - initial_shoulder_pos[1]
-            shoulder_horizontal_movement = abs(shoulder[0] - initial_shoulder_pos[0])
-
-            # Detect the start of a squat
-            if shoulder_vertical_movement > threshold_down and not squat_start and shoulder_horizontal_movement < threshold_horizontal:
-                squat_start = True
-                extra_frame_counter = 0
-                segment_count += 1
-                segment_file = os.path.join(output_dir, f'squat_segment_{segment_count}.mp4')
-                segment_files.append(segment_file)
-                current_video_writer = cv2.VideoWriter(segment_file, fourcc, fps, (width, height))
-                print(f"Starting squat segment {segment_count}")
-
-            # Detect the end of a squat
-            elif shoulder_vertical_movement < threshold_up and squat_start:
-                if extra_frame_counter == 0:
-                    print(f"Ending squat segment {segment_count}, but continuing for {extra_frames} more frames.")
-                extra_frame_counter += 1
-                if extra_frame_counter >= extra_frames:
-                    squat_start = False
-                    if current_video_writer is not None:
-                        current_video_writer.release()
-                        current_video_writer = None
-                    print(f"Completely ended squat segment {segment_count}")
-
-            # Write the frame to the current video segment
-            if squat_start or (extra_frame_counter > 0 and extra_frame_counter <= extra_frames):
-                if current_video_writer is not None:
-                    current_video_writer.write(frame)
-    
-    cap.release()
-    if current_video_writer:
-        current_video_writer.release()
+class ParallelSegmentRenderer:
+    """
+    Pipeline stage that renders the annotated videos of several segments at once in the render pool.
+    At most `concurrency` segments are in flight; finished segments are reported in rep order,
+    so a long rep holds back the reps after it but never the other way round.
+    """
 
-    segment_files_final = []
+    def __init__(self, video_path, output_dir, fps, output_size, bitrate_kbps, max_workers, concurrency):
+        self.video_path = video_path
+        self.output_dir = output_dir
+        self.fps = fps
+        self.output_size = output_size
+        self.bitrate_kbps = bitrate_kbps
+        self.max_workers = max_workers
+        self.slots = threading.Semaphore(concurrency)
+        self.pending = []
+        self.lock = threading.Lock()
+        self.on_segment_written = None
+
+    def process(self, commands, encoder, on_segment_written):
+        """
+        :param commands: Commands of the segment stage; ("render", ...) goes to the pool, the rest to the encoder
+        :param encoder: SegmentEncoder running the other commands (raw clips)
+        :param on_segment_written: Called with each segment once its file and the files of the reps before it are complete
+        """
+        self.on_segment_written = on_segment_written
+        for command in commands:
+            if command[0] != "render":
+                encoder.process([command], on_segment_written)
+                continue
+            _, segment, persons, valid = command
+            segment_range = slice(segment["start_frame"], segment["end_frame"])
+            output_file = os.path.join(self.output_dir, f"squat_segment_{segment['index']}_second.mp4")
+            self.slots.acquire()
+            # Only the segment's keypoints are sent to the worker
+            future = submit_render(
+                self.max_workers, render_segment, self.video_path, output_file, segment["start_frame"],
+                np.ascontiguousarray(persons[segment_range]), np.ascontiguousarray(valid[segment_range]),
+                self.fps, self.output_size, self.bitrate_kbps,
+            )
+            with self.lock:
+                self.pending.append((segment, output_file, future))
+            future.add_done_callback(self._on_done)
+
+    def _on_done(self, future):
+        self.slots.release()
+        self._deliver()
+
+    def _deliver(self):
+        # Report the finished segments at the head of the queue, in rep order
+        with self.lock:
+            while self.pending and self.pending[0][2].done() and self.pending[0][2].exception() is None:
+                segment, output_file, future = self.pending.pop(0)
+                segment.update(future.result(), file=output_file)
+                self.on_segment_written(segment)
+
+    def finish(self):
+        """Wait for every segment; the first failed render is re-raised"""
+        for _, _, future in list(self.pending):
+            future.result()
+        self._deliver()
+
+    def release(self):
+        for _, _, future in self.pending:
+            future.cancel()
+
+class SegmentEncoder:
+    """
+    Pipeline stage that owns every VideoWriter and executes clip/open/write/close commands in order.
+    Annotated videos are written at bitrate_kbps when it is set (see open_video_writer).
+    """
 
-    for i, file_name in enumerate(segment_files):
-        output_file = os.path.join(output_dir, f'squat_segment_{i+1}_second.mp4')
-        segment_files_final.append(output_file)
-
-        # Open squat video
-        cap = cv2.VideoCapture(file_name)
-        fps = int(cap.get(cv2.CAP_PROP_FPS))
-        frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-        frame_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-        video_length_seconds = total_frames / fps
-        fourcc = cv2.VideoWriter_fourcc(*'H264')
-        output_width = frame_width + 500  # Increase width by 500px for charts
-        out = cv2.VideoWriter(output_file, fourcc, fps, (output_width, frame_height))
-
-        time_values = []
-        speed_values = []
-        knee_angles = [] 
-        hip_angles = []  
-        frame_number = 0
-        previous_position = None
-        side = None
-
-        results = model(file_name)
-
-        for result in results:
-            ret, frame = cap.read()
-            if not ret:
-                break
-
-            all_keypoints = result.keypoints.data  # All keypoints
-
-            max_area = 0
-            largest_person = None
-
-            for keypoints in all_keypoints:
-                area = calculate_bounding_box_area(keypoints)
-                if area > max_area:
-                    max_area = area
-                    largest_person = keypoints
-
-            if largest_person is not None:
-                left_shoulder = largest_person[5][:2].cpu().numpy()
-                left_hip = largest_person[11][:2].cpu().numpy()
-                left_knee = largest_person[13][:2].cpu().numpy()
-                left_ankle = largest_person[15][:2].cpu().numpy()
-
-                right_shoulder = largest_person[6][:2].cpu().numpy()
-                right_hip = largest_person[12][:2].cpu().numpy()
-                right_knee = largest_person[14][:2].cpu().numpy()
-                right_ankle = largest_person[16][:2].cpu().numpy()
-
-                side, shoulder, hip, knee, ankle = determine_side(
-                    side, left_shoulder, left_hip, left_knee, left_ankle, 
-                    right_shoulder, right_hip, right_knee, right_ankle
-                )
-
-                knee_angle = calculate_angle(hip, knee, ankle)
-                knee_angles.append(knee_angle)
-
-                hip_angle = calculate_angle(shoulder, hip, knee)
-                hip_angles.append(hip_angle)
-
-                plot_image = plot_dynamic_chart(time_values, speed_values, knee_angles, hip_angles, video_length_seconds)
-                plot_image_resized = cv2.resize(plot_image, (500, frame_height))
-
-                combined_frame = np.hstack((frame, plot_image_resized))
-                out.write(combined_frame)
-
-            frame_number += 1
+    def __init__(self, video_path, fps, bitrate_kbps=0):
+        self.video_path = video_path
+        self.fps = fps
+        self.bitrate_kbps = bitrate_kbps
+        self.writers = {}
+
+    def process(self, commands, on_segment_written):
+        """
+        :param commands: List of ("open", path, fourcc, size), ("write", path, frame), ("close", path, segment)
+                         or ("clip", path, start_frame, end_frame)
+        :param on_segment_written: Called with the segment of a close command once its file is complete
+        """
+        for command in commands:
+            if command[0] == "write":
+                self.writers[command[1]].write(command[2])
+            elif command[0] == "open":
+                _, path, fourcc, size = command
+                self.writers[path] = open_video_writer(path, fourcc, self.fps, size, self.bitrate_kbps)
+            elif command[0] == "clip":
+                _, path, start_frame, end_frame = command
+                extract_clip(self.video_path, path, start_frame, end_frame, self.fps)
+            elif command[0] == "close":
+                _, path, segment = command
+                writer = self.writers.pop(path, None)
+                if writer is not None:
+                    writer.release()
+                if segment is not None:
+                    on_segment_written(segment)
+
+    def finish(self, emit=None):
+        for writer in self.writers.values():
+            writer.release()
+        self.writers.clear()
+
+def iter_segment_frames(cap, segment_valid):
+    """
+    Read the frames of a segment from an already positioned capture.
+    :param cap: VideoCapture positioned at the first frame of the segment
+    :param segment_valid: Per-frame mask of the segment, True where a person was detected
+    :return: Generator of the frames with a detected person
+    """
+    for is_valid in segment_valid:
+        ret, frame = cap.read()
+        if not ret:
+            return
+        if is_valid:
+            yield frame
 
-        cap.release()
-        out.release()
-      
-    return segment_files_final
+def annotated_frames(frames, metrics, fps, output_size, buffers=1):
+    """
+    Put the shoulder speed, knee angle and hip angle charts next to each frame of a segment.
+    :param frames: Iterable of the segment frames
+    :param metrics: Output of compute_kinematics for the segment
+    :param fps: Frame rate of the source video
+    :param output_size: (width, height) of the video part of the output; frames of another size are scaled to it
+    :param buffers: Number of preallocated output frames written in turn, so a frame stays valid until
+                    `buffers` more have been requested; with one, callers must be done with a frame before the next
+    :return: Generator of the combined frames
+    """
+    video_length_seconds = len(metrics["knee_angle"]) / fps
+    width, height = output_size
+
+    # Axes are drawn once per segment; each frame only adds its data points
+    chart = ChartOverlay(video_length_seconds, height)
+    outputs = np.empty((buffers, height, width + CHART_WIDTH, 3), dtype=np.uint8)
+
+    for frame_number, frame in enumerate(frames):
+        plot_image = chart.append(
+            frame_number / fps,
+            metrics["shoulder_velocity"][frame_number],
+            metrics["knee_angle"][frame_number],
+            metrics["hip_angle"][frame_number],
+        )
+
+        output = outputs[frame_number % buffers]
+        if frame.shape[:2] == (height, width):
+            output[:, :width] = frame
+        else:
+            cv2.resize(frame, output_size, dst=output[:, :width], interpolation=cv2.INTER_AREA)
+        output[:, width:] = plot_image
+        yield output
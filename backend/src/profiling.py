@@ -0,0 +1,76 @@
+import collections
+import os
+import sys
+import threading
+
+# Where profiles of analysis runs are written
+PROFILE_DIR = os.environ.get("ANALYSIS_PROFILE_DIR", os.path.join(os.getcwd(), "profiles"))
+
+# Seconds between two stack samples
+SAMPLE_INTERVAL_SECONDS = 0.005
+
+
+class StackSampler:
+    """
+    Sampling profiler for every thread of the process, so the pipeline stages are profiled together.
+    Stacks are written in the collapsed format of `py-spy record --format raw`
+    ("thread;outer (file:line);...;inner (file:line) count" per line), which flamegraph.pl and speedscope read.
+    Use as a context manager around the code to profile.
+    """
+
+    def __init__(self, interval=SAMPLE_INTERVAL_SECONDS):
+        self.interval = interval
+        self.counts = collections.Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        own = threading.get_ident()
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(f"{frame.f_code.co_name} ({frame.f_code.co_filename}:{frame.f_lineno})")
+                frame = frame.f_back
+            stack.append(names.get(ident, f"thread-{ident}"))
+            self.counts[";".join(reversed(stack))] += 1
+        self.samples += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+    def save(self, path):
+        """
+        Write the collapsed stacks, most frequent first.
+        :return: path
+        """
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as f:
+            for stack, count in self.counts.most_common():
+                f.write(f"{stack} {count}\n")
+        return path
+
+
+def profile_path(job_id):
+    return os.path.join(PROFILE_DIR, f"{job_id}.folded")
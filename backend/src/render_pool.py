@@ -0,0 +1,72 @@
+import multiprocessing
+import multiprocessing.util
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from src.chart_renderer import CHART_WIDTH
+
+# Processes rendering annotated segments in parallel; 0 renders them one after another in the analysis process
+RENDER_WORKERS = int(os.environ.get("RENDER_WORKERS", "0"))
+# Memory budget of the render workers of one analysis in MB; 0 leaves only RENDER_WORKERS as the limit
+RENDER_MEMORY_MB = int(os.environ.get("RENDER_MEMORY_MB", "0"))
+
+# Rough resident size of a render worker: the interpreter with NumPy and OpenCV, plus a few frames at
+# output size (decoded frame, chart panel, combined frame and the encoder's reference frames)
+WORKER_BASE_MB = 120
+WORKER_FRAME_COPIES = 6
+
+_pool = None
+_pool_workers = 0
+_lock = threading.Lock()
+
+
+def render_concurrency(frame_width, frame_height, max_workers=RENDER_WORKERS, memory_mb=RENDER_MEMORY_MB):
+    """
+    Number of segments of a video rendered at once: the worker count, lowered to fit the memory budget.
+    :param frame_width: Width of the source frames
+    :param frame_height: Height of the source frames
+    :return: At least 1 when max_workers is positive, otherwise 0
+    """
+    if max_workers <= 0:
+        return 0
+    if memory_mb <= 0:
+        return max_workers
+    frame_mb = (frame_width + CHART_WIDTH) * frame_height * 3 / 2 ** 20
+    worker_mb = WORKER_BASE_MB + WORKER_FRAME_COPIES * frame_mb
+    return max(1, min(max_workers, int(memory_mb // worker_mb)))
+
+
+def _create_pool(max_workers):
+    # Spawned like the analysis workers; workers start on demand, so a capped concurrency also caps the processes
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+def _shutdown_pool():
+    with _lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True, cancel_futures=True)
+
+
+# An analysis worker joins its child processes on exit before the usual executor cleanup runs, so idle
+# render workers would keep it alive forever; stop them first, while the pool queues are still open
+multiprocessing.util.Finalize(None, _shutdown_pool, exitpriority=100)
+
+
+def submit_render(max_workers, fn, *args):
+    """
+    Run fn in the process-wide render pool, creating it on first use.
+    A pool broken by a killed worker (e.g. out of memory) is replaced rather than failing every later render.
+    :return: Future of the call
+    """
+    global _pool, _pool_workers
+    with _lock:
+        if _pool is None or _pool_workers < max_workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool, _pool_workers = _create_pool(max_workers), max_workers
+        try:
+            return _pool.submit(fn, *args)
+        except BrokenProcessPool:
+            _pool = _create_pool(_pool_workers)
+            return _pool.submit(fn, *args)
@@ -0,0 +1,117 @@
+import os
+import numpy as np
+from src.pose_inference import infer_keypoints, DEFAULT_IMGSZ
+from src.segmentation import THRESHOLD_DOWN, EXTRA_FRAMES
+from src.kinematics import select_largest_person, select_sides, side_joints
+
+# Infer every Kth frame while the lifter stands still; 1 runs inference on every frame
+SAMPLE_EVERY = int(os.environ.get("POSE_SAMPLE_EVERY", "1"))
+
+# A sampled shoulder this far towards the squat start threshold switches to full rate
+NEAR_FRACTION = 0.5
+
+
+def interpolate_keypoints(sample_offsets, sample_persons, count):
+    """
+    Linearly interpolate keypoints between sampled frames.
+    :param sample_offsets: Sorted frame offsets that were inferred, including 0 and count - 1
+    :param sample_persons: Keypoints of the sampled frames, shape (samples, 17, 3)
+    :param count: Number of frames to fill
+    :return: Keypoints of every frame, shape (count, 17, 3)
+    """
+    offsets = np.arange(count)
+    left = np.clip(np.searchsorted(sample_offsets, offsets, side="right") - 1, 0, len(sample_offsets) - 1)
+    right = np.minimum(left + 1, len(sample_offsets) - 1)
+    span = np.maximum(sample_offsets[right] - sample_offsets[left], 1)
+    weight = ((offsets - sample_offsets[left]) / span).astype(np.float32)[:, None, None]
+    return sample_persons[left] * (1 - weight) + sample_persons[right] * weight
+
+
+class AdaptiveSampler:
+    """
+    Chooses which frames of each batch go through pose inference.
+    While the lifter stands still only every Kth frame and the last frame of the batch are inferred,
+    and the keypoints of the frames in between are interpolated. A batch in which a sample moves
+    towards the squat start threshold, or loses the lifter, is inferred in full, and so are the next
+    settle_frames frames, so squat starts, ends and the rep charts come from real detections.
+    The lifter is the largest person of each frame, or the person followed by a LifterTracker when one is given.
+    With a letterbox the frames are the downscaled copies it made (see preprocess), and the keypoints are
+    mapped back to source coordinates before anything compares them with the pixel thresholds.
+    """
+
+    def __init__(self, sample_every=SAMPLE_EVERY, threshold_down=THRESHOLD_DOWN, settle_frames=2 * EXTRA_FRAMES,
+                 near_fraction=NEAR_FRACTION, tracker=None, letterbox=None):
+        self.sample_every = max(int(sample_every), 1)
+        self.tracker = tracker
+        self.letterbox = letterbox
+        self.near_threshold = threshold_down * near_fraction
+        self.settle_frames = settle_frames
+        self.initial_shoulder_y = None
+        self.dense_until = 0
+        self.inferred_frames = 0
+        self.total_frames = 0
+
+    def _infer(self, model, frames, imgsz):
+        self.inferred_frames += len(frames)
+        if self.tracker is not None:
+            persons, valid = self.tracker.infer(model, frames, imgsz)
+        else:
+            persons, valid = select_largest_person(infer_keypoints(model, frames, imgsz))
+        if self.letterbox is not None:
+            persons = self.letterbox.to_source(persons)
+        return persons, valid
+
+    def _stable(self, persons, valid):
+        # Same reference as the segmenter: the shoulder of the first frame with a detection
+        if not valid.all():
+            return False
+        shoulder_y = side_joints(persons, select_sides(persons))[:, 0, 1]
+        if self.initial_shoulder_y is None:
+            self.initial_shoulder_y = float(shoulder_y[0])
+        return bool(np.all(np.abs(shoulder_y - self.initial_shoulder_y) < self.near_threshold))
+
+    def infer(self, model, frames, first_index, imgsz=DEFAULT_IMGSZ):
+        """
+        Keypoints of the lifter for every frame of a batch.
+        :param model: YOLO pose model
+        :param frames: Array of BGR frames with shape (batch, height, width, 3)
+        :param first_index: Index of the first frame of the batch in the video
+        :param imgsz: Inference resolution
+        :return: persons of shape (batch, 17, 3) and the (batch,) detection mask, as select_largest_person
+        """
+        count = len(frames)
+        self.total_frames += count
+
+        if self.sample_every == 1 or first_index < self.dense_until:
+            persons, valid = self._infer(model, frames, imgsz)
+            if not self._stable(persons, valid):
+                self.dense_until = first_index + count + self.settle_frames
+            return persons, valid
+
+        # Samples always include the first and last frame, so gaps never cross a batch boundary
+        sampled = np.unique(np.r_[np.arange(0, count, self.sample_every), count - 1])
+        track = self.tracker.snapshot() if self.tracker is not None else None
+        sample_persons, sample_valid = self._infer(model, frames[sampled], imgsz)
+        if self._stable(sample_persons, sample_valid):
+            return interpolate_keypoints(sampled, sample_persons, count), np.ones(count, dtype=bool)
+
+        # Something is moving: infer the skipped frames too and stay at full rate for a while
+        self.dense_until = first_index + count + self.settle_frames
+        if self.tracker is not None:
+            # The tracker needs every frame in order, so it is rewound and the whole batch inferred again
+            self.tracker.restore(track)
+            return self._infer(model, frames, imgsz)
+        persons = np.zeros((count,) + sample_persons.shape[1:], dtype=sample_persons.dtype)
+        valid = np.zeros(count, dtype=bool)
+        persons[sampled], valid[sampled] = sample_persons, sample_valid
+        skipped = np.setdiff1d(np.arange(count), sampled)
+        if len(skipped):
+            persons[skipped], valid[skipped] = self._infer(model, frames[skipped], imgsz)
+        return persons, valid
+
+    def stats(self):
+        return {
+            "sample_every": self.sample_every,
+            "inferred_frames": self.inferred_frames,
+            "total_frames": self.total_frames,
+        }
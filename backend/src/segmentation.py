@@ -0,0 +1,90 @@
+THRESHOLD_DOWN = 20  # Threshold (in pixels) for detecting significant downward shoulder movement
+THRESHOLD_UP = 3  # Threshold for detecting the shoulder returning to the initial position
+THRESHOLD_HORIZONTAL = 30  # Threshold for horizontal movement
+EXTRA_FRAMES = 15  # Number of additional frames to include after squat ends
+
+
+class SquatSegmenter:
+    """
+    Shoulder-displacement state machine that turns per-frame shoulder positions into squat segments.
+    Segments are reported as frame index ranges [start_frame, end_frame) of the source video.
+    """
+
+    def __init__(self, threshold_down=THRESHOLD_DOWN, threshold_up=THRESHOLD_UP,
+                 threshold_horizontal=THRESHOLD_HORIZONTAL, extra_frames=EXTRA_FRAMES, verbose=True):
+        self.threshold_down = threshold_down
+        self.threshold_up = threshold_up
+        self.threshold_horizontal = threshold_horizontal
+        self.extra_frames = extra_frames
+        self.verbose = verbose
+
+        self.initial_shoulder_pos = None
+        self.squat_start = False
+        self.extra_frame_counter = 0
+        self.segments = []
+        self.current_segment = None
+
+    def params(self):
+        """Thresholds that determine the detected segments"""
+        return {
+            "threshold_down": self.threshold_down,
+            "threshold_up": self.threshold_up,
+            "threshold_horizontal": self.threshold_horizontal,
+            "extra_frames": self.extra_frames,
+        }
+
+    @property
+    def recording(self):
+        """Whether the most recently updated frame belongs to a squat segment"""
+        return self.squat_start
+
+    def update(self, frame_index, shoulder):
+        """
+        Feed the selected shoulder position of one frame into the state machine.
+        :param frame_index: Index of the frame in the source video
+        :param shoulder: (x, y) shoulder position in pixels
+        :return: "start" or "end" when a segment starts or completely ends on this frame, otherwise None
+        """
+        if self.initial_shoulder_pos is None:
+            # Initialize the shoulder position
+            self.initial_shoulder_pos = shoulder
+            return None
+
+        shoulder_vertical_movement = shoulder[1] - self.initial_shoulder_pos[1]
+        shoulder_horizontal_movement = abs(shoulder[0] - self.initial_shoulder_pos[0])
+
+        # Detect the start of a squat
+        if shoulder_vertical_movement > self.threshold_down and not self.squat_start and shoulder_horizontal_movement < self.threshold_horizontal:
+            self.squat_start = True
+            self.extra_frame_counter = 0
+            self.current_segment = {"index": len(self.segments) + 1, "start_frame": frame_index, "end_frame": None}
+            self.segments.append(self.current_segment)
+            if self.verbose:
+                print(f"Starting squat segment {self.current_segment['index']}")
+            return "start"
+
+        # Detect the end of a squat
+        if shoulder_vertical_movement < self.threshold_up and self.squat_start:
+            if self.extra_frame_counter == 0 and self.verbose:
+                print(f"Ending squat segment {self.current_segment['index']}, but continuing for {self.extra_frames} more frames.")
+            self.extra_frame_counter += 1
+            if self.extra_frame_counter >= self.extra_frames:
+                self.squat_start = False
+                # The frame that exhausts the extra frames is the last one written, so the exclusive end is one past it
+                self.current_segment["end_frame"] = frame_index + 1
+                if self.verbose:
+                    print(f"Completely ended squat segment {self.current_segment['index']}")
+                return "end"
+
+        return None
+
+    def finish(self, frame_count):
+        """
+        Close a segment that is still open when the video ends.
+        :param frame_count: Number of frames read from the video
+        :return: List of all segments
+        """
+        if self.squat_start:
+            self.squat_start = False
+            self.current_segment["end_frame"] = frame_count
+        return self.segments
@@ -0,0 +1,171 @@
+import math
+import os
+import numpy as np
+from src.pose_inference import infer_keypoints, DEFAULT_IMGSZ
+
+# Follow the lifter from frame to frame instead of picking the largest person in every frame
+TRACK_LIFTER = os.environ.get("POSE_TRACK_LIFTER", "0") == "1"
+# While tracking, run inference only on a crop around the lifter
+ROI_CROP = os.environ.get("POSE_ROI_CROP", "0") == "1"
+
+MIN_IOU = 0.3  # Box overlap with the previous frame that keeps a detection on the track
+MAX_KEYPOINT_DISTANCE = 0.25  # Mean joint displacement, as a fraction of the box diagonal, that also keeps it
+MAX_MISSED_FRAMES = 30  # Frames without a match after which the largest person is picked again
+
+ROI_MARGIN = 0.35  # Context around the lifter's box, as a fraction of its longer side
+ROI_MAX_FRACTION = 0.6  # Crops covering more of the frame than this are not worth it
+MODEL_STRIDE = 32
+
+
+def keypoint_boxes(keypoints):
+    """
+    Keypoint bounding boxes.
+    :param keypoints: Array of shape (..., 17, 2+)
+    :return: Array of shape (..., 4) as (x0, y0, x1, y1)
+    """
+    xy = keypoints[..., :2]
+    return np.concatenate((xy.min(axis=-2), xy.max(axis=-2)), axis=-1)
+
+
+def box_iou(box, boxes):
+    """Intersection over union of one box with each of boxes (shape (n, 4))"""
+    width = np.clip(np.minimum(box[2], boxes[:, 2]) - np.maximum(box[0], boxes[:, 0]), 0, None)
+    height = np.clip(np.minimum(box[3], boxes[:, 3]) - np.maximum(box[1], boxes[:, 1]), 0, None)
+    intersection = width * height
+    union = (box[2] - box[0]) * (box[3] - box[1]) + (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1]) - intersection
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(union > 0, intersection / union, 0.0)
+
+
+class LifterTracker:
+    """
+    Keeps the same person selected across frames.
+    The first detection picks the largest person, as select_largest_person does; every later frame takes the
+    detection that overlaps the previous box (IoU) or whose joints moved least, and reports the frame as
+    missing rather than switching to somebody else when nobody matches. After max_missed frames without a
+    match the largest person is picked again.
+    With roi_crop, batches are inferred on a crop around the last known box at a matching inference size,
+    falling back to the full frame from the first frame in which the lifter is not found in the crop.
+    Frames must be passed in order.
+    """
+
+    def __init__(self, min_iou=MIN_IOU, max_keypoint_distance=MAX_KEYPOINT_DISTANCE, max_missed=MAX_MISSED_FRAMES,
+                 roi_crop=ROI_CROP):
+        self.min_iou = min_iou
+        self.max_keypoint_distance = max_keypoint_distance
+        self.max_missed = max_missed
+        self.roi_crop = roi_crop
+        self.box = None
+        self.keypoints = None
+        self.missed = 0
+        self.roi_frames = 0
+        self.full_frames = 0
+        self.reacquired = 0
+
+    def _associate(self, candidates):
+        # Index of the detection continuing the track, or None
+        boxes = keypoint_boxes(candidates)
+        areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+        # Zero-area rows are padding from infer_keypoints
+        present = areas > 0
+        if not present.any():
+            return None, boxes
+        if self.box is None:
+            return int(np.argmax(np.where(present, areas, -1))), boxes
+
+        iou = box_iou(self.box, boxes)
+        diagonal = max(math.hypot(self.box[2] - self.box[0], self.box[3] - self.box[1]), 1.0)
+        distance = np.linalg.norm(candidates[..., :2] - self.keypoints[:, :2], axis=-1).mean(axis=-1) / diagonal
+        accepted = present & ((iou >= self.min_iou) | (distance <= self.max_keypoint_distance))
+        if not accepted.any():
+            return None, boxes
+        return int(np.argmin(np.where(accepted, (1 - iou) + distance, np.inf))), boxes
+
+    def _commit(self, choice, candidates, boxes):
+        if choice is None:
+            self.missed += 1
+            if self.box is not None and self.missed > self.max_missed:
+                self.box = None
+                self.keypoints = None
+                self.reacquired += 1
+            return False
+        self.box = boxes[choice]
+        self.keypoints = candidates[choice]
+        self.missed = 0
+        return True
+
+    def select(self, keypoints):
+        """
+        Drop-in replacement for select_largest_person that follows the tracked person.
+        :param keypoints: Array of shape (frames, persons, 17, 3) of consecutive frames
+        :return: persons of shape (frames, 17, 3) and the (frames,) mask of frames where the lifter was found
+        """
+        persons = np.zeros((len(keypoints),) + keypoints.shape[2:], dtype=keypoints.dtype)
+        valid = np.zeros(len(keypoints), dtype=bool)
+        for i, candidates in enumerate(keypoints):
+            choice, boxes = self._associate(candidates)
+            valid[i] = self._commit(choice, candidates, boxes)
+            if valid[i]:
+                persons[i] = candidates[choice]
+        return persons, valid
+
+    def snapshot(self):
+        """State of the track, so restore() can rewind it before the same frames are passed again"""
+        return self.box, self.keypoints, self.missed, self.reacquired
+
+    def restore(self, snapshot):
+        self.box, self.keypoints, self.missed, self.reacquired = snapshot
+
+    def roi(self, frame_height, frame_width):
+        """
+        Crop (x0, y0, x1, y1) around the tracked lifter, or None to infer on the full frame.
+        """
+        if not self.roi_crop or self.box is None or self.missed:
+            return None
+        x0, y0, x1, y1 = self.box
+        margin = ROI_MARGIN * max(x1 - x0, y1 - y0)
+        crop = (
+            max(int(x0 - margin), 0), max(int(y0 - margin), 0),
+            min(math.ceil(x1 + margin), frame_width), min(math.ceil(y1 + margin), frame_height),
+        )
+        if (crop[2] - crop[0]) * (crop[3] - crop[1]) > ROI_MAX_FRACTION * frame_width * frame_height:
+            return None
+        return crop
+
+    def infer(self, model, frames, imgsz=DEFAULT_IMGSZ):
+        """
+        Pose inference on a batch followed by lifter selection.
+        :param model: YOLO pose model
+        :param frames: Array of consecutive BGR frames with shape (batch, height, width, 3)
+        :param imgsz: Inference resolution of full frames; crops use at most the same
+        :return: persons of shape (batch, 17, 3) and the (batch,) mask, as select_largest_person
+        """
+        crop = self.roi(*frames.shape[1:3])
+        if crop is None:
+            self.full_frames += len(frames)
+            return self.select(infer_keypoints(model, frames, imgsz))
+
+        x0, y0, x1, y1 = crop
+        # A crop smaller than the inference size is not upscaled, so the model sees fewer pixels
+        crop_imgsz = min(imgsz, math.ceil(max(x1 - x0, y1 - y0) / MODEL_STRIDE) * MODEL_STRIDE)
+        keypoints = infer_keypoints(model, np.ascontiguousarray(frames[:, y0:y1, x0:x1]), crop_imgsz)
+        keypoints[..., 0] += x0
+        keypoints[..., 1] += y0
+
+        persons = np.zeros((len(frames),) + keypoints.shape[2:], dtype=keypoints.dtype)
+        valid = np.zeros(len(frames), dtype=bool)
+        for i, candidates in enumerate(keypoints):
+            choice, boxes = self._associate(candidates)
+            if choice is None:
+                # Lost in the crop: the rest of the batch is inferred on the full frames
+                self.roi_frames += i
+                self.full_frames += len(frames) - i
+                persons[i:], valid[i:] = self.select(infer_keypoints(model, frames[i:], imgsz))
+                return persons, valid
+            valid[i] = self._commit(choice, candidates, boxes)
+            persons[i] = candidates[choice]
+        self.roi_frames += len(frames)
+        return persons, valid
+
+    def stats(self):
+        return {"roi_frames": self.roi_frames, "full_frames": self.full_frames, "reacquired": self.reacquired}
@@ -0,0 +1,338 @@
+import fcntl
+import hashlib
+import json
+import os
+import time
+import uuid
+from datetime import datetime
+from fastapi.concurrency import run_in_threadpool
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # Bytes read and written per step
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", str(2 * 1024 ** 3)))
+
+# Unfinished uploads; outside the uploads directory, which is served as static files, but on the same
+# filesystem so completed uploads are moved into place rather than copied
+UPLOAD_INCOMING_DIR = os.environ.get("UPLOAD_INCOMING_DIR", os.path.join(os.getcwd(), "incoming"))
+
+# Metadata written next to every completed upload
+UPLOAD_MANIFEST = "upload.json"
+
+
+class UploadTooLargeError(Exception):
+    """Raised when an upload exceeds MAX_UPLOAD_BYTES"""
+
+
+class UploadBusyError(Exception):
+    """Raised when another request is already writing to or completing the same resumable upload"""
+
+
+class UploadOffsetError(Exception):
+    """Raised when a resumable chunk does not start where the previous one ended"""
+
+    def __init__(self, expected_offset):
+        super().__init__(f"Expected chunk at offset {expected_offset}")
+        self.expected_offset = expected_offset
+
+
+def safe_filename(filename):
+    # Keep only the final path component so uploads cannot escape the user directory
+    name = os.path.basename((filename or "").replace("\\", "/"))
+    if name in ("", ".", ".."):
+        raise ValueError("Invalid filename")
+    return name
+
+
+def new_upload_dir(upload_root, username):
+    """
+    Create the uploads/<user>/<timestamp>/ directory for a new upload.
+    :return: (timestamp, directory)
+    """
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    user_dir = os.path.join(upload_root, safe_filename(username), timestamp)
+    os.makedirs(user_dir, exist_ok=True)
+    return timestamp, user_dir
+
+
+def write_manifest(upload_dir, filename, size, sha256):
+    # Uploads started within the same second share a directory, so entries are keyed by filename
+    manifest = read_manifest(upload_dir) or {}
+    manifest[filename] = {"size": size, "sha256": sha256, "uploaded_at": time.time()}
+    with open(os.path.join(upload_dir, UPLOAD_MANIFEST), "w") as f:
+        json.dump(manifest, f)
+
+
+def read_manifest(upload_dir, filename=None):
+    """
+    Read the metadata of completed uploads in a directory.
+    :param filename: Return only the entry of this file
+    :return: Dict of filename -> {size, sha256, uploaded_at} (or a single entry),
+             None for uploads made before manifests existed
+    """
+    try:
+        with open(os.path.join(upload_dir, UPLOAD_MANIFEST)) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return manifest if filename is None else manifest.get(filename)
+
+
+# Form fields other than the file are kept in memory, so they are capped
+MAX_FORM_FIELD_BYTES = 64 * 1024
+
+
+class FormUpload:
+    """
+    A multipart/form-data upload parsed as the body arrives, instead of being spooled by FastAPI first.
+    The file part goes straight to a temporary file under incoming_dir, hashed and size-checked on the way;
+    the other parts are small form fields kept in memory.
+    """
+
+    def __init__(self, content_type, incoming_dir, file_field="file", max_bytes=MAX_UPLOAD_BYTES):
+        """
+        :raises ValueError: If the request is not multipart/form-data
+        """
+        mime_type, options = parse_options_header(content_type)
+        if mime_type != b"multipart/form-data" or not options.get(b"boundary"):
+            raise ValueError("Expected a multipart/form-data body")
+        os.makedirs(incoming_dir, exist_ok=True)
+        self.temp_path = os.path.join(incoming_dir, f"{uuid.uuid4().hex}.part")
+        self.file_field = file_field
+        self.max_bytes = max_bytes
+        self.fields = {}
+        self.filename = None
+        self.size = 0
+        self._digest = hashlib.sha256()
+        self._headers = {}
+        self._header_field = self._header_value = b""
+        self._name = None
+        self._in_file = False
+        self._field_data = b""
+        # File bytes parsed from the current body chunk, written once the parser has consumed it
+        self._file_data = []
+        self._parser = MultipartParser(options[b"boundary"], {
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+        })
+
+    def _on_part_begin(self):
+        self._headers = {}
+        self._field_data = b""
+
+    def _on_header_field(self, data, start, end):
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data, start, end):
+        self._header_value += data[start:end]
+
+    def _on_header_end(self):
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = self._header_value = b""
+
+    def _on_headers_finished(self):
+        _, params = parse_options_header(self._headers.get(b"content-disposition"))
+        self._name = params.get(b"name", b"").decode("utf-8")
+        self._in_file = self._name == self.file_field and b"filename" in params
+        if self._in_file:
+            if self.filename is not None:
+                raise ValueError("Only one file can be uploaded at a time")
+            self.filename = params[b"filename"].decode("utf-8")
+
+    def _on_part_data(self, data, start, end):
+        if self._in_file:
+            self.size += end - start
+            if self.size > self.max_bytes:
+                raise UploadTooLargeError(f"Upload exceeds the {self.max_bytes} byte limit")
+            chunk = data[start:end]
+            self._digest.update(chunk)
+            self._file_data.append(chunk)
+        else:
+            self._field_data += data[start:end]
+            if len(self._field_data) > MAX_FORM_FIELD_BYTES:
+                raise ValueError(f"Form field '{self._name}' is too large")
+
+    def _on_part_end(self):
+        if not self._in_file:
+            self.fields[self._name] = self._field_data.decode("utf-8")
+
+    async def receive(self, chunks):
+        """
+        Parse the whole body.
+        :param chunks: Async iterable of bytes, e.g. request.stream()
+        :return: sha256 hex digest of the file; fields, filename and size are set on the upload
+        :raises UploadTooLargeError: If the file exceeds max_bytes; the partial file is removed
+        :raises ValueError: If the body is not valid multipart data
+        """
+        try:
+            with open(self.temp_path, "wb") as f:
+                async for chunk in chunks:
+                    self._parser.write(chunk)
+                    if self._file_data:
+                        await run_in_threadpool(f.write, b"".join(self._file_data))
+                        self._file_data = []
+                self._parser.finalize()
+        except BaseException:
+            self.discard()
+            raise
+        return self._digest.hexdigest()
+
+    def save(self, destination):
+        """Move the received file to its final path"""
+        os.replace(self.temp_path, destination)
+
+    def discard(self):
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+
+
+class ResumableUploadStore:
+    """
+    Partial uploads kept under <incoming_root>/<upload_id>/ until all bytes have arrived.
+    Chunks must be sent in order; a client that lost its connection asks for the received
+    offset and continues from there.
+    """
+
+    def __init__(self, upload_root, incoming_root=UPLOAD_INCOMING_DIR, max_bytes=MAX_UPLOAD_BYTES):
+        self.root = incoming_root
+        self.upload_root = upload_root
+        self.max_bytes = max_bytes
+        # Running hashes of uploads handled by this process, with the number of bytes they cover
+        self._digests = {}
+        os.makedirs(self.root, exist_ok=True)
+
+    def _dir(self, upload_id):
+        return os.path.join(self.root, safe_filename(upload_id))
+
+    def _read_meta(self, upload_id):
+        try:
+            with open(os.path.join(self._dir(upload_id), "meta.json")) as f:
+                return json.load(f)
+        except OSError:
+            raise KeyError(upload_id)
+
+    def create(self, username, filename, total_size):
+        """
+        Start a resumable upload.
+        :return: Upload id
+        :raises UploadTooLargeError: If the announced size exceeds the limit
+        """
+        if total_size <= 0:
+            raise ValueError("total_size must be positive")
+        if total_size > self.max_bytes:
+            raise UploadTooLargeError(f"Upload exceeds the {self.max_bytes} byte limit")
+
+        upload_id = uuid.uuid4().hex
+        os.makedirs(self._dir(upload_id))
+        meta = {"username": safe_filename(username), "filename": safe_filename(filename), "total_size": total_size, "created_at": time.time()}
+        with open(os.path.join(self._dir(upload_id), "meta.json"), "w") as f:
+            json.dump(meta, f)
+        open(os.path.join(self._dir(upload_id), "data.part"), "wb").close()
+        return upload_id
+
+    def status(self, upload_id):
+        meta = self._read_meta(upload_id)
+        meta["received"] = os.path.getsize(os.path.join(self._dir(upload_id), "data.part"))
+        return meta
+
+    def _open_part(self, upload_id, mode):
+        try:
+            return open(os.path.join(self._dir(upload_id), "data.part"), mode)
+        except FileNotFoundError:
+            # Completed (and moved away) by another request in the meantime
+            raise KeyError(upload_id)
+
+    @staticmethod
+    def _claim(part_file):
+        # Requests may be served by several workers, so the claim is a lock on the file itself; it is
+        # released when the file is closed, even if the process dies
+        try:
+            fcntl.flock(part_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise UploadBusyError("Another request is writing this upload")
+
+    def _digest_for(self, upload_id, part_path, received):
+        digest, hashed = self._digests.get(upload_id, (None, -1))
+        if hashed != received:
+            # Another process wrote earlier chunks, or this process restarted: rehash what is on disk
+            digest = hashlib.sha256()
+            with open(part_path, "rb") as f:
+                for block in iter(lambda: f.read(UPLOAD_CHUNK_SIZE), b""):
+                    digest.update(block)
+        return digest
+
+    async def append(self, upload_id, offset, chunks):
+        """
+        Append a chunk streamed from the request body.
+        :param offset: Byte offset the chunk starts at
+        :param chunks: Async iterable of bytes
+        :return: Number of bytes received so far
+        :raises UploadOffsetError: If offset does not match the bytes already received
+        :raises UploadTooLargeError: If the chunk goes past the announced size
+        :raises UploadBusyError: If another chunk of the upload is being written
+        """
+        meta = self._read_meta(upload_id)
+        part_path = os.path.join(self._dir(upload_id), "data.part")
+        with self._open_part(upload_id, "r+b") as f:
+            # The offset is checked only once the upload is claimed, so two requests for the same offset
+            # cannot both pass the check and interleave their writes
+            self._claim(f)
+            received = os.fstat(f.fileno()).st_size
+            if offset != received:
+                raise UploadOffsetError(received)
+
+            # Rehashing can read up to max_bytes from disk, so it runs in a worker thread
+            digest = await run_in_threadpool(self._digest_for, upload_id, part_path, offset)
+            try:
+                f.seek(offset)
+                async for chunk in chunks:
+                    received += len(chunk)
+                    if received > meta["total_size"]:
+                        raise UploadTooLargeError("Chunk goes past the announced upload size")
+                    digest.update(chunk)
+                    await run_in_threadpool(f.write, chunk)
+                f.flush()
+            except BaseException:
+                # Drop the incomplete chunk so the client can resend it from the same offset
+                f.truncate(offset)
+                self._digests.pop(upload_id, None)
+                raise
+            self._digests[upload_id] = (digest, received)
+        return received
+
+    def complete(self, upload_id):
+        """
+        Move a fully received upload into uploads/<user>/<timestamp>/.
+        Blocking (it may rehash the whole file); call it from a worker thread in async code.
+        :return: Dict with username, filename, timestamp, file_path, size and sha256
+        :raises UploadOffsetError: If bytes are still missing
+        :raises UploadBusyError: If a chunk is still being written, or the upload is already being completed
+        """
+        meta = self._read_meta(upload_id)
+        part_path = os.path.join(self._dir(upload_id), "data.part")
+        with self._open_part(upload_id, "rb") as f:
+            self._claim(f)
+            received = os.fstat(f.fileno()).st_size
+            if received != meta["total_size"]:
+                raise UploadOffsetError(received)
+            digest = self._digest_for(upload_id, part_path, received)
+            timestamp, user_dir = new_upload_dir(self.upload_root, meta["username"])
+            file_path = os.path.join(user_dir, meta["filename"])
+            os.replace(part_path, file_path)
+        write_manifest(user_dir, meta["filename"], meta["total_size"], digest.hexdigest())
+
+        os.remove(os.path.join(self._dir(upload_id), "meta.json"))
+        os.rmdir(self._dir(upload_id))
+        self._digests.pop(upload_id, None)
+        return {
+            "username": meta["username"],
+            "filename": meta["filename"],
+            "timestamp": timestamp,
+            "file_path": file_path,
+            "size": meta["total_size"],
+            "sha256": digest.hexdigest(),
+        }
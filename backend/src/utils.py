@@ -1,8 +1,6 @@
 import math
 import numpy as np
 import matplotlib.pyplot as plt
-import numpy as np
-import matplotlib.pyplot as plt
 import cv2
 from io import BytesIO
 from PIL import Image
@@ -10,13 +8,6 @@ from PIL import Image
 def calculate_distance(point1, point2):
     return math.sqrt((point2[0] - point1[0]) ** 2 + (point2[1] - point1[1]) ** 2)
 
-def calculate_angle(a, b, c):
-    ba = a - b
-    bc = c - b
-    cos_angle = (ba @ bc) / (math.sqrt(ba @ ba) * math.sqrt(bc @ bc))
-    angle = math.degrees(math.acos(cos_angle))
-    return angle
-
 def calculate_bounding_box_area(keypoints):
     x_coords = [p[0] for p in keypoints]
     y_coords = [p[1] for p in keypoints]
@@ -24,6 +15,33 @@ def calculate_bounding_box_area(keypoints):
     height = max(y_coords) - min(y_coords)
     return width * height
 
+def select_largest_person(all_keypoints):
+    """
+    Pick the detected person with the largest keypoint bounding box.
+    :param all_keypoints: Keypoints of every detected person in a frame
+    :return: Keypoints of the largest person, or None if nobody was detected
+    """
+    max_area = 0
+    largest_person = None
+    for keypoints in all_keypoints:
+        area = calculate_bounding_box_area(keypoints)
+        if area > max_area:
+            max_area = area
+            largest_person = keypoints
+    return largest_person
+
+def select_joints(side, person):
+    """
+    Choose the shoulder, hip, knee and ankle of one body side from a person's keypoints.
+    :param side: 'left', 'right', or None to pick the side facing the camera
+    :param person: Keypoint array of shape (17, 2+) on the host
+    :return: side, shoulder, hip, knee, ankle
+    """
+    return determine_side(
+        side, person[5][:2], person[11][:2], person[13][:2], person[15][:2],
+        person[6][:2], person[12][:2], person[14][:2], person[16][:2]
+    )
+
 def determine_side(side,left_shoulder,left_hip,left_knee,left_ankle, right_shoulder,right_hip,right_knee,right_ankle):
     left_shoulder_x = left_shoulder[0]
     left_hip_x = left_hip[0]
@@ -0,0 +1,100 @@
+"""
+src.kinematics must give the same results as the per-frame helpers in src/utils.py it replaced.
+"""
+import numpy as np
+import pytest
+from src import utils
+from src.kinematics import select_largest_person, select_sides, side_joints, joint_angles, compute_kinematics
+
+
+def random_keypoints(frames, persons, seed):
+    rng = np.random.default_rng(seed)
+    keypoints = rng.uniform(0, 1080, (frames, persons, 17, 3))
+    # Frames without detections and zero-padded persons, as produced by batched inference
+    keypoints[rng.random(frames) < 0.1] = 0
+    keypoints[:, persons - 1][rng.random(frames) < 0.5] = 0
+    return keypoints
+
+
+def reference_person(frame):
+    person = utils.select_largest_person(frame)
+    return None if person is None else np.asarray(person)
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("persons", [1, 3])
+def test_select_largest_person_matches_utils(seed, persons):
+    keypoints = random_keypoints(200, persons, seed)
+    selected, valid = select_largest_person(keypoints)
+    for frame, person, found in zip(keypoints, selected, valid):
+        expected = reference_person(frame)
+        assert found == (expected is not None)
+        if found:
+            np.testing.assert_array_equal(person, expected)
+
+
+def test_select_largest_person_without_detections():
+    selected, valid = select_largest_person(np.zeros((4, 0, 17, 3)))
+    assert selected.shape == (4, 17, 3)
+    assert not valid.any()
+
+    selected, valid = select_largest_person(np.zeros((4, 2, 17, 3)))
+    assert not valid.any()
+    assert all(utils.select_largest_person(frame) is None for frame in np.zeros((4, 2, 17, 3)))
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_side_joints_match_select_joints(seed):
+    persons, valid = select_largest_person(random_keypoints(200, 2, seed))
+    persons = persons[valid]
+    is_left = select_sides(persons)
+    joints = side_joints(persons, is_left)
+    for person, left, person_joints in zip(persons, is_left, joints):
+        side, shoulder, hip, knee, ankle = utils.select_joints(None, person)
+        assert side == ("left" if left else "right")
+        np.testing.assert_array_equal(person_joints, [shoulder, hip, knee, ankle])
+
+
+@pytest.mark.parametrize("side", ["left", "right"])
+def test_forced_side_matches_select_joints(side):
+    persons, valid = select_largest_person(random_keypoints(50, 1, 0))
+    joints = side_joints(persons, select_sides(persons, side))
+    for person, person_joints in zip(persons, joints):
+        _, shoulder, hip, knee, ankle = utils.select_joints(side, person)
+        np.testing.assert_array_equal(person_joints, [shoulder, hip, knee, ankle])
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_angles_match_calculate_angle(seed):
+    persons, valid = select_largest_person(random_keypoints(200, 2, seed))
+    persons = persons[valid]
+    metrics = compute_kinematics(persons, fps=30)
+    for i, person in enumerate(persons):
+        _, shoulder, hip, knee, ankle = utils.select_joints(None, person)
+        assert metrics["knee_angle"][i] == pytest.approx(utils.calculate_angle(hip, knee, ankle), abs=1e-6)
+        assert metrics["hip_angle"][i] == pytest.approx(utils.calculate_angle(shoulder, hip, knee), abs=1e-6)
+
+
+def test_zero_length_vectors_give_nan_like_calculate_angle():
+    a = np.array([[0.0, 0.0], [3.0, 4.0], [1.0, 1.0]])
+    b = np.array([[0.0, 0.0], [0.0, 0.0], [1.0, 1.0]])
+    c = np.array([[5.0, 5.0], [0.0, 0.0], [1.0, 1.0]])
+    angles = joint_angles(a, b, c)
+    assert np.isnan(angles).all()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        assert all(np.isnan(utils.calculate_angle(*points)) for points in zip(a, b, c))
+
+
+def test_straight_and_right_angles():
+    b = np.zeros((2, 2))
+    angles = joint_angles(np.array([[1.0, 0.0], [1.0, 0.0]]), b, np.array([[-2.0, 0.0], [0.0, 3.0]]))
+    np.testing.assert_allclose(angles, [180.0, 90.0])
+
+
+def test_shoulder_velocity_is_rise_speed():
+    persons, valid = select_largest_person(random_keypoints(100, 1, 3))
+    persons = persons[valid]
+    metrics = compute_kinematics(persons, fps=25)
+    shoulders = [utils.select_joints(None, person)[1] for person in persons]
+    expected = [0.0] + [(previous[1] - current[1]) * 25 for previous, current in zip(shoulders, shoulders[1:])]
+    np.testing.assert_allclose(metrics["shoulder_velocity"], expected)